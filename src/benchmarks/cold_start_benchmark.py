@@ -0,0 +1,87 @@
+"""
+Cold-start vs warm cost of both handlers on the local SQLite backend.
+
+Every run starts a fresh interpreter (a cold start) in the function directory and
+reports:
+- import: time to import the handler module (the modules of a mode load with its first call),
+- first:  the first handler.main(None, None) (creates the engine and the tables),
+- warm:   the best of --warm further calls in the same process (cached engine,
+          compiled-statement cache, imported modules).
+
+    python src/benchmarks/cold_start_benchmark.py --runs 3 --warm 3
+"""
+import os
+import sys
+import json
+import tempfile
+import argparse
+import subprocess
+
+SRC_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+FUNCTIONS = ("functions", "function2")
+
+# Runs inside the fresh interpreter; prints one JSON line of timings on stderr,
+# since the handlers print their results on stdout
+PROBE = """
+import os, sys, time, json, contextlib
+started = time.perf_counter()
+import handler
+imported = time.perf_counter()
+with contextlib.redirect_stdout(open(os.devnull, "w")):
+    handler.main(None, None)
+    first = time.perf_counter()
+    warm = []
+    for _ in range({warm}):
+        call_started = time.perf_counter()
+        handler.main(None, None)
+        warm.append(time.perf_counter() - call_started)
+sys.stderr.write(json.dumps({{
+    "import": imported - started, "first": first - imported, "warm": min(warm) if warm else None
+}}) + "\\n")
+"""
+
+
+def run_once(function: str, warm: int, workdir: str) -> dict:
+    env = dict(
+        os.environ,
+        DB_BACKEND="sqlite",
+        SQLITE_PATH=os.path.join(workdir, "bench.sqlite"),
+        HANA_SCHEMA="BENCH",
+        CHECKPOINT_PATH=os.path.join(workdir, "checkpoint.json"),
+        DEAD_LETTER_PATH=os.path.join(workdir, "dead_letters.ndjson"),
+    )
+    completed = subprocess.run(
+        [sys.executable, "-c", PROBE.format(warm=warm)],
+        cwd=os.path.join(SRC_DIR, function),
+        env=env,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.PIPE,
+        text=True,
+        check=True,
+    )
+    return json.loads(completed.stderr.strip().splitlines()[-1])
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--warm", type=int, default=3)
+    args = parser.parse_args()
+
+    print(f"Best of {args.runs} fresh interpreters, {args.warm} warm call(s) each")
+    print(f"{'function':<12}{'import ms':>11}{'first ms':>11}{'warm ms':>10}")
+    for function in FUNCTIONS:
+        timings = []
+        for _ in range(args.runs):
+            with tempfile.TemporaryDirectory() as workdir:
+                timings.append(run_once(function, args.warm, workdir))
+        best = {key: min(t[key] for t in timings) for key in ("import", "first")}
+        warm = [t["warm"] for t in timings if t["warm"] is not None]
+        print(
+            f"{function:<12}{best['import'] * 1000:>11.1f}{best['first'] * 1000:>11.1f}"
+            + (f"{min(warm) * 1000:>10.1f}" if warm else f"{'-':>10}")
+        )
+
+
+if __name__ == "__main__":
+    main()
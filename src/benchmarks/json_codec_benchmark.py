@@ -0,0 +1,72 @@
+"""
+Parse / serialize cost per MB of every installed json_codec backend.
+
+The input files of both functions (data.json, company_data.json, contact_data.json)
+are repeated into one JSON array of about --size-mb MB, parsed --repeat times per
+backend; the best run is reported. The parsed records are then serialized back as
+a failure report ({"failed": [...]}).
+
+    python src/benchmarks/json_codec_benchmark.py --size-mb 20 --repeat 5
+"""
+import os
+import sys
+import time
+import argparse
+
+SRC_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(SRC_DIR, "function2"))
+
+import json_codec  # noqa: E402
+
+INPUT_FILES = (
+    os.path.join(SRC_DIR, "functions", "data.json"),
+    os.path.join(SRC_DIR, "function2", "company_data.json"),
+    os.path.join(SRC_DIR, "function2", "contact_data.json"),
+)
+
+
+def build_document(size_mb: float) -> bytes:
+    """One JSON array of about size_mb MB built from the sample records."""
+    loads, dumps = json_codec.BACKENDS["json"]
+    records = []
+    for path in INPUT_FILES:
+        with open(path, "rb") as f:
+            records.extend(loads(f.read()))
+    sample = dumps(records).encode("utf-8")
+    copies = max(1, int(size_mb * 1024 * 1024 / len(sample)))
+    return dumps(records * copies).encode("utf-8")
+
+
+def best_of(repeat: int, func, *args) -> float:
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        func(*args)
+        timings.append(time.perf_counter() - started)
+    return min(timings)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--size-mb", type=float, default=10.0)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    document = build_document(args.size_mb)
+    size_mb = len(document) / (1024 * 1024)
+    print(f"Document: {size_mb:.1f} MB, best of {args.repeat} runs (selected backend: {json_codec.BACKEND})")
+    print(f"{'backend':<10}{'parse ms/MB':>14}{'parse MB/s':>12}{'dump ms/MB':>13}{'dump MB/s':>11}")
+
+    for name, (loads, dumps) in json_codec.BACKENDS.items():
+        parse_seconds = best_of(args.repeat, loads, document)
+        report = {"failed": loads(document)}
+        dump_seconds = best_of(args.repeat, dumps, report)
+        print(
+            f"{name:<10}"
+            f"{parse_seconds * 1000 / size_mb:>14.1f}{size_mb / parse_seconds:>12.0f}"
+            f"{dump_seconds * 1000 / size_mb:>13.1f}{size_mb / dump_seconds:>11.0f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
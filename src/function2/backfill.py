@@ -0,0 +1,77 @@
+import os
+import logging
+from typing import Dict
+from sqlalchemy import text
+from db_connection import get_hana_client
+
+logger = logging.getLogger(__name__)
+logging.basicConfig(level=logging.INFO)
+
+ACCOUNTS_TABLE = "SPUSER_STAGING_CRM_COMPANY_ACCOUNTS"
+CONTACTS_TABLE = "SPUSER_STAGING_CRM_COMPANY_CONTACTS"
+
+
+def backfill_erp_no(connection, schema: str) -> int:
+    """
+    Set erpNo of flagged CRM accounts from ERP_CUSTOMERS.customerId (crmBpNo = accountId)
+    where it is missing or differs, with one correlated UPDATE.
+    The target table is referenced by name (no alias), which HANA and SQLite both accept.
+    Returns the number of updated accounts.
+    """
+    result = connection.execute(text(f"""
+        UPDATE {schema}.{ACCOUNTS_TABLE}
+        SET erpNo = (
+            SELECT c.customerId FROM {schema}.SPUSER_STAGING_ERP_CUSTOMERS c
+            WHERE c.crmBpNo = {ACCOUNTS_TABLE}.accountId
+        )
+        WHERE crmToErpFlag = TRUE
+          AND EXISTS (
+            SELECT 1 FROM {schema}.SPUSER_STAGING_ERP_CUSTOMERS c
+            WHERE c.crmBpNo = {ACCOUNTS_TABLE}.accountId
+              AND ({ACCOUNTS_TABLE}.erpNo IS NULL OR {ACCOUNTS_TABLE}.erpNo <> c.customerId)
+          )
+    """))
+    return result.rowcount
+
+
+def backfill_erp_contact_person(connection, schema: str) -> int:
+    """
+    Set erpContactPerson of flagged CRM contacts from ERP_CUSTOMERS_CONTACTS.contactPersonId
+    (crmBpNo = accountId and same email) where it is missing or differs, with one
+    correlated UPDATE. Returns the number of updated contacts.
+    """
+    result = connection.execute(text(f"""
+        UPDATE {schema}.{CONTACTS_TABLE}
+        SET erpContactPerson = (
+            SELECT e.contactPersonId FROM {schema}.SPUSER_STAGING_ERP_CUSTOMERS_CONTACTS e
+            WHERE e.crmBpNo = {CONTACTS_TABLE}.accountId AND e.email = {CONTACTS_TABLE}.email
+        )
+        WHERE crmToErpFlag = TRUE
+          AND EXISTS (
+            SELECT 1 FROM {schema}.SPUSER_STAGING_ERP_CUSTOMERS_CONTACTS e
+            WHERE e.crmBpNo = {CONTACTS_TABLE}.accountId AND e.email = {CONTACTS_TABLE}.email
+              AND ({CONTACTS_TABLE}.erpContactPerson IS NULL
+                   OR {CONTACTS_TABLE}.erpContactPerson <> e.contactPersonId)
+          )
+    """))
+    return result.rowcount
+
+
+def backfill_erp_ids() -> Dict[str, int]:
+    """
+    Standalone back-fill of erpNo and erpContactPerson from the ERP tables
+    in one transaction. Returns the number of updated rows per column.
+    """
+    schema = os.getenv("HANA_SCHEMA")
+    if not schema:
+        raise ValueError("HANA_SCHEMA is not set.")
+
+    engine = get_hana_client()
+    with engine.begin() as connection:
+        counts = {
+            "erpNo": backfill_erp_no(connection, schema),
+            "erpContactPerson": backfill_erp_contact_person(connection, schema),
+        }
+    logger.info("Back-fill Summary: erpNo=%d, erpContactPerson=%d",
+                counts["erpNo"], counts["erpContactPerson"])
+    return counts
@@ -1,60 +1,196 @@
 import os
-import uuid
+import time
 import logging
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Mapping, Optional
 from sqlalchemy import text
+from backfill import backfill_erp_no
+from batching import AdaptiveBatchSizer
 from db_connection import get_hana_client
-from erp_customer_registration import register_company_as_customer
+from dead_letter import DeadLetterFile, FailureLog
+from deadline import Deadline, resume_offset, stop_early, take_invalid
+from erp_customer_registration import customer_record_log, register_company_as_customer
+from log_sampling import RecordLogger
+from record_types import CompanyAccount
+from retry import call_with_retry, is_transient_error
+from row_hash import compute_row_hash, fetch_row_hashes
+from key_generation import make_key
+from staging_load import StagingSpec, StagingTable, dedupe_by_key
 
 logger = logging.getLogger(__name__)
 logging.basicConfig(level=logging.INFO)
 
+# Business fields covered by rowHash
+COMPANY_HASH_FIELDS = ("accountName", "crmToErpFlag", "status")
 
-def insert_or_update_company(companies: List[Dict[str, Any]]) -> Dict[str, int]:
+# Staging-table layout for the initial load
+COMPANY_STAGING = StagingSpec(
+    table="SPUSER_STAGING_CRM_COMPANY_ACCOUNTS",
+    key_column="accountId",
+    columns=CompanyAccount._fields,
+    update_columns=COMPANY_HASH_FIELDS + ("rowHash",),
+)
+
+
+def insert_or_update_company(
+    companies: List[Dict[str, Any]],
+    deadline: Optional[Deadline] = None,
+    dead_letters: Optional[DeadLetterFile] = None,
+) -> Dict[str, int]:
     """
     Insert or update companies in SPUSER_STAGING_CRM_COMPANY_ACCOUNTS.
-    - Always propagate changes to ERP if crmToErpFlag is True.
+    - Propagate inserts and changes to ERP if crmToErpFlag is True.
     - Incorporates 'status' field into both CRM and ERP tables.
+    - Companies are looked up in chunks (starting at CRM_BATCH_SIZE, adapted
+      to the measured chunk latency, see AdaptiveBatchSizer), fetching only
+      accountId, rowHash and erpNo per chunk.
+    - Unchanged accounts (same rowHash, and erpNo present when flagged)
+      are skipped: no CRM update, no ERP round-trip.
+    - New or changed erpNo values are written with one back-fill UPDATE
+      from ERP_CUSTOMERS at the end of the load.
+    - Every chunk is its own transaction and is retried with backoff on
+      transient errors (see retry.call_with_retry); a chunk that still fails
+      marks all its companies as failed.
+    - With a deadline, no new chunk is started once it would not finish in
+      the remaining budget; the result then has "continue": True and the
+      input offset to resume from ("next_offset").
+    - With dead_letters, failed records are written to it as they happen and
+      the result only keeps their count and a sample (see FailureLog).
     """
     schema = os.getenv("HANA_SCHEMA")
     if not schema:
         raise ValueError("HANA_SCHEMA is not set.")
 
     engine = get_hana_client()
+    record_log = RecordLogger(logger, "company")
+    erp_log = customer_record_log()
+    table = f"{schema}.SPUSER_STAGING_CRM_COMPANY_ACCOUNTS"
+    sizer = AdaptiveBatchSizer.from_env("CRM_BATCH_SIZE")
     inserted_count = 0
     updated_count = 0
-    failed = []
+    unchanged_count = 0
+    failed = FailureLog("company", dead_letters, key_field="accountId")
+    backfill_needed = False
+
+    valid_companies = []
+    positions = []  # input index of each valid company (resume offset)
+    invalid = []
+    for index, company in enumerate(companies):
+        if not company.get("accountId") or not company.get("accountName"):
+            record_log.warning("Skipping invalid company entry: %s", company)
+            invalid.append((index, {"company": company, "error": "Missing mandatory fields"}))
+        else:
+            valid_companies.append(CompanyAccount.from_dict(company))
+            positions.append(index)
+
+    deadline = deadline or Deadline()
+    processed = 0
+    stopped = False
+    for chunk in sizer.chunks(valid_companies):
+        if processed and not deadline.allows(len(chunk)):
+            stopped = True
+            break
+        failed.extend(take_invalid(invalid, resume_offset(positions, processed, len(companies))))
+        processed += len(chunk)
+        record_log.record(len(chunk))
+        started = time.perf_counter()
+        try:
+            # Each chunk runs in its own transaction, retried on transient errors
+            result = call_with_retry(
+                lambda: process_company_chunk(engine, table, chunk, record_log, erp_log),
+                f"company chunk ({len(chunk)} records)",
+            )
+        except Exception as e:
+            record_log.exception("Error processing %d companies: %s", len(chunk), e)
+            failed.extend(
+                {
+                    "company": company._asdict(),
+                    "error": str(e),
+                    "error_class": type(e).__name__,
+                }
+                for company in chunk
+            )
+            sizer.record(len(chunk), time.perf_counter() - started, errors=len(chunk))
+            deadline.record(len(chunk), time.perf_counter() - started)
+            continue
+
+        inserted_count += result["inserted"]
+        updated_count += result["updated"]
+        unchanged_count += result["unchanged"]
+        failed.extend(result["failed"])
+        backfill_needed = backfill_needed or result["backfill_needed"]
+        sizer.record(len(chunk), time.perf_counter() - started, errors=len(result["failed"]))
+        deadline.record(len(chunk), time.perf_counter() - started)
+
+    # 🔁 One set-based erpNo back-fill from ERP_CUSTOMERS for the whole load
+    if backfill_needed:
+        with engine.begin() as connection:
+            run_erp_no_backfill(connection, schema, record_log)
+
+    summary = {
+        "inserted": inserted_count,
+        "updated": updated_count,
+        "unchanged": unchanged_count,
+    }
+    failed.extend(take_invalid(invalid, resume_offset(positions, processed, len(companies))))
+    summary.update(failed.summary())
+    if stopped:
+        stop_early(summary, positions, processed, len(companies))
+        record_log.warning("Time budget exhausted — stopping at input offset %d", summary["next_offset"])
+
+    record_log.summary("Company Summary", inserted=inserted_count, updated=updated_count,
+                       unchanged=unchanged_count, failed=len(failed), batch_sizes=sizer.describe())
+    if erp_log.records:
+        erp_log.summary("ERP Customer Summary", registrations=erp_log.records)
+    return summary
+
+
+def process_company_chunk(
+    engine, table: str, chunk: List[Dict[str, Any]], record_log, erp_log=None
+) -> Dict[str, Any]:
+    """
+    Insert or update one chunk of companies in its own transaction.
+    Per-record errors are collected in "failed"; transient errors (connection
+    loss, deadlock, lock timeout) abort the chunk so the caller can retry it.
+    Flagged new or changed accounts are registered in ERP once the chunk's CRM
+    transaction committed, each in its own transaction (retried on transient errors).
+    Returns inserted/updated/unchanged counts, failed records and whether
+    erpNo needs a back-fill.
+    """
+    result = {"inserted": 0, "updated": 0, "unchanged": 0, "failed": [], "backfill_needed": False}
+    erp_pending = []  # (company, stored erpNo) of flagged accounts, in input order
 
     with engine.begin() as connection:
-        for company in companies:
+        # 🔹 One key + rowHash lookup for the whole chunk
+        stored_rows = fetch_row_hashes(
+            connection, table, "accountId",
+            [company.get("accountId") for company in chunk], ("erpNo",),
+        )
+
+        for company in chunk:
             account_id = company.get("accountId")
             account_name = company.get("accountName")
             crm_to_erp_flag = company.get("crmToErpFlag")
             status = company.get("status")
 
-            if not account_id or not account_name:
-                logger.warning("Skipping invalid company entry: %s", company)
-                failed.append({"company": company, "error": "Missing mandatory fields"})
-                continue
-
             try:
-                # 🔹 Check existing CRM record
-                existing_query = text(f"""
-                    SELECT accountName, crmToErpFlag, erpNo, status 
-                    FROM {schema}.SPUSER_STAGING_CRM_COMPANY_ACCOUNTS
-                    WHERE accountId = :accountId
-                """)
-                existing = connection.execute(existing_query, {"accountId": account_id}).fetchone()
-
-                if existing:
-                    existing_name, existing_flag, existing_erp_no, existing_status = existing
-
-                    # 🔄 Update existing record (no comparison filtering — always update)
+                row_hash = compute_row_hash(company, COMPANY_HASH_FIELDS)
+                stored = stored_rows.get(account_id)
+
+                if stored:
+                    existing_erp_no = stored["erpNo"]
+
+                    # ⏭️ Skip unchanged accounts (CRM and ERP are already in sync)
+                    if is_company_unchanged(company, row_hash, stored):
+                        result["unchanged"] += 1
+                        continue
+
+                    # 🔄 Update existing record
                     update_query = text(f"""
-                        UPDATE {schema}.SPUSER_STAGING_CRM_COMPANY_ACCOUNTS
+                        UPDATE {table}
                         SET accountName = :accountName,
                             crmToErpFlag = :crmToErpFlag,
-                            status = :status
+                            status = :status,
+                            rowHash = :rowHash
                         WHERE accountId = :accountId
                     """)
                     connection.execute(
@@ -63,54 +199,181 @@ def insert_or_update_company(companies: List[Dict[str, Any]]) -> Dict[str, int]:
                             "accountName": account_name,
                             "crmToErpFlag": crm_to_erp_flag,
                             "status": status,
+                            "rowHash": row_hash,
                             "accountId": account_id,
                         },
                     )
-                    updated_count += 1
-                    existing_erp_no = existing_erp_no
+                    result["updated"] += 1
                 else:
                     # 🆕 Insert new CRM record
                     insert_query = text(f"""
-                        INSERT INTO {schema}.SPUSER_STAGING_CRM_COMPANY_ACCOUNTS (
-                            uuid, accountId, accountName, crmToErpFlag, status
-                        ) VALUES (:uuid, :accountId, :accountName, :crmToErpFlag, :status)
+                        INSERT INTO {table} (
+                            uuid, accountId, accountName, crmToErpFlag, status, rowHash
+                        ) VALUES (:uuid, :accountId, :accountName, :crmToErpFlag, :status, :rowHash)
                     """)
                     connection.execute(
                         insert_query,
                         {
-                            "uuid": str(uuid.uuid4()),
+                            "uuid": make_key("CRM_COMPANY_ACCOUNTS", account_id),
                             "accountId": account_id,
                             "accountName": account_name,
                             "crmToErpFlag": crm_to_erp_flag,
                             "status": status,
+                            "rowHash": row_hash,
                         },
                     )
-                    inserted_count += 1
+                    result["inserted"] += 1
                     existing_erp_no = None
 
-                # ✅ Always register/update ERP if crmToErpFlag=True
-                if crm_to_erp_flag:
-                    customer_id = register_company_as_customer(account_id, account_name, status)
+                # Later duplicates of this accountId in the chunk see the new state
+                stored_rows[account_id] = {"rowHash": row_hash, "erpNo": existing_erp_no}
 
-                    # 🔁 Update erpNo in CRM table
-                    update_erp_query = text(f"""
-                        UPDATE {schema}.SPUSER_STAGING_CRM_COMPANY_ACCOUNTS
-                        SET erpNo = :erpNo
-                        WHERE accountId = :accountId
-                    """)
-                    connection.execute(
-                        update_erp_query,
-                        {"erpNo": customer_id, "accountId": account_id},
-                    )
+                # ✅ Register/update ERP for new or changed accounts if crmToErpFlag=True
+                if crm_to_erp_flag:
+                    erp_pending.append((company, existing_erp_no))
 
             except Exception as e:
-                logger.exception("Error processing company %s: %s", account_id, e)
-                failed.append({"company": company, "error": str(e)})
+                if is_transient_error(e):
+                    raise
+                record_log.exception("Error processing company %s: %s", account_id, e)
+                result["failed"].append({
+                    "company": company._asdict(),
+                    "error": str(e),
+                    "error_class": type(e).__name__,
+                })
+
+    # ERP registration after the CRM commit (its own transactions never share the chunk's)
+    for company, existing_erp_no in erp_pending:
+        account_id = company.get("accountId")
+        if erp_log is not None:
+            erp_log.record()
+        try:
+            customer_id = call_with_retry(
+                lambda: register_company_as_customer(
+                    account_id, company.get("accountName"), company.get("status"), record_log=erp_log
+                ),
+                f"ERP customer accountId={account_id}",
+            )
+        except Exception as e:
+            record_log.exception("Error registering company %s in ERP: %s", account_id, e)
+            result["failed"].append({
+                "company": company._asdict(),
+                "error": str(e),
+                "error_class": type(e).__name__,
+            })
+            continue
 
-    logger.info("Company Summary: inserted=%d, updated=%d, failed=%d",
-                inserted_count, updated_count, len(failed))
+        # 🔁 erpNo differs → written by the bulk back-fill at the end
+        if customer_id != existing_erp_no:
+            result["backfill_needed"] = True
+
+    return result
+
+
+def is_company_unchanged(company: Dict[str, Any], row_hash: str, stored: Mapping[str, Any]) -> bool:
+    """
+    Compare an incoming company with its stored CRM row via rowHash
+    (accountName, crmToErpFlag, status).
+    A flagged account without erpNo still needs its ERP registration.
+    """
+    return stored["rowHash"] == row_hash and (
+        not company.get("crmToErpFlag") or bool(stored["erpNo"])
+    )
+
+
+def initial_load_companies(
+    companies: List[Dict[str, Any]], dead_letters: Optional[DeadLetterFile] = None
+) -> Dict[str, int]:
+    """
+    Initial-load variant of insert_or_update_company (LOAD_MODE=initial).
+    - All companies are bulk-inserted into a staging table, classified with one
+      join and applied with set-based MERGE statements (see StagingTable).
+    - Duplicate accountIds in the input keep their last record.
+    - Flagged accounts that are new, changed or still without erpNo are then
+      registered in ERP, and erpNo is written with one back-fill UPDATE.
+    - With dead_letters, failed records are written to it as they happen (see FailureLog).
+    """
+    schema = os.getenv("HANA_SCHEMA")
+    if not schema:
+        raise ValueError("HANA_SCHEMA is not set.")
+
+    engine = get_hana_client()
+    record_log = RecordLogger(logger, "company")
+    record_log.record(len(companies))
+    erp_log = customer_record_log()
+    failed = FailureLog("company", dead_letters, key_field="accountId")
+
+    valid_companies = []
+    for company in companies:
+        if not company.get("accountId") or not company.get("accountName"):
+            record_log.warning("Skipping invalid company entry: %s", company)
+            failed.append({"company": company, "error": "Missing mandatory fields"})
+        else:
+            valid_companies.append(CompanyAccount.from_dict(company))
+
+    valid_companies, duplicates = dedupe_by_key(valid_companies, "accountId")
+    # Full records of failed registrations go to the dead-letter file (reloadable)
+    by_account = {str(company.accountId): company for company in valid_companies}
+    staged = [
+        company._replace(
+            uuid=make_key("CRM_COMPANY_ACCOUNTS", company.accountId),
+            rowHash=compute_row_hash(company, COMPANY_HASH_FIELDS),
+        )
+        for company in valid_companies
+    ]
+
+    with engine.begin() as connection:
+        with StagingTable(connection, schema, COMPANY_STAGING) as staging:
+            staging.load(staged)
+            counts = staging.classify()
+            erp_pending = staging.select(
+                ("s.accountId", "s.accountName", "s.status", "t.erpNo"),
+                f"s.crmToErpFlag = TRUE AND ({staging.new_or_changed} OR t.erpNo IS NULL)",
+            )
+            staging.merge()
+
+    # ✅ ERP registration (sequential customerIds) for new/changed flagged accounts,
+    # after the merge committed (each registration runs in its own transaction)
+    backfill_needed = False
+    for account_id, account_name, status, existing_erp_no in erp_pending:
+        erp_log.record()
+        try:
+            customer_id = register_company_as_customer(account_id, account_name, status, record_log=erp_log)
+        except Exception as e:
+            record_log.exception("Error registering company %s in ERP: %s", account_id, e)
+            failed.append({
+                "company": by_account[str(account_id)]._asdict(),
+                "error": str(e),
+                "error_class": type(e).__name__,
+            })
+            continue
+        backfill_needed = backfill_needed or customer_id != existing_erp_no
+
+    if backfill_needed:
+        with engine.begin() as connection:
+            run_erp_no_backfill(connection, schema, record_log)
+
+    record_log.summary("Company Initial Load Summary", inserted=counts["inserted"],
+                       updated=counts["updated"], unchanged=counts["unchanged"],
+                       duplicates=duplicates, failed=len(failed))
+    if erp_log.records:
+        erp_log.summary("ERP Customer Initial Load Summary", registrations=erp_log.records)
     return {
-        "inserted": inserted_count,
-        "updated": updated_count,
-        "failed": failed,
+        "inserted": counts["inserted"],
+        "updated": counts["updated"],
+        "unchanged": counts["unchanged"],
+        **failed.summary(),
     }
+
+
+def run_erp_no_backfill(connection, schema: str, record_log) -> None:
+    """
+    Write erpNo for the load with one back-fill UPDATE.
+    A failure is logged and leaves the CRM rows as they are; the reconciliation
+    job (HANDLER_MODE=reconcile) repairs them later.
+    """
+    try:
+        updated = backfill_erp_no(connection, schema)
+        logger.info("Back-filled erpNo for %d account(s)", updated)
+    except Exception as e:
+        record_log.exception("Error back-filling erpNo: %s", e)
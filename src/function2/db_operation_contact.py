@@ -1,135 +1,411 @@
 import os
-import uuid
+import time
 import logging
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Optional
 from sqlalchemy import text
+from backfill import backfill_erp_contact_person
+from batching import AdaptiveBatchSizer
 from db_connection import get_hana_client
-from erp_contactPerson_registration import register_contact_as_erp
+from dead_letter import DeadLetterFile, FailureLog
+from deadline import Deadline, resume_offset, stop_early, take_invalid
+from erp_contactPerson_registration import contact_record_log, register_contact_as_erp
+from log_sampling import RecordLogger
+from partial_update import GroupedUpdates, changed_columns
+from record_types import Contact
+from retry import call_with_retry, is_transient_error
+from row_hash import compute_row_hash, fetch_row_hashes, fetch_rows
+from key_generation import make_key
+from staging_load import StagingSpec, StagingTable, dedupe_by_key
 
 logger = logging.getLogger(__name__)
 logging.basicConfig(level=logging.INFO)
 
+# CRM contact columns maintained by the loader (compared field by field, covered by rowHash)
+CONTACT_UPDATE_COLUMNS = (
+    "accountName", "firstName", "lastName", "email", "department", "country",
+    "cshmeFlag", "zipCode", "phoneNo", "status", "crmToErpFlag",
+)
 
-def insert_or_update_contact(contacts: List[Dict[str, Any]]) -> Dict[str, int]:
+# Staging-table layout for the initial load
+CONTACT_STAGING = StagingSpec(
+    table="SPUSER_STAGING_CRM_COMPANY_CONTACTS",
+    key_column="contactId",
+    columns=Contact._fields,
+    update_columns=CONTACT_UPDATE_COLUMNS + ("rowHash",),
+)
+
+
+def insert_or_update_contact(
+    contacts: List[Dict[str, Any]],
+    deadline: Optional[Deadline] = None,
+    dead_letters: Optional[DeadLetterFile] = None,
+) -> Dict[str, int]:
     """
     Insert or update contacts in CRM_COMPANY_CONTACTS.
     - Always propagate all changes to ERP_CUSTOMERS_CONTACTS via register_contact_as_erp.
+    - Contacts are looked up in adaptive chunks (starting at CRM_BATCH_SIZE,
+      see AdaptiveBatchSizer), fetching only contactId, rowHash and
+      erpContactPerson; full rows are read only for contacts whose rowHash differs.
+    - Updates only write the columns that changed; rows sharing the same
+      changed-column set are sent as one executemany per chunk.
+    - New or changed erpContactPerson values are written with one back-fill
+      UPDATE from ERP_CUSTOMERS_CONTACTS at the end of the load.
+    - Every chunk is its own transaction and is retried with backoff on
+      transient errors (see retry.call_with_retry); a chunk that still fails
+      marks all its contacts as failed.
+    - With a deadline, no new chunk is started once it would not finish in
+      the remaining budget; the result then has "continue": True and the
+      input offset to resume from ("next_offset").
+    - With dead_letters, failed records are written to it as they happen and
+      the result only keeps their count and a sample (see FailureLog).
     """
     schema = os.getenv("HANA_SCHEMA")
     if not schema:
         raise ValueError("HANA_SCHEMA is not set.")
 
     engine = get_hana_client()
+    record_log = RecordLogger(logger, "contact")
+    erp_log = contact_record_log()
+    table = f"{schema}.SPUSER_STAGING_CRM_COMPANY_CONTACTS"
+    sizer = AdaptiveBatchSizer.from_env("CRM_BATCH_SIZE")
     inserted_count = 0
     updated_count = 0
-    failed = []
+    unchanged_count = 0
+    failed = FailureLog("contact", dead_letters)
+    backfill_needed = False
+
+    valid_contacts = []
+    positions = []  # input index of each valid contact (resume offset)
+    invalid = []
+    for index, contact in enumerate(contacts):
+        if not contact.get("accountId") or not contact.get("contactId"):
+            record_log.warning("Skipping invalid contact entry: %s", contact)
+            invalid.append((index, {"contact": contact, "error": "Missing mandatory fields"}))
+        else:
+            valid_contacts.append(Contact.from_dict(contact))
+            positions.append(index)
+
+    deadline = deadline or Deadline()
+    processed = 0
+    stopped = False
+    for chunk in sizer.chunks(valid_contacts):
+        if processed and not deadline.allows(len(chunk)):
+            stopped = True
+            break
+        failed.extend(take_invalid(invalid, resume_offset(positions, processed, len(contacts))))
+        processed += len(chunk)
+        record_log.record(len(chunk))
+        started = time.perf_counter()
+        try:
+            # Each chunk runs in its own transaction, retried on transient errors
+            result = call_with_retry(
+                lambda: process_contact_chunk(engine, table, chunk, record_log, erp_log),
+                f"contact chunk ({len(chunk)} records)",
+            )
+        except Exception as e:
+            record_log.exception("Error processing %d contacts: %s", len(chunk), e)
+            failed.extend(
+                {
+                    "contact": contact._asdict(),
+                    "error": str(e),
+                    "error_class": type(e).__name__,
+                }
+                for contact in chunk
+            )
+            sizer.record(len(chunk), time.perf_counter() - started, errors=len(chunk))
+            deadline.record(len(chunk), time.perf_counter() - started)
+            continue
+
+        inserted_count += result["inserted"]
+        updated_count += result["updated"]
+        unchanged_count += result["unchanged"]
+        failed.extend(result["failed"])
+        backfill_needed = backfill_needed or result["backfill_needed"]
+        sizer.record(len(chunk), time.perf_counter() - started, errors=len(result["failed"]))
+        deadline.record(len(chunk), time.perf_counter() - started)
+
+    # 🔁 One set-based erpContactPerson back-fill for the whole load
+    if backfill_needed:
+        with engine.begin() as connection:
+            run_erp_contact_backfill(connection, schema, record_log)
+
+    summary = {
+        "inserted": inserted_count,
+        "updated": updated_count,
+        "unchanged": unchanged_count,
+    }
+    failed.extend(take_invalid(invalid, resume_offset(positions, processed, len(contacts))))
+    summary.update(failed.summary())
+    if stopped:
+        stop_early(summary, positions, processed, len(contacts))
+        record_log.warning("Time budget exhausted — stopping at input offset %d", summary["next_offset"])
+
+    record_log.summary("Contact Summary", inserted=inserted_count, updated=updated_count,
+                       unchanged=unchanged_count, failed=len(failed), batch_sizes=sizer.describe())
+    if erp_log.records:
+        erp_log.summary("ERP Contact Summary", registrations=erp_log.records)
+    return summary
+
+
+def process_contact_chunk(
+    engine, table: str, chunk: List[Dict[str, Any]], record_log, erp_log=None
+) -> Dict[str, Any]:
+    """
+    Insert or update one chunk of contacts in its own transaction.
+    Flagged contacts are registered in ERP once the chunk's CRM writes, including
+    the grouped updates, are committed: in input order, each in its own transaction
+    (retried on transient errors), not if their CRM write failed.
+    Per-record errors are collected in "failed"; transient errors (connection
+    loss, deadlock, lock timeout) abort the chunk so the caller can retry it.
+    Returns inserted/updated/unchanged counts, failed records and whether
+    erpContactPerson needs a back-fill.
+    """
+    result = {"inserted": 0, "updated": 0, "unchanged": 0, "failed": [], "backfill_needed": False}
+    pending_updates = GroupedUpdates(table, "contactId")
+    erp_pending = []  # (contact, stored erpContactPerson) of flagged contacts, in input order
+    hashes = [compute_row_hash(contact, CONTACT_UPDATE_COLUMNS) for contact in chunk]
 
     with engine.begin() as connection:
-        for contact in contacts:
+        # 🔹 Key + rowHash for the chunk, full rows only where the hash differs
+        stored_rows = fetch_row_hashes(
+            connection, table, "contactId",
+            [contact.get("contactId") for contact in chunk], ("erpContactPerson",),
+        )
+        changed_ids = [
+            contact.get("contactId")
+            for contact, row_hash in zip(chunk, hashes)
+            if contact.get("contactId") in stored_rows
+            and stored_rows[contact.get("contactId")]["rowHash"] != row_hash
+        ]
+        full_rows = fetch_rows(connection, table, "contactId", changed_ids, CONTACT_UPDATE_COLUMNS)
+
+        for contact, row_hash in zip(chunk, hashes):
             account_id = contact.get("accountId")
             contact_id = contact.get("contactId")
             crm_to_erp_flag = contact.get("crmToErpFlag")
 
-            if not account_id or not contact_id:
-                logger.warning("Skipping invalid contact entry: %s", contact)
-                failed.append({"contact": contact, "error": "Missing mandatory fields"})
-                continue
-
             try:
-                # Check existing CRM contact
-                existing_query = text(f"""
-                    SELECT accountName, firstName, lastName, email, crmToErpFlag, erpContactPerson
-                    FROM {schema}.SPUSER_STAGING_CRM_COMPANY_CONTACTS
-                    WHERE contactId = :contactId
-                """)
-                existing = connection.execute(existing_query, {"contactId": contact_id}).fetchone()
-
-                if existing:
-                    existing_values = existing._mapping
-                    update_needed = any(
-                        existing_values.get(field) != contact.get(field)
-                        for field in ["accountName", "firstName", "lastName", "email", "crmToErpFlag"]
-                    )
+                stored = stored_rows.get(contact_id)
 
-                    if update_needed:
-                        update_query = text(f"""
-                            UPDATE {schema}.SPUSER_STAGING_CRM_COMPANY_CONTACTS
-                            SET accountName = :accountName,
-                                firstName = :firstName,
-                                lastName = :lastName,
-                                email = :email,
-                                department = :department,
-                                country = :country,
-                                cshmeFlag = :cshmeFlag,
-                                zipCode = :zipCode,
-                                phoneNo = :phoneNo,
-                                status = :status,
-                                crmToErpFlag = :crmToErpFlag
-                            WHERE contactId = :contactId
-                        """)
-                        connection.execute(
-                            update_query,
-                            {**contact, "contactId": contact_id},
+                if stored:
+                    existing_erp_contact = stored["erpContactPerson"]
+                    if stored["rowHash"] == row_hash:
+                        result["unchanged"] += 1
+                    else:
+                        # Queue an update of the changed columns only
+                        columns = changed_columns(
+                            contact, full_rows.get(contact_id, {}), CONTACT_UPDATE_COLUMNS
+                        )
+                        pending_updates.add(
+                            contact_id, contact._replace(rowHash=row_hash),
+                            columns + ("rowHash",), record=contact,
                         )
-                    updated_count += 1
                 else:
                     # Insert new CRM contact
                     insert_query = text(f"""
-                        INSERT INTO {schema}.SPUSER_STAGING_CRM_COMPANY_CONTACTS (
+                        INSERT INTO {table} (
                             uuid, contactId, accountId, accountName, crmToErpFlag,
                             firstName, lastName, email, department, country,
-                            cshmeFlag, zipCode, phoneNo, status
+                            cshmeFlag, zipCode, phoneNo, status, rowHash
                         )
                         VALUES (
                             :uuid, :contactId, :accountId, :accountName, :crmToErpFlag,
                             :firstName, :lastName, :email, :department, :country,
-                            :cshmeFlag, :zipCode, :phoneNo, :status
+                            :cshmeFlag, :zipCode, :phoneNo, :status, :rowHash
                         )
                     """)
+                    params = {column: contact.get(column) for column in CONTACT_UPDATE_COLUMNS}
                     connection.execute(
                         insert_query,
-                        {**contact, "uuid": str(uuid.uuid4())},
+                        {
+                            **params,
+                            "uuid": make_key("CRM_COMPANY_CONTACTS", contact_id),
+                            "contactId": contact_id,
+                            "accountId": account_id,
+                            "rowHash": row_hash,
+                        },
                     )
-                    inserted_count += 1
+                    result["inserted"] += 1
+                    existing_erp_contact = None
+                    # Later duplicates of this contactId in the chunk see the new row
+                    stored_rows[contact_id] = {"rowHash": row_hash, "erpContactPerson": None}
 
-                # ✅ Always register/update ERP if crmToErpFlag=True
+                # ✅ Always register/update ERP if crmToErpFlag=True (once the CRM writes succeeded)
                 if crm_to_erp_flag:
-                    contact_person_id = register_contact_as_erp(
-                        account_id,
-                        contact.get("firstName"),
-                        contact.get("lastName"),
-                        contact.get("email"),
-                        department=contact.get("department"),
-                        country=contact.get("country"),
-                        cshme_flag=contact.get("cshmeFlag"),
-                        phone_no=contact.get("phoneNo"),
-                        status=contact.get("status"),
-                        contact_id=contact_id
-                    )
-
-                    # Update erpContactPerson in CRM
-                    if contact_person_id:
-                        update_erp_contact = text(f"""
-                            UPDATE {schema}.SPUSER_STAGING_CRM_COMPANY_CONTACTS
-                            SET erpContactPerson = :erpContactPerson
-                            WHERE contactId = :contactId
-                        """)
-                        connection.execute(
-                            update_erp_contact,
-                            {
-                                "erpContactPerson": contact_person_id,
-                                "contactId": contact_id,
-                            }
-                        )
+                    erp_pending.append((contact, existing_erp_contact))
 
             except Exception as e:
-                logger.exception("Error processing contact %s: %s", contact_id, e)
-                failed.append({"contact": contact, "error": str(e)})
+                if is_transient_error(e):
+                    raise
+                record_log.exception("Error processing contact %s: %s", contact_id, e)
+                result["failed"].append({
+                    "contact": contact._asdict(),
+                    "error": str(e),
+                    "error_class": type(e).__name__,
+                })
+
+        # Grouped updates of the chunk
+        updated, failures = pending_updates.execute(connection)
+        for contact, e in failures:
+            if is_transient_error(e):
+                raise e
+            record_log.exception("Error updating contact %s: %s", contact.get("contactId"), e)
+            result["failed"].append({
+                "contact": contact._asdict(),
+                "error": str(e),
+                "error_class": type(e).__name__,
+            })
+        result["updated"] += updated
+
+    # ERP registration after the CRM commit (its own transactions never share the chunk's),
+    # skipping contacts whose CRM update failed
+    not_updated = {id(contact) for contact, _ in failures}
+    for contact, existing_erp_contact in erp_pending:
+        if id(contact) in not_updated:
+            continue
+        if erp_log is not None:
+            erp_log.record()
+        try:
+            contact_person_id = call_with_retry(
+                lambda: register_contact_as_erp(
+                    contact.get("accountId"),
+                    contact.get("firstName"),
+                    contact.get("lastName"),
+                    contact.get("email"),
+                    department=contact.get("department"),
+                    country=contact.get("country"),
+                    cshme_flag=contact.get("cshmeFlag"),
+                    phone_no=contact.get("phoneNo"),
+                    status=contact.get("status"),
+                    contact_id=contact.get("contactId"),
+                    record_log=erp_log,
+                ),
+                f"ERP contact contactId={contact.get('contactId')}",
+            )
+        except Exception as e:
+            record_log.exception("Error registering contact %s in ERP: %s", contact.get("contactId"), e)
+            result["failed"].append({
+                "contact": contact._asdict(),
+                "error": str(e),
+                "error_class": type(e).__name__,
+            })
+            continue
 
-    logger.info("Contact Summary: inserted=%d, updated=%d, failed=%d",
-                inserted_count, updated_count, len(failed))
+        # erpContactPerson differs → written by the bulk back-fill at the end
+        if contact_person_id and contact_person_id != existing_erp_contact:
+            result["backfill_needed"] = True
+
+    return result
+
+
+def initial_load_contacts(
+    contacts: List[Dict[str, Any]], dead_letters: Optional[DeadLetterFile] = None
+) -> Dict[str, int]:
+    """
+    Initial-load variant of insert_or_update_contact (LOAD_MODE=initial).
+    - All contacts are bulk-inserted into a staging table, classified with one
+      join and applied with set-based MERGE statements (see StagingTable).
+    - Duplicate contactIds in the input keep their last record.
+    - Flagged contacts that are new, changed or still without erpContactPerson
+      are then registered in ERP, and erpContactPerson is written with one back-fill UPDATE.
+    - With dead_letters, failed records are written to it as they happen (see FailureLog).
+    """
+    schema = os.getenv("HANA_SCHEMA")
+    if not schema:
+        raise ValueError("HANA_SCHEMA is not set.")
+
+    engine = get_hana_client()
+    record_log = RecordLogger(logger, "contact")
+    record_log.record(len(contacts))
+    erp_log = contact_record_log()
+    failed = FailureLog("contact", dead_letters)
+
+    valid_contacts = []
+    for contact in contacts:
+        if not contact.get("accountId") or not contact.get("contactId"):
+            record_log.warning("Skipping invalid contact entry: %s", contact)
+            failed.append({"contact": contact, "error": "Missing mandatory fields"})
+        else:
+            valid_contacts.append(Contact.from_dict(contact))
+
+    valid_contacts, duplicates = dedupe_by_key(valid_contacts, "contactId")
+    # Full records of failed registrations go to the dead-letter file (reloadable)
+    by_contact = {str(contact.contactId): contact for contact in valid_contacts}
+    staged = [
+        contact._replace(
+            uuid=make_key("CRM_COMPANY_CONTACTS", contact.contactId),
+            rowHash=compute_row_hash(contact, CONTACT_UPDATE_COLUMNS),
+        )
+        for contact in valid_contacts
+    ]
+
+    with engine.begin() as connection:
+        with StagingTable(connection, schema, CONTACT_STAGING) as staging:
+            staging.load(staged)
+            counts = staging.classify()
+            erp_pending = staging.select(
+                ("s.contactId", "s.accountId", "s.firstName", "s.lastName", "s.email",
+                 "s.department", "s.country", "s.cshmeFlag", "s.phoneNo", "s.status",
+                 "t.erpContactPerson"),
+                f"s.crmToErpFlag = TRUE AND ({staging.new_or_changed} OR t.erpContactPerson IS NULL)",
+            )
+            staging.merge()
+
+    # ✅ ERP registration (sequential contactPersonIds) for new/changed flagged contacts,
+    # after the merge committed (each registration runs in its own transaction)
+    backfill_needed = False
+    for row in erp_pending:
+        erp_log.record()
+        try:
+            contact_person_id = register_contact_as_erp(
+                row.accountId,
+                row.firstName,
+                row.lastName,
+                row.email,
+                department=row.department,
+                country=row.country,
+                cshme_flag=row.cshmeFlag,
+                phone_no=row.phoneNo,
+                status=row.status,
+                contact_id=row.contactId,
+                record_log=erp_log,
+            )
+        except Exception as e:
+            record_log.exception("Error registering contact %s in ERP: %s", row.contactId, e)
+            failed.append({
+                "contact": by_contact[str(row.contactId)]._asdict(),
+                "error": str(e),
+                "error_class": type(e).__name__,
+            })
+            continue
+        if contact_person_id and contact_person_id != row.erpContactPerson:
+            backfill_needed = True
+
+    if backfill_needed:
+        with engine.begin() as connection:
+            run_erp_contact_backfill(connection, schema, record_log)
+
+    record_log.summary("Contact Initial Load Summary", inserted=counts["inserted"],
+                       updated=counts["updated"], unchanged=counts["unchanged"],
+                       duplicates=duplicates, failed=len(failed))
+    if erp_log.records:
+        erp_log.summary("ERP Contact Initial Load Summary", registrations=erp_log.records)
     return {
-        "inserted": inserted_count,
-        "updated": updated_count,
-        "failed": failed,
+        "inserted": counts["inserted"],
+        "updated": counts["updated"],
+        "unchanged": counts["unchanged"],
+        **failed.summary(),
     }
+
+
+def run_erp_contact_backfill(connection, schema: str, record_log) -> None:
+    """
+    Write erpContactPerson for the load with one back-fill UPDATE.
+    A failure is logged and leaves the CRM rows as they are; the reconciliation
+    job (HANDLER_MODE=reconcile) repairs them later.
+    """
+    try:
+        updated = backfill_erp_contact_person(connection, schema)
+        logger.info("Back-filled erpContactPerson for %d contact(s)", updated)
+    except Exception as e:
+        record_log.exception("Error back-filling erpContactPerson: %s", e)
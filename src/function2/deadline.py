@@ -0,0 +1,141 @@
+import os
+import time
+import logging
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+import json_codec
+
+logger = logging.getLogger(__name__)
+logging.basicConfig(level=logging.INFO)
+
+DEFAULT_RESERVE_SECONDS = 10.0
+
+
+class Deadline:
+    """
+    Time budget of one handler invocation.
+    The loaders ask allows(next_rows) before pulling the next chunk: it is refused
+    when the remaining budget, minus reserve_seconds for the final commit, back-fill
+    and checkpoint, is shorter than the next chunk is expected to take (slowest
+    measured seconds per row so far × next_rows).
+    """
+
+    def __init__(self, budget_seconds: Optional[float] = None,
+                 reserve_seconds: float = DEFAULT_RESERVE_SECONDS, clock=time.monotonic):
+        self.clock = clock
+        self.expires_at = None if budget_seconds is None else clock() + budget_seconds
+        self.reserve_seconds = reserve_seconds
+        self.seconds_per_row = 0.0
+
+    @classmethod
+    def from_context(cls, context: Any = None) -> "Deadline":
+        """
+        Budget from the platform context (context.get_remaining_time_in_millis(),
+        as on AWS Lambda), else TIME_BUDGET_SECONDS; unlimited if neither is set.
+        DEADLINE_RESERVE_SECONDS (default 10) is kept free for wrapping up.
+        """
+        reserve = float(os.getenv("DEADLINE_RESERVE_SECONDS", DEFAULT_RESERVE_SECONDS))
+        remaining_ms = getattr(context, "get_remaining_time_in_millis", None)
+        if callable(remaining_ms):
+            return cls(remaining_ms() / 1000.0, reserve)
+        budget = os.getenv("TIME_BUDGET_SECONDS")
+        return cls(float(budget) if budget else None, reserve)
+
+    @property
+    def is_limited(self) -> bool:
+        return self.expires_at is not None
+
+    def remaining(self) -> float:
+        return float("inf") if self.expires_at is None else self.expires_at - self.clock()
+
+    def record(self, rows: int, seconds: float) -> None:
+        """Feed back the duration of one chunk."""
+        if rows > 0:
+            self.seconds_per_row = max(self.seconds_per_row, seconds / rows)
+
+    def allows(self, next_rows: int) -> bool:
+        """True if a chunk of next_rows is expected to finish within the budget."""
+        return self.remaining() - self.reserve_seconds > self.seconds_per_row * next_rows
+
+
+def resume_offset(positions: Sequence[int], processed: int, total: int) -> int:
+    """
+    Input offset to resume from after the first `processed` valid records were
+    loaded; positions are the input indexes of the valid records.
+    """
+    return positions[processed] if processed < len(positions) else total
+
+
+def take_invalid(invalid: List[Tuple[int, Dict[str, Any]]], offset: int) -> List[Dict[str, Any]]:
+    """
+    Remove and return the validation failures (input index, failure) before
+    offset. Loaders report them chunk by chunk, so the ones at or after the
+    resume offset of a stopped load are reported by the invocation resuming there.
+    """
+    count = 0
+    while count < len(invalid) and invalid[count][0] < offset:
+        count += 1
+    taken = [failure for _, failure in invalid[:count]]
+    del invalid[:count]
+    return taken
+
+
+def stop_early(result: Dict[str, Any], positions: Sequence[int], processed: int, total: int) -> None:
+    """Mark a loader result as stopped by the deadline: "continue" and "next_offset" are set."""
+    result["continue"] = True
+    result["next_offset"] = resume_offset(positions, processed, total)
+
+
+class Checkpoint:
+    """
+    Resume position of a load stopped by its deadline, in a JSON file
+    (CHECKPOINT_PATH): {"stage", "offset", ...}. Offsets index the handler's
+    (shard-filtered) input list of that stage.
+    """
+
+    def __init__(self, path: str):
+        self.path = os.path.abspath(path)
+
+    @classmethod
+    def from_env(cls, default_path: str) -> "Checkpoint":
+        return cls(os.getenv("CHECKPOINT_PATH", default_path))
+
+    def load(self) -> Optional[Dict[str, Any]]:
+        if not os.path.exists(self.path):
+            return None
+        with open(self.path, "rb") as f:
+            return json_codec.load(f)
+
+    def save(self, **position: Any) -> Dict[str, Any]:
+        """Write the position atomically (temporary file + rename). Returns it."""
+        temporary = self.path + ".tmp"
+        with open(temporary, "w", encoding="utf-8") as f:
+            json_codec.dump(position, f)
+        os.replace(temporary, self.path)
+        logger.info("Checkpoint saved to %s: %s", self.path, position)
+        return position
+
+    def clear(self) -> None:
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+
+class EventCheckpoint:
+    """
+    Resume position of a load whose records came in the event: nothing is stored,
+    the invocation returns the position and the caller resends the same event
+    with "resume": <position> to continue.
+    """
+
+    path = 'event["resume"]'
+
+    def __init__(self, event: Any = None):
+        self.position = event.get("resume") if isinstance(event, dict) else None
+
+    def load(self) -> Optional[Dict[str, Any]]:
+        return self.position
+
+    def save(self, **position: Any) -> Dict[str, Any]:
+        return position
+
+    def clear(self) -> None:
+        pass
@@ -1,14 +1,27 @@
 import os
-import uuid
 import logging
 from datetime import datetime
 from sqlalchemy import text
 from db_connection import get_hana_client
 from id_generation import generate_sequential_id
+from id_store_outbox import CONTACT_REGISTERED, CONTACT_UPDATED, add_outbox_event
+from log_sampling import RecordLogger
+from row_hash import compute_row_hash
+from key_generation import make_key
 
 logger = logging.getLogger(__name__)
 logging.basicConfig(level=logging.INFO)
 
+# Business fields covered by rowHash
+ERP_CONTACT_HASH_FIELDS = (
+    "firstName", "lastName", "department", "country", "cshmeFlag", "phoneNo", "status",
+)
+
+
+def contact_record_log() -> RecordLogger:
+    """Per-record logger (LOG_MODE=sampled) for the registrations of one load, see RecordLogger."""
+    return RecordLogger(logger, "ERP contact")
+
 
 def register_contact_as_erp(
     account_id: int,
@@ -20,7 +33,8 @@ def register_contact_as_erp(
     cshme_flag=None,
     phone_no=None,
     status=None,
-    contact_id=None
+    contact_id=None,
+    record_log=None,
 ):
     """
     Registers a CRM contact as an ERP customer contact.
@@ -28,8 +42,11 @@ def register_contact_as_erp(
     - Finds the corresponding customerId from ERP_CUSTOMERS via crmBpNo = accountId
     - Generates sequential contactPersonId only for new records
     - Inserts into ERP_CUSTOMERS_CONTACTS (with createdAt & lastModified timestamps)
-    - Updates existing records directly
+    - Updates existing records directly, unless rowHash shows no change
+    - Inserts and updates add an ID-store event to the outbox in the same transaction
     - Returns the contactPersonId
+    - Per-record lines go through record_log (one contact_record_log() per load;
+      a new one per call if not given)
     """
 
     schema = os.getenv("HANA_SCHEMA")
@@ -37,7 +54,20 @@ def register_contact_as_erp(
         raise ValueError("Environment variable HANA_SCHEMA is not set.")
 
     engine = get_hana_client()
+    record_log = record_log or contact_record_log()
     now_utc = datetime.utcnow()
+    row_hash = compute_row_hash(
+        {
+            "firstName": first_name,
+            "lastName": last_name,
+            "department": department,
+            "country": country,
+            "cshmeFlag": cshme_flag,
+            "phoneNo": phone_no,
+            "status": status,
+        },
+        ERP_CONTACT_HASH_FIELDS,
+    )
 
     with engine.begin() as connection:
         # Find ERP Customer ID for given CRM Account
@@ -59,16 +89,22 @@ def register_contact_as_erp(
 
         # Check if contact already exists
         existing_query = text(f"""
-            SELECT contactPersonId, cshmeFlag, createdAt
+            SELECT contactPersonId, cshmeFlag, createdAt, rowHash
             FROM {schema}.SPUSER_STAGING_ERP_CUSTOMERS_CONTACTS
             WHERE crmBpNo = :account_id AND email = :email
         """)
         existing = connection.execute(existing_query, {"account_id": account_id, "email": email}).fetchone()
 
         if existing:
-            contact_person_id, previous_flag, created_at = existing
+            contact_person_id, previous_flag, created_at, existing_hash = existing
+            if existing_hash == row_hash:
+                record_log.info(
+                    "⏭️ ERP contact unchanged (Account=%s → ContactID=%s)",
+                    account_id, contact_person_id
+                )
+                return contact_person_id
 
-            # Always update incoming record
+            # Update incoming record
             update_query = text(f"""
                 UPDATE {schema}.SPUSER_STAGING_ERP_CUSTOMERS_CONTACTS
                 SET firstName = :firstName,
@@ -78,7 +114,8 @@ def register_contact_as_erp(
                     cshmeFlag = :cshmeFlag,
                     phoneNo = :phoneNo,
                     status = :status,
-                    lastModified = :lastModified
+                    lastModified = :lastModified,
+                    rowHash = :rowHash
                 WHERE crmBpNo = :crmBpNo AND email = :email
             """)
             connection.execute(
@@ -92,12 +129,13 @@ def register_contact_as_erp(
                     "phoneNo": phone_no,
                     "status": status,
                     "lastModified": now_utc,
+                    "rowHash": row_hash,
                     "crmBpNo": account_id,
                     "email": email
                 },
             )
 
-            logger.info(
+            record_log.info(
                 "🔁 Updated ERP contact: %s %s (Account=%s → ContactID=%s)",
                 first_name, last_name, account_id, contact_person_id
             )
@@ -110,25 +148,26 @@ def register_contact_as_erp(
             contact_person_id = generate_sequential_id(
                 id_type="contactPersonId",
                 start_range=start,
-                end_range=end
+                end_range=end,
+                record_log=record_log,
             )
 
             insert_query = text(f"""
                 INSERT INTO {schema}.SPUSER_STAGING_ERP_CUSTOMERS_CONTACTS (
                     uuid, contactPersonId, customerId, crmBpNo,
                     firstName, lastName, email, department, country,
-                    cshmeFlag, phoneNo, status, createdAt, lastModified
+                    cshmeFlag, phoneNo, status, createdAt, lastModified, rowHash
                 )
                 VALUES (
                     :uuid, :contactPersonId, :customerId, :crmBpNo,
                     :firstName, :lastName, :email, :department, :country,
-                    :cshmeFlag, :phoneNo, :status, :createdAt, :lastModified
+                    :cshmeFlag, :phoneNo, :status, :createdAt, :lastModified, :rowHash
                 )
             """)
             connection.execute(
                 insert_query,
                 {
-                    "uuid": str(uuid.uuid4()),
+                    "uuid": make_key("ERP_CUSTOMERS_CONTACTS", account_id, email),
                     "contactPersonId": contact_person_id,
                     "customerId": customer_id,
                     "crmBpNo": account_id,
@@ -142,19 +181,35 @@ def register_contact_as_erp(
                     "status": status,
                     "createdAt": now_utc,
                     "lastModified": now_utc,
+                    "rowHash": row_hash,
                 },
             )
 
-            logger.info(
+            record_log.info(
                 "✅ Registered new ERP contact: %s %s (Account=%s → ContactID=%s)",
                 first_name, last_name, account_id, contact_person_id
             )
 
-        # Log CloudEvent trigger condition 
-            logger.info(
-                "🟢 Send all users to main id store "
-                "and the logic there will check whether "
-                "a S user should be created, disabled, or enabled. based on cshmeFlag and status"
-            )
+        # 🟢 ID-store event in the same transaction (drained by dispatch_outbox); the
+        # ID store decides whether an S user is created, disabled or enabled,
+        # based on cshmeFlag and status
+        add_outbox_event(
+            connection, schema,
+            CONTACT_UPDATED if existing else CONTACT_REGISTERED,
+            contact_person_id, account_id,
+            {
+                "contactId": contact_id,
+                "customerId": customer_id,
+                "firstName": first_name,
+                "lastName": last_name,
+                "email": email,
+                "department": department,
+                "country": country,
+                "cshmeFlag": cshme_flag,
+                "phoneNo": phone_no,
+                "status": status,
+            },
+            now_utc,
+        )
 
     return contact_person_id
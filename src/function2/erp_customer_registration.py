@@ -1,16 +1,26 @@
 import os
-import uuid
 import logging
 from datetime import datetime
 from sqlalchemy import text
 from db_connection import get_hana_client
 from id_generation import generate_sequential_id
+from log_sampling import RecordLogger
+from row_hash import compute_row_hash
+from key_generation import make_key
 
 logger = logging.getLogger(__name__)
 logging.basicConfig(level=logging.INFO)
 
+# Business fields covered by rowHash
+ERP_CUSTOMER_HASH_FIELDS = ("name", "status")
 
-def register_company_as_customer(account_id: int, account_name: str, status: str):
+
+def customer_record_log() -> RecordLogger:
+    """Per-record logger (LOG_MODE=sampled) for the registrations of one load, see RecordLogger."""
+    return RecordLogger(logger, "ERP customer")
+
+
+def register_company_as_customer(account_id: int, account_name: str, status: str, record_log=None):
     """
     Register or update a CRM company as an ERP customer.
 
@@ -21,31 +31,44 @@ def register_company_as_customer(account_id: int, account_name: str, status: str
     - Adds created and lastModified timestamps:
         * created → set when first inserted, never changes.
         * lastModified → updated each insert/update.
+    - Skips the update when rowHash shows that name and status are unchanged.
+    - Per-record lines go through record_log (one customer_record_log() per load;
+      a new one per call if not given).
     """
     schema = os.getenv("HANA_SCHEMA")
     if not schema:
         raise ValueError("Environment variable HANA_SCHEMA is not set.")
 
     engine = get_hana_client()
+    record_log = record_log or customer_record_log()
     now_utc = datetime.utcnow()
+    row_hash = compute_row_hash({"name": account_name, "status": status}, ERP_CUSTOMER_HASH_FIELDS)
 
     with engine.begin() as connection:
         # 🔹 Check if the CRM account already exists
         existing_query = text(f"""
-            SELECT customerId, created
+            SELECT customerId, created, rowHash
             FROM {schema}.SPUSER_STAGING_ERP_CUSTOMERS
             WHERE crmBpNo = :account_id
         """)
         existing = connection.execute(existing_query, {"account_id": account_id}).fetchone()
 
         if existing:
+            existing_customer_id, created, existing_hash = existing
+            if existing_hash == row_hash:
+                record_log.info(
+                    "⏭️ ERP customer unchanged (accountId=%s, customerId=%s)",
+                    account_id, existing_customer_id
+                )
+                return existing_customer_id
+
             # 🔄 Update existing record
-            existing_customer_id, created = existing
             update_query = text(f"""
                 UPDATE {schema}.SPUSER_STAGING_ERP_CUSTOMERS
                 SET name = :name,
                     status = :status,
-                    lastModified = :lastModified
+                    lastModified = :lastModified,
+                    rowHash = :rowHash
                 WHERE crmBpNo = :crmBpNo
             """)
             connection.execute(
@@ -54,10 +77,11 @@ def register_company_as_customer(account_id: int, account_name: str, status: str
                     "name": account_name,
                     "status": status,
                     "lastModified": now_utc,
+                    "rowHash": row_hash,
                     "crmBpNo": account_id,
                 },
             )
-            logger.info(
+            record_log.info(
                 "🔁 Updated ERP customer (accountId=%s, customerId=%s, status=%s, lastModified=%s)",
                 account_id, existing_customer_id, status, now_utc
             )
@@ -70,27 +94,29 @@ def register_company_as_customer(account_id: int, account_name: str, status: str
         customer_id = generate_sequential_id(
             id_type="customerId",
             start_range=start,
-            end_range=end
+            end_range=end,
+            record_log=record_log,
         )
 
         insert_query = text(f"""
             INSERT INTO {schema}.SPUSER_STAGING_ERP_CUSTOMERS
-            (uuid, customerId, name, crmBpNo, status, created, lastModified)
-            VALUES (:uuid, :customerId, :name, :crmBpNo, :status, :created, :lastModified)
+            (uuid, customerId, name, crmBpNo, status, created, lastModified, rowHash)
+            VALUES (:uuid, :customerId, :name, :crmBpNo, :status, :created, :lastModified, :rowHash)
         """)
         connection.execute(
             insert_query,
             {
-                "uuid": str(uuid.uuid4()),
+                "uuid": make_key("ERP_CUSTOMERS", account_id),
                 "customerId": customer_id,
                 "name": account_name,
                 "crmBpNo": account_id,
                 "status": status,
                 "created": now_utc,
                 "lastModified": now_utc,
+                "rowHash": row_hash,
             },
         )
-        logger.info(
+        record_log.info(
             "✅ Registered new ERP customer (accountId=%s → customerId=%s, status=%s, created=%s)",
             account_id, customer_id, status, now_utc
         )
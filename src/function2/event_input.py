@@ -0,0 +1,78 @@
+import io
+import gzip
+import base64
+from typing import Any, Dict, Iterator, List, Sequence, Union
+import json_codec
+
+GZIP_MAGIC = b"\x1f\x8b"
+
+
+def has_input(event: Any, keys: Sequence[str]) -> bool:
+    """True if the event carries input records under any of keys (instead of the bundled files)."""
+    return isinstance(event, dict) and any(event.get(key) is not None for key in keys)
+
+
+def open_payload(payload: Union[str, bytes], base64_encoded: bool = False) -> io.BufferedIOBase:
+    """
+    Binary stream over an event payload: base64-decoded if base64_encoded,
+    gunzipped on the fly if it starts with the gzip magic bytes.
+    """
+    data = payload.encode("utf-8") if isinstance(payload, str) else bytes(payload)
+    if base64_encoded:
+        data = base64.b64decode(data)
+    stream = io.BytesIO(data)
+    if data[:2] == GZIP_MAGIC:
+        return gzip.GzipFile(fileobj=stream, mode="rb")
+    return stream
+
+
+def iter_records(payload: Any, base64_encoded: bool = False) -> Iterator[Dict[str, Any]]:
+    """
+    Records of one event payload:
+    - a list of records (already parsed by the platform),
+    - a JSON array (parsed as one document), or
+    - NDJSON, one record per line (decompressed and parsed line by line).
+    Any other payload (e.g. a single dict) raises ValueError.
+    """
+    if isinstance(payload, list):
+        yield from payload
+        return
+    if not isinstance(payload, (str, bytes, bytearray)):
+        raise ValueError(
+            f"Unsupported event payload of type {type(payload).__name__}: expected a list of "
+            "records or a JSON array / NDJSON string or bytes (optionally gzipped / base64)"
+        )
+
+    stream = open_payload(payload, base64_encoded)
+    lines = iter(stream)
+    for line in lines:
+        if line.strip():
+            break
+    else:
+        return  # empty payload
+
+    if line.lstrip().startswith(b"["):
+        yield from json_codec.loads(line + stream.read())
+        return
+    yield json_codec.loads(line)
+    for line in lines:
+        if line.strip():
+            yield json_codec.loads(line)
+
+
+def read_records(event: Dict[str, Any], key: str) -> Iterator[Dict[str, Any]]:
+    """
+    Records of event[key] as a lazy stream (empty if the event does not carry
+    that key); the handlers read it in input batches (see batching.batched).
+    String payloads are base64-decoded when event["isBase64Encoded"] is set.
+    """
+    payload = event.get(key)
+    if payload is None:
+        return iter(())
+    return iter_records(payload, bool(event.get("isBase64Encoded")))
+
+
+def read_file(path: str) -> List[Dict[str, Any]]:
+    """Records of a bundled JSON input file."""
+    with open(path, "rb") as f:
+        return json_codec.load(f)
@@ -1,45 +1,295 @@
 import os
-import json
-from db_operation_company import insert_or_update_company
-from db_operation_contact import insert_or_update_contact
+import tempfile
+from functools import partial
+from itertools import islice
+from typing import Any, Dict, List, Optional, Set, Tuple
+from profiling import profile_invocation
 
+# Feature modules are imported in the branch of the mode that needs them,
+# keeping the cold-start import path of every mode to its own dependencies
 
+
+def get_handler_mode(event) -> str:
+    """
+    Run mode from event["mode"] or HANDLER_MODE: "load" (default), "reconcile",
+    "backfill", "dispatch" (drain the ID-store outbox), "queue" or "reprocess"
+    (only the records of the dead-letter file).
+    """
+    mode = event.get("mode") if isinstance(event, dict) else None
+    return (mode or os.getenv("HANDLER_MODE", "load")).strip().lower()
+
+
+def failed_account_ids(result: Dict[str, Any]) -> Optional[Set[Any]]:
+    """
+    accountIds of the failed company records of a loader result (empty if none
+    failed): its "failed_keys" if the loader wrote its failures to the dead-letter
+    file, else taken from the "failed" list.
+    Returns None if a failure cannot be tied to an account, in which case
+    no contact can be loaded safely.
+    """
+    if "failed_keys" in result:
+        keys = result["failed_keys"]
+        return None if keys is None else set(keys)
+    account_ids = set()
+    for failure in result.get("failed") or []:
+        company = failure.get("company")
+        if not isinstance(company, dict):
+            return None
+        if company.get("accountId") is not None:
+            account_ids.add(company["accountId"])
+    return account_ids
+
+
+def defer_contacts(
+    contacts: List[Dict[str, Any]], failed_accounts: Set[Any]
+) -> Tuple[List[Dict[str, Any]], List[Dict[str, Any]]]:
+    """
+    Split contacts into the ones to load and the ones deferred because their
+    account failed in the company stage (reported as {"contact", "error"}).
+    """
+    if not failed_accounts:
+        return contacts, []
+    ready, deferred = [], []
+    for contact in contacts:
+        if contact.get("accountId") in failed_accounts:
+            deferred.append({
+                "contact": contact,
+                "error": f"Deferred: account {contact.get('accountId')} failed in the company stage",
+                "error_class": "Deferred",
+            })
+        else:
+            ready.append(contact)
+    return ready, deferred
+
+
+@profile_invocation("crm_handler")
 def main(event, context):
     base_dir = os.path.dirname(__file__)
 
+    # --- CRM ↔ ERP reconciliation instead of a file load ---
+    if get_handler_mode(event) == "reconcile":
+        from reconciliation import reconcile
+        repair = event.get("repair", True) if isinstance(event, dict) else True
+        result = reconcile(repair=repair)
+        print(f"🔍 Reconciliation Result: {result}")
+        return
+
+    # --- Standalone erpNo / erpContactPerson back-fill ---
+    if get_handler_mode(event) == "backfill":
+        from backfill import backfill_erp_ids
+        result = backfill_erp_ids()
+        print(f"🔁 Back-fill Result: {result}")
+        return
+
+    # --- ID-store propagation: drain the outbox written by the ERP contact loads ---
+    if get_handler_mode(event) == "dispatch":
+        from id_store_outbox import dispatch_outbox
+        result = dispatch_outbox()
+        print(f"📤 Outbox Dispatch Result: {result}")
+        return
+
+    # --- Load, queue and reprocess modes ---
+    from batching import batched, get_input_batch_size, nonempty
+    from db_operation_company import initial_load_companies, insert_or_update_company
+    from db_operation_contact import initial_load_contacts, insert_or_update_contact
+    from dead_letter import DeadLetterFile, spill_failures
+    from deadline import Checkpoint, Deadline, EventCheckpoint, resume_offset
+    from event_input import has_input, read_file, read_records
+    from load_journal import is_journal_enabled, load_in_batches, load_with_journal
+    from sharding import get_shard, iter_shard
+    from staging_load import is_initial_load
+
+    # LOAD_MODE=initial → staging-table bulk load with set-based MERGE
+    if is_initial_load():
+        load_companies, load_contacts = initial_load_companies, initial_load_contacts
+    else:
+        load_companies, load_contacts = insert_or_update_company, insert_or_update_contact
+
+    # SHARD_INDEX / SHARD_COUNT → only accounts (and their contacts) of this shard;
+    # shards run in parallel, ERP ids come from the row-locked counter (id_generation)
+    shard = get_shard(event)
+
     # File paths
     company_file_path = os.path.join(base_dir, "company_data.json")
     contact_file_path = os.path.join(base_dir, "contact_data.json")
 
-    # --- Step 1: Process Company Data ---
-    with open(company_file_path, "r") as f:
-        company_data = json.load(f)
+    # Records sent in the event (event["companies"] / event["contacts"]: lists, JSON
+    # arrays or NDJSON, optionally gzipped / base64) replace the bundled files
+    from_event = has_input(event, ("companies", "contacts"))
+
+    def read_input(key, path):
+        # Event records are a stream, read in batches of INPUT_BATCH_SIZE (see batching.batched)
+        return read_records(event, key) if from_event else read_file(path)
+
+    # Loaders write failed records to the dead-letter file as they happen, results only keep a sample
+    dead_letters = DeadLetterFile.from_env(os.path.join(tempfile.gettempdir(), "crm_dead_letters.ndjson"))
+
+    # --- Queue mode: batches in a local SQLite queue, drained by worker processes ---
+    if get_handler_mode(event) == "queue":
+        from work_queue import StageInput, WorkQueue, produce_and_drain
+        inputs = []
+        for key, path, load, name in (
+            ("companies", company_file_path, load_companies, "company"),
+            ("contacts", contact_file_path, load_contacts, "contact"),
+        ):
+            records = iter_shard(read_input(key, path), lambda record: record.get("accountId"), shard)
+            inputs.append(StageInput(f"{load.__module__}:{load.__name__}", records, name, "accountId"))
+
+        queue = WorkQueue.from_env(os.path.join(tempfile.gettempdir(), "crm_work_queue.sqlite"))
+        try:
+            # Contacts are the second stage: they start once all company batches are finished,
+            # contacts of failed accounts (failed records or dead batches) are deferred
+            result = produce_and_drain(
+                queue, inputs, int(os.getenv("QUEUE_BATCH_SIZE", 500)), dead_letters=dead_letters
+            )
+        finally:
+            queue.close()
+        print(f"📦 Queue Result: {result}")
+        return
+
+    # Time budget (context / TIME_BUDGET_SECONDS): a load stopped by it saves a
+    # checkpoint (stage + offset into that stage's shard-filtered input) and the
+    # next invocation resumes there (event input: the caller resends the event
+    # with the returned position as "resume")
+    reprocess = get_handler_mode(event) == "reprocess"
+    deadline = Deadline.from_context(context)
+    budget = {"deadline": deadline} if deadline.is_limited and not (is_initial_load() or reprocess) else {}
+    checkpoint = EventCheckpoint(event) if from_event else Checkpoint.from_env(os.path.join(
+        tempfile.gettempdir(), f"crm_checkpoint_{shard.index}_of_{shard.count}.json"
+    ))
+    position = None if reprocess else checkpoint.load()
+
+    # LOAD_JOURNAL=1 → already applied inputs / batches are skipped (see load_journal);
+    # the journal then finds the resume batch, the checkpoint only keeps the failed accounts
+    if is_journal_enabled() and not reprocess:
+        load_companies = partial(load_with_journal, load_companies, stage="company")
+        load_contacts = partial(load_with_journal, load_contacts, stage="contact")
+        if position:
+            position = {"stage": "company", "offset": 0, "failed_accounts": position["failed_accounts"]}
+    if position:
+        print(f"⏯️ Resuming {position['stage']} stage at record {position['offset']} from {checkpoint.path}")
 
-    if company_data:
+    # --- Reprocess mode: load only the records of the dead-letter file ---
+    if reprocess:
+        pending = dead_letters.take(("company", "contact"))
+        company_data, contact_data = pending["company"], pending["contact"]
+        print(
+            f"♻️ Reprocessing {len(company_data)} company and "
+            f"{len(contact_data)} contact record(s) from {dead_letters.reprocessing_path}"
+        )
+    elif position and position["stage"] == "contact":
+        company_data = []  # company stage finished in an earlier invocation
+    else:
+        # --- Step 1: Process Company Data ---
+        company_data = read_input("companies", company_file_path)
+        if shard.is_sharded:
+            company_data = iter_shard(company_data, lambda company: company.get("accountId"), shard)
+            print(f"🔀 Shard {shard}: loading the company records of its accounts")
+        if position:
+            company_data = islice(company_data, position["offset"], None)
+
+    # None: a company failure could not be tied to an account (checkpointed as null)
+    failed_accounts = set()
+    if position and position["failed_accounts"] is None:
+        failed_accounts = None
+    elif position:
+        failed_accounts = set(position["failed_accounts"])
+    input_batch_size = get_input_batch_size()
+    company_data = nonempty(company_data)
+    if company_data is not None:
         print("Starting company data insertion...")
-        result_company = insert_or_update_company(company_data)
+        result_company = load_in_batches(
+            load_companies, batched(company_data, input_batch_size), dead_letters=dead_letters, **budget
+        )
+
+        # Check for failed company inserts: contacts of those accounts are deferred
+        failed_ids = failed_account_ids(result_company)
+        failed_accounts = None if failed_ids is None or failed_accounts is None else failed_accounts | failed_ids
+        result_company = spill_failures(result_company, "company", dead_letters)
         print(f"✅ Company DB Operation Result: {result_company}")
-        print("Company data insertion completed successfully.\n")
 
-        # Check for failed company inserts
-        if result_company.get("failed"):
-            print(
-                "❌ Some company inserts/updates failed. "
-                "Skipping contact data insertion."
+        if result_company.get("continue"):
+            offset = (position["offset"] if position else 0) + result_company["next_offset"]
+            saved = checkpoint.save(
+                stage="company", offset=offset,
+                failed_accounts=None if failed_accounts is None else sorted(failed_accounts, key=str),
             )
-            return
-    else:
+            print(f"⏸️ Time budget exhausted — company load continues at record {offset}")
+            return {"continue": True, "checkpoint": saved}
+        print("Company data insertion completed successfully.\n")
+    elif not reprocess and not position and not from_event:
         print("⚠️ No company data found in company_data.json\n")
         return  # skip contact insertion if no company data
 
+    if failed_accounts is None:
+        print(
+            "❌ Some company inserts/updates failed. "
+            "Skipping contact data insertion."
+        )
+        if reprocess:
+            # Back to the dead-letter file for the next reprocessing run
+            dead_letters.write("contact", defer_contacts(
+                contact_data, {contact.get("accountId") for contact in contact_data}
+            )[1])
+            dead_letters.done()
+        else:
+            checkpoint.clear()
+        return
+
     # --- Step 2: Process Contact Data ---
-    with open(contact_file_path, "r") as f:
-        contact_data = json.load(f)
+    if not reprocess:
+        contact_data = read_input("contacts", contact_file_path)
+        if shard.is_sharded:
+            # Sharded by accountId as well, so contacts run with their company
+            contact_data = iter_shard(contact_data, lambda contact: contact.get("accountId"), shard)
+            print(f"🔀 Shard {shard}: loading the contact records of its accounts")
 
-    if contact_data:
+    contact_offset = position["offset"] if position and position["stage"] == "contact" else 0
+    if contact_offset:
+        # Contacts before the offset (deferred ones too) were handled by earlier invocations
+        contact_data = islice(contact_data, contact_offset, None)
+
+    def load_ready_contacts(contacts, **options):
+        # Contacts of failed accounts are deferred batch by batch; the resume offset of
+        # a stopped load is mapped back to this batch, later deferrals come with it
+        ready, deferred = defer_contacts(contacts, failed_accounts)
+        if not ready:
+            return {"failed": [], "deferred": deferred}
+        result = load_contacts(ready, **options)
+        if result.get("continue"):
+            processed = result["next_offset"]
+            result["next_offset"] = resume_offset(
+                [index for index, contact in enumerate(contacts) if contact.get("accountId") not in failed_accounts],
+                processed, len(contacts),
+            )
+            deferred = deferred[:result["next_offset"] - processed]
+        return {**result, "deferred": deferred}
+
+    contact_data = nonempty(contact_data)
+    if contact_data is not None:
         print("Starting contact data insertion...")
-        result_contact = insert_or_update_contact(contact_data)
+        result_contact = load_in_batches(
+            load_ready_contacts, batched(contact_data, input_batch_size), dead_letters=dead_letters, **budget
+        )
+        if result_contact.get("deferred"):
+            print(
+                f"⏸️ Deferred {len(result_contact['deferred'])} contact(s) of failed accounts "
+                f"{sorted(failed_accounts, key=str)}"
+            )
+        result_contact = spill_failures(result_contact, "contact", dead_letters, keys=("failed", "deferred"))
         print(f"✅ Contact DB Operation Result: {result_contact}")
+
+        if result_contact.get("continue"):
+            offset = contact_offset + result_contact["next_offset"]
+            saved = checkpoint.save(stage="contact", offset=offset, failed_accounts=sorted(failed_accounts, key=str))
+            print(f"⏸️ Time budget exhausted — contact load continues at record {offset}")
+            return {"continue": True, "checkpoint": saved}
         print("Contact data insertion completed successfully.")
-    else:
+    elif not reprocess:
         print("⚠️ No contact data found in contact_data.json")
+
+    if reprocess:
+        dead_letters.done()
+    else:
+        checkpoint.clear()
+    return {"continue": False}
@@ -1,18 +1,29 @@
 import os
 import logging
 from sqlalchemy import text
+from sqlalchemy.exc import IntegrityError
 from db_connection import get_hana_client
+from log_sampling import RecordLogger
 
 logger = logging.getLogger(__name__)
 logging.basicConfig(level=logging.INFO)
 
 
-def generate_sequential_id(id_type: str, start_range: int, end_range: int) -> str:
+# Last allocated ID per id_type (see generate_sequential_id)
+COUNTER_TABLE = "SPUSER_STAGING_ID_COUNTERS"
+
+
+def generate_sequential_id(id_type: str, start_range: int, end_range: int, record_log=None) -> str:
     """
     Generate a sequential, unique ID for a given ID type (customerId/contactPersonId).
-    - Reads the max existing ID from the relevant table
-    - Increments by 1 (starting from start_range if no rows exist)
+    - Increments the id_type's row of the counter table (SPUSER_STAGING_ID_COUNTERS)
+      and reads it back in one transaction: the UPDATE locks the row, so concurrent
+      workers and shards never receive the same ID
+    - Seeds the counter from the max existing ID of the relevant table (start_range
+      if no rows exist); a concurrent seed fails on the primary key and is retried
     - Ensures the generated ID does not exceed the defined end_range
+    - An ID is consumed when allocated: a registration that fails afterwards leaves a gap
+    - Logs through the caller's record_log (sampled with its registration lines)
     """
 
     schema = os.getenv("HANA_SCHEMA")
@@ -20,6 +31,7 @@ def generate_sequential_id(id_type: str, start_range: int, end_range: int) -> st
         raise ValueError("Environment variable HANA_SCHEMA is not set.")
 
     engine = get_hana_client()
+    record_log = record_log or RecordLogger(logger, "ID generation")
 
     # Decide target table and column based on id_type
     if id_type == "customerId":
@@ -31,24 +43,51 @@ def generate_sequential_id(id_type: str, start_range: int, end_range: int) -> st
     else:
         raise ValueError(f"Unsupported id_type: {id_type}")
 
-    with engine.begin() as connection:
-        # Get max existing ID from the table
-        query = text(f"SELECT MAX({column}) FROM {table}")
-        result = connection.execute(query).fetchone()
-        max_id = result[0]
+    for attempt in range(2):
+        try:
+            with engine.begin() as connection:
+                next_id = allocate_id(connection, schema, id_type, table, column, start_range)
+
+                # Check range validity (rolls the increment back)
+                if next_id > end_range:
+                    raise ValueError(f"{id_type} exceeded maximum range ({end_range})")
+            break
+        except IntegrityError:
+            # Another process seeded the counter first: its row now exists
+            if attempt:
+                raise
+            logger.info("Counter for %s was seeded concurrently, retrying", id_type)
+
+    record_log.info("Generated new %s: %s", id_type, next_id)
+    return str(next_id)
 
-        if max_id is None:
+
+def allocate_id(connection, schema: str, id_type: str, table: str, column: str, start_range: int) -> int:
+    """Next ID of id_type from the counter table, seeding its row on first use."""
+    counter = f"{schema}.{COUNTER_TABLE}"
+    params = {"idType": id_type}
+    connection.execute(
+        text(f"UPDATE {counter} SET lastValue = lastValue + 1 WHERE idType = :idType"), params
+    )
+    row = connection.execute(
+        text(f"SELECT lastValue FROM {counter} WHERE idType = :idType"), params
+    ).fetchone()
+    if row is not None:
+        return int(row[0])
+
+    # First ID of this type: continue after the max existing ID
+    max_id = connection.execute(text(f"SELECT MAX({column}) FROM {table}")).fetchone()[0]
+    if max_id is None:
+        next_id = start_range
+    else:
+        try:
+            next_id = int(max_id) + 1
+        except ValueError:
+            logger.warning(f"Invalid {column} value found in {table}: {max_id}")
             next_id = start_range
-        else:
-            try:
-                next_id = int(max_id) + 1
-            except ValueError:
-                logger.warning(f"Invalid {column} value found in {table}: {max_id}")
-                next_id = start_range
-
-        # Check range validity
-        if next_id > end_range:
-            raise ValueError(f"{id_type} exceeded maximum range ({end_range})")
-
-        logger.info(f"Generated new {id_type}: {next_id}")
-        return str(next_id)
+
+    connection.execute(
+        text(f"INSERT INTO {counter} (idType, lastValue) VALUES (:idType, :lastValue)"),
+        {**params, "lastValue": next_id},
+    )
+    return next_id
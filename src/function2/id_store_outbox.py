@@ -0,0 +1,205 @@
+import os
+import uuid
+import logging
+import urllib.request
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Sequence
+from sqlalchemy import text
+from db_connection import get_hana_client
+import json_codec
+
+logger = logging.getLogger(__name__)
+logging.basicConfig(level=logging.INFO)
+
+OUTBOX_TABLE = "SPUSER_STAGING_ID_STORE_OUTBOX"
+
+# Event types written by register_contact_as_erp
+CONTACT_REGISTERED = "erp.contact.registered"
+CONTACT_UPDATED = "erp.contact.updated"
+
+DEFAULT_BATCH_SIZE = 100
+DEFAULT_MAX_ATTEMPTS = 5
+
+
+def add_outbox_event(
+    connection, schema: str, event_type: str, contact_person_id: Any,
+    crm_bp_no: Any, payload: Dict[str, Any], created_at: datetime,
+) -> str:
+    """
+    Insert one ID-store event into the outbox on the caller's connection, so it
+    commits or rolls back together with the ERP contact change. Returns its id.
+    """
+    event_id = str(uuid.uuid4())
+    connection.execute(
+        text(f"""
+            INSERT INTO {schema}.{OUTBOX_TABLE} (
+                uuid, eventType, contactPersonId, crmBpNo, payload, createdAt, attempts
+            )
+            VALUES (
+                :uuid, :eventType, :contactPersonId, :crmBpNo, :payload, :createdAt, 0
+            )
+        """),
+        {
+            "uuid": event_id,
+            "eventType": event_type,
+            "contactPersonId": contact_person_id,
+            "crmBpNo": crm_bp_no,
+            "payload": json_codec.dumps(payload),
+            "createdAt": created_at,
+        },
+    )
+    return event_id
+
+
+class FileSink:
+    """Appends dispatched events to an NDJSON file (ID_STORE_SINK_PATH)."""
+
+    def __init__(self, path: str):
+        self.path = os.path.abspath(path)
+
+    def send(self, events: Sequence[Dict[str, Any]]) -> None:
+        with open(self.path, "a", encoding="utf-8") as f:
+            f.write("".join(json_codec.dumps(event) + "\n" for event in events))
+
+
+class HttpSink:
+    """POSTs each batch as {"events": [...]} to the ID store (ID_STORE_URL); non-2xx raises."""
+
+    def __init__(self, url: str, timeout: float = 10.0):
+        self.url = url
+        self.timeout = timeout
+
+    def send(self, events: Sequence[Dict[str, Any]]) -> None:
+        request = urllib.request.Request(
+            self.url,
+            data=json_codec.dumps({"events": list(events)}).encode("utf-8"),
+            headers={"Content-Type": "application/json"},
+            method="POST",
+        )
+        with urllib.request.urlopen(request, timeout=self.timeout) as response:
+            response.read()
+
+
+def get_sink():
+    """
+    Sink of the dispatcher from ID_STORE_SINK: "file" (default, ID_STORE_SINK_PATH,
+    default id_store_events.ndjson) or "http" (ID_STORE_URL, ID_STORE_TIMEOUT_SECONDS).
+    """
+    kind = os.getenv("ID_STORE_SINK", "file").strip().lower()
+    if kind == "file":
+        return FileSink(os.getenv("ID_STORE_SINK_PATH", "id_store_events.ndjson"))
+    if kind == "http":
+        url = os.getenv("ID_STORE_URL")
+        if not url:
+            raise ValueError("ID_STORE_URL is not set.")
+        return HttpSink(url, float(os.getenv("ID_STORE_TIMEOUT_SECONDS", 10)))
+    raise ValueError(f"Unsupported ID_STORE_SINK: {kind}")
+
+
+def fetch_pending(connection, schema: str, batch_size: int, max_attempts: int) -> List[Dict[str, Any]]:
+    """Oldest undispatched events with attempts left, as sink messages."""
+    rows = connection.execute(
+        text(f"""
+            SELECT uuid, eventType, contactPersonId, crmBpNo, payload, createdAt
+            FROM {schema}.{OUTBOX_TABLE}
+            WHERE dispatchedAt IS NULL AND attempts < :max_attempts
+            ORDER BY createdAt, uuid
+            LIMIT {int(batch_size)}
+        """),
+        {"max_attempts": max_attempts},
+    ).fetchall()
+    return [
+        {
+            "eventId": row.uuid,
+            "eventType": row.eventType,
+            "contactPersonId": row.contactPersonId,
+            "crmBpNo": row.crmBpNo,
+            "data": json_codec.loads(row.payload),
+            "createdAt": row.createdAt,
+        }
+        for row in rows
+    ]
+
+
+def dispatch_outbox(
+    sink=None,
+    batch_size: Optional[int] = None,
+    max_attempts: Optional[int] = None,
+    max_batches: Optional[int] = None,
+) -> Dict[str, int]:
+    """
+    Drain the outbox to the sink in batches (OUTBOX_BATCH_SIZE, default 100).
+    - A batch is marked dispatched only after the sink accepted it
+      (at-least-once: consumers deduplicate by eventId).
+    - A failed batch counts one attempt for each of its events and stops this
+      run; events that failed max_attempts times (OUTBOX_MAX_ATTEMPTS, default 5)
+      stay in the table with lastError and are no longer picked up.
+    Returns dispatched / failed_batches / pending / dead counts.
+    """
+    schema = os.getenv("HANA_SCHEMA")
+    if not schema:
+        raise ValueError("HANA_SCHEMA is not set.")
+
+    sink = sink or get_sink()
+    batch_size = max(1, batch_size or int(os.getenv("OUTBOX_BATCH_SIZE", DEFAULT_BATCH_SIZE)))
+    max_attempts = max_attempts or int(os.getenv("OUTBOX_MAX_ATTEMPTS", DEFAULT_MAX_ATTEMPTS))
+    engine = get_hana_client()
+    dispatched = 0
+    failed_batches = 0
+    batches = 0
+
+    while max_batches is None or batches < max_batches:
+        with engine.begin() as connection:
+            events = fetch_pending(connection, schema, batch_size, max_attempts)
+        if not events:
+            break
+        batches += 1
+        event_ids = [{"uuid": event["eventId"]} for event in events]
+
+        try:
+            sink.send(events)
+        except Exception as e:
+            logger.exception("Dispatching %d outbox event(s) failed: %s", len(events), e)
+            with engine.begin() as connection:
+                connection.execute(
+                    text(f"""
+                        UPDATE {schema}.{OUTBOX_TABLE}
+                        SET attempts = attempts + 1, lastError = :lastError
+                        WHERE uuid = :uuid
+                    """),
+                    [{**event_id, "lastError": f"{type(e).__name__}: {e}"[:1000]} for event_id in event_ids],
+                )
+            failed_batches += 1
+            break
+
+        with engine.begin() as connection:
+            connection.execute(
+                text(f"""
+                    UPDATE {schema}.{OUTBOX_TABLE}
+                    SET dispatchedAt = :dispatchedAt, attempts = attempts + 1, lastError = NULL
+                    WHERE uuid = :uuid
+                """),
+                [{**event_id, "dispatchedAt": datetime.utcnow()} for event_id in event_ids],
+            )
+        dispatched += len(events)
+
+    with engine.begin() as connection:
+        pending, dead = connection.execute(
+            text(f"""
+                SELECT
+                    SUM(CASE WHEN attempts < :max_attempts THEN 1 ELSE 0 END),
+                    SUM(CASE WHEN attempts >= :max_attempts THEN 1 ELSE 0 END)
+                FROM {schema}.{OUTBOX_TABLE}
+                WHERE dispatchedAt IS NULL
+            """),
+            {"max_attempts": max_attempts},
+        ).fetchone()
+
+    summary = {
+        "dispatched": dispatched,
+        "failed_batches": failed_batches,
+        "pending": int(pending or 0),
+        "dead": int(dead or 0),
+    }
+    logger.info("Outbox Dispatch Summary: %s", summary)
+    return summary
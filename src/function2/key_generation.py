@@ -0,0 +1,82 @@
+import os
+import uuid
+import logging
+from typing import Any, Optional, Sequence
+from sqlalchemy import text
+
+logger = logging.getLogger(__name__)
+logging.basicConfig(level=logging.INFO)
+
+# Fixed namespace for UUIDv5 keys — never change it, or replays stop matching stored keys
+KEY_NAMESPACE = uuid.uuid5(uuid.NAMESPACE_URL, "urn:spuser-staging")
+
+
+def is_deterministic_keys_enabled() -> bool:
+    """DETERMINISTIC_KEYS=1 derives primary keys from business keys (UUIDv5)."""
+    return os.getenv("DETERMINISTIC_KEYS", "").strip().lower() in ("1", "true", "yes")
+
+
+def deterministic_key(entity: str, *business_key: Any) -> str:
+    """UUIDv5 over the entity name and its business key, e.g. ("P_USERS", "P123")."""
+    name = entity + ":" + "|".join(str(part) for part in business_key)
+    return str(uuid.uuid5(KEY_NAMESPACE, name))
+
+
+def make_key(entity: str, *business_key: Any) -> str:
+    """
+    Primary key for a new row.
+    - DETERMINISTIC_KEYS=1 → UUIDv5 from entity + business key, so replays
+      produce the same key and rows can be upserted by primary key.
+    - Otherwise → random UUIDv4 (default).
+    """
+    if is_deterministic_keys_enabled():
+        return deterministic_key(entity, *business_key)
+    return str(uuid.uuid4())
+
+
+def upsert_statement(
+    connection,
+    table: str,
+    columns: Sequence[str],
+    key_column: str = "uuid",
+    update_columns: Optional[Sequence[str]] = None,
+):
+    """
+    Single-statement insert-or-update for the active dialect.
+    Only the listed columns are written, other columns of existing rows are kept.
+    - Without update_columns, existing rows get all listed columns, matched by
+      primary key: UPSERT ... WITH PRIMARY KEY (hana), INSERT ... ON CONFLICT (sqlite).
+    - With update_columns, existing rows matched by key_column only get those
+      columns (insert-only columns such as created keep their stored value), and
+      only if their rowHash differs when rowHash is among them:
+      MERGE INTO (hana), INSERT ... ON CONFLICT ... DO UPDATE ... WHERE (sqlite).
+    """
+    column_list = ", ".join(columns)
+    values = ", ".join(f":{column}" for column in columns)
+    dialect = connection.dialect.name
+    by_primary_key = update_columns is None
+    if by_primary_key:
+        update_columns = [column for column in columns if column != key_column]
+    changed_only = "rowHash" in update_columns and not by_primary_key
+
+    if dialect == "hana":
+        if by_primary_key:
+            return text(f"UPSERT {table} ({column_list}) VALUES ({values}) WITH PRIMARY KEY")
+        source = ", ".join(f":{column} AS {column}" for column in columns)
+        condition = " AND (t.rowHash IS NULL OR t.rowHash <> s.rowHash)" if changed_only else ""
+        return text(
+            f"MERGE INTO {table} t USING (SELECT {source} FROM DUMMY) s "
+            f"ON t.{key_column} = s.{key_column} "
+            f"WHEN MATCHED{condition} THEN UPDATE SET "
+            + ", ".join(f"t.{column} = s.{column}" for column in update_columns)
+            + f" WHEN NOT MATCHED THEN INSERT ({column_list}) "
+            f"VALUES ({', '.join(f's.{column}' for column in columns)})"
+        )
+    if dialect == "sqlite":
+        assignments = ", ".join(f"{column} = excluded.{column}" for column in update_columns)
+        condition = " WHERE rowHash IS NULL OR rowHash <> excluded.rowHash" if changed_only else ""
+        return text(
+            f"INSERT INTO {table} ({column_list}) VALUES ({values}) "
+            f"ON CONFLICT ({key_column}) DO UPDATE SET {assignments}{condition}"
+        )
+    raise ValueError(f"Upsert is not supported for dialect: {dialect}")
@@ -0,0 +1,139 @@
+import os
+import time
+import uuid
+import logging
+from typing import Any, List, Optional
+from sqlalchemy import event
+
+logger = logging.getLogger(__name__)
+logging.basicConfig(level=logging.INFO)
+
+# Only statements of these kinds are passed to EXPLAIN (no DDL / pragmas)
+EXPLAINABLE_KEYWORDS = ("SELECT", "WITH", "INSERT", "UPDATE", "DELETE", "UPSERT", "MERGE")
+
+
+def get_slow_query_threshold_ms() -> Optional[float]:
+    """Return SLOW_QUERY_THRESHOLD_MS, or None when the slow-query log is disabled."""
+    value = os.getenv("SLOW_QUERY_THRESHOLD_MS")
+    if value is None or value.strip() == "":
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        logger.warning("Invalid SLOW_QUERY_THRESHOLD_MS=%s — slow-query log disabled", value)
+        return None
+
+
+def is_explain_enabled() -> bool:
+    return os.getenv("SLOW_QUERY_EXPLAIN", "").strip().lower() in ("1", "true", "yes")
+
+
+def install_slow_query_log(engine) -> bool:
+    """
+    Attach the slow-query log to an engine when SLOW_QUERY_THRESHOLD_MS is set.
+    - Every statement slower than the threshold is logged with its duration
+      and parameter shape (never the values).
+    - With SLOW_QUERY_EXPLAIN=1 the plan from the active dialect is logged too.
+    Returns True when the listeners were installed.
+    """
+    threshold_ms = get_slow_query_threshold_ms()
+    if threshold_ms is None:
+        return False
+    explain = is_explain_enabled()
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def _start_timer(conn, cursor, statement, parameters, context, executemany):
+        context._query_started = time.perf_counter()
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def _log_if_slow(conn, cursor, statement, parameters, context, executemany):
+        started = getattr(context, "_query_started", None)
+        if started is None:
+            return
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        if elapsed_ms >= threshold_ms:
+            log_slow_query(conn, statement, parameters, executemany, elapsed_ms, explain)
+
+    logger.info(
+        "Slow-query log enabled (threshold=%.1fms, explain=%s)", threshold_ms, explain
+    )
+    return True
+
+
+def log_slow_query(conn, statement: str, parameters, executemany: bool,
+                   elapsed_ms: float, explain: bool) -> None:
+    logger.warning(
+        "🐢 Slow query (%.1fms, params=%s): %s",
+        elapsed_ms,
+        describe_parameters(parameters, executemany),
+        " ".join(statement.split()),
+    )
+    if not explain or not is_explainable(statement):
+        return
+    try:
+        plan = explain_statement(conn, statement, parameters, executemany)
+    except Exception as e:
+        logger.warning("EXPLAIN failed for slow query: %s", e)
+        return
+    logger.warning("🐢 Query plan (%s):\n%s", conn.dialect.name, "\n".join(plan))
+
+
+def describe_parameters(parameters, executemany: bool) -> str:
+    """Describe the shape of bound parameters (names and types, no values)."""
+    if executemany:
+        rows = list(parameters or [])
+        first = describe_parameters(rows[0], False) if rows else "{}"
+        return f"{len(rows)} rows x {first}"
+    if isinstance(parameters, dict):
+        return "{" + ", ".join(
+            f"{key}: {type(value).__name__}" for key, value in parameters.items()
+        ) + "}"
+    if isinstance(parameters, (list, tuple)):
+        return "(" + ", ".join(type(value).__name__ for value in parameters) + ")"
+    return type(parameters).__name__
+
+
+def is_explainable(statement: str) -> bool:
+    words = statement.lstrip().split(None, 1)
+    return bool(words) and words[0].upper() in EXPLAINABLE_KEYWORDS
+
+
+def explain_statement(conn, statement: str, parameters: Any, executemany: bool) -> List[str]:
+    """
+    Return the plan of a statement for the active dialect, one line per operator.
+    - sqlite → EXPLAIN QUERY PLAN
+    - hana → EXPLAIN PLAN into EXPLAIN_PLAN_TABLE (rows are removed afterwards)
+    Runs on a separate DBAPI cursor so no engine events are triggered.
+    """
+    if executemany:
+        parameters = parameters[0] if parameters else ()
+    dialect = conn.dialect.name
+    cursor = conn.connection.cursor()
+    try:
+        if dialect == "sqlite":
+            cursor.execute(f"EXPLAIN QUERY PLAN {statement}", parameters or ())
+            return [f"  {row[-1]}" for row in cursor.fetchall()]
+
+        if dialect == "hana":
+            statement_name = f"SLOWQ_{uuid.uuid4().hex[:16]}"
+            cursor.execute(
+                f"EXPLAIN PLAN SET STATEMENT_NAME = '{statement_name}' FOR {statement}",
+                parameters or (),
+            )
+            cursor.execute(
+                "SELECT OPERATOR_NAME, OPERATOR_DETAILS, TABLE_NAME, OUTPUT_SIZE, SUBTREE_COST "
+                "FROM EXPLAIN_PLAN_TABLE WHERE STATEMENT_NAME = ? ORDER BY OPERATOR_ID",
+                (statement_name,),
+            )
+            rows = cursor.fetchall()
+            cursor.execute(
+                "DELETE FROM EXPLAIN_PLAN_TABLE WHERE STATEMENT_NAME = ?", (statement_name,)
+            )
+            return [
+                f"  {name} {details or ''} table={table} rows={size} cost={cost}"
+                for name, details, table, size, cost in rows
+            ]
+
+        return [f"  EXPLAIN not supported for dialect {dialect}"]
+    finally:
+        cursor.close()
@@ -0,0 +1,235 @@
+import os
+import logging
+from datetime import datetime
+from typing import Any, Dict, List
+from sqlalchemy import text
+from backfill import backfill_erp_contact_person, backfill_erp_no
+from db_connection import get_hana_client
+from erp_customer_registration import ERP_CUSTOMER_HASH_FIELDS, register_company_as_customer
+from erp_contactPerson_registration import ERP_CONTACT_HASH_FIELDS, register_contact_as_erp
+from log_sampling import RecordLogger
+from row_hash import compute_row_hash
+
+logger = logging.getLogger(__name__)
+logging.basicConfig(level=logging.INFO)
+
+ACCOUNT_DRIFT = (
+    "account_missing_erp_customer",   # flagged account without ERP_CUSTOMERS row
+    "account_missing_erp_no",         # ERP customer exists, erpNo is empty
+    "account_erp_no_mismatch",        # erpNo differs from ERP customerId
+    "customer_status_mismatch",       # ERP customer status differs from CRM
+)
+
+CONTACT_DRIFT = (
+    "contact_missing_erp_contact",    # flagged contact without ERP_CUSTOMERS_CONTACTS row
+    "contact_missing_erp_person",     # ERP contact exists, erpContactPerson is empty
+    "contact_erp_person_mismatch",    # erpContactPerson differs from ERP contactPersonId
+    "contact_status_mismatch",        # ERP contact status differs from CRM
+)
+
+
+def reconcile(repair: bool = True) -> Dict[str, Any]:
+    """
+    Detect (and by default repair) drift between the CRM and ERP staging tables
+    for accounts and contacts with crmToErpFlag, without replaying the load.
+    - Detection is one join query per entity (see ACCOUNT_DRIFT / CONTACT_DRIFT).
+    - Missing ERP rows are registered through the regular ERP registration
+      (sequential ids); everything else is repaired set-based: one correlated
+      UPDATE per id column and one executemany per status repair.
+    Detection runs again after the repair; repaired = detected - remaining.
+    Returns {"detected": counts, "repaired": counts, "remaining": counts, "failed": [...]}.
+    """
+    schema = os.getenv("HANA_SCHEMA")
+    if not schema:
+        raise ValueError("HANA_SCHEMA is not set.")
+
+    engine = get_hana_client()
+    record_log = RecordLogger(logger, "reconciliation")
+    tables = reconciliation_tables(schema)
+
+    with engine.connect() as connection:
+        detected = {
+            **detect_account_drift(connection, tables),
+            **detect_contact_drift(connection, tables),
+        }
+    logger.info("Reconciliation drift: %s", detected)
+
+    failed = []
+    if not repair or not any(detected.values()):
+        return {
+            "detected": detected,
+            "repaired": dict.fromkeys(detected, 0),
+            "remaining": detected,
+            "failed": failed,
+        }
+
+    # 1️⃣ Accounts: register missing ERP customers, then ids and statuses in bulk
+    with engine.connect() as connection:
+        missing_customers = connection.execute(text(f"""
+            SELECT a.accountId, a.accountName, a.status
+            FROM {tables['accounts']} a
+            LEFT JOIN {tables['customers']} c ON c.crmBpNo = a.accountId
+            WHERE a.crmToErpFlag = TRUE AND c.crmBpNo IS NULL
+        """)).fetchall()
+    for account_id, account_name, status in missing_customers:
+        record_log.record()
+        try:
+            register_company_as_customer(account_id, account_name, status, record_log=record_log)
+        except Exception as e:
+            record_log.exception("Error registering company %s in ERP: %s", account_id, e)
+            failed.append({"accountId": account_id, "error": str(e)})
+
+    with engine.begin() as connection:
+        repair_customer_status(connection, tables)
+        backfill_erp_no(connection, schema)
+
+    # 2️⃣ Contacts: register missing ERP contacts, then ids and statuses in bulk
+    with engine.connect() as connection:
+        missing_contacts = connection.execute(text(f"""
+            SELECT p.contactId, p.accountId, p.firstName, p.lastName, p.email,
+                   p.department, p.country, p.cshmeFlag, p.phoneNo, p.status
+            FROM {tables['contacts']} p
+            LEFT JOIN {tables['erp_contacts']} e
+                ON e.crmBpNo = p.accountId AND e.email = p.email
+            WHERE p.crmToErpFlag = TRUE AND e.crmBpNo IS NULL
+        """)).fetchall()
+    for row in missing_contacts:
+        record_log.record()
+        try:
+            register_contact_as_erp(
+                row.accountId,
+                row.firstName,
+                row.lastName,
+                row.email,
+                department=row.department,
+                country=row.country,
+                cshme_flag=row.cshmeFlag,
+                phone_no=row.phoneNo,
+                status=row.status,
+                contact_id=row.contactId,
+                record_log=record_log,
+            )
+        except Exception as e:
+            record_log.exception("Error registering contact %s in ERP: %s", row.contactId, e)
+            failed.append({"contactId": row.contactId, "error": str(e)})
+
+    with engine.begin() as connection:
+        repair_contact_status(connection, tables)
+        backfill_erp_contact_person(connection, schema)
+
+    with engine.connect() as connection:
+        remaining = {
+            **detect_account_drift(connection, tables),
+            **detect_contact_drift(connection, tables),
+        }
+    repaired = {name: max(detected[name] - remaining[name], 0) for name in detected}
+
+    record_log.summary("Reconciliation Summary", **repaired, failed=len(failed))
+    return {"detected": detected, "repaired": repaired, "remaining": remaining, "failed": failed}
+
+
+def reconciliation_tables(schema: str) -> Dict[str, str]:
+    return {
+        "accounts": f"{schema}.SPUSER_STAGING_CRM_COMPANY_ACCOUNTS",
+        "contacts": f"{schema}.SPUSER_STAGING_CRM_COMPANY_CONTACTS",
+        "customers": f"{schema}.SPUSER_STAGING_ERP_CUSTOMERS",
+        "erp_contacts": f"{schema}.SPUSER_STAGING_ERP_CUSTOMERS_CONTACTS",
+    }
+
+
+def detect_account_drift(connection, tables: Dict[str, str]) -> Dict[str, int]:
+    """Count ACCOUNT_DRIFT cases of flagged accounts with one join."""
+    row = connection.execute(text(f"""
+        SELECT
+            COALESCE(SUM(CASE WHEN c.crmBpNo IS NULL THEN 1 ELSE 0 END), 0),
+            COALESCE(SUM(CASE WHEN c.crmBpNo IS NOT NULL AND a.erpNo IS NULL THEN 1 ELSE 0 END), 0),
+            COALESCE(SUM(CASE WHEN a.erpNo <> c.customerId THEN 1 ELSE 0 END), 0),
+            COALESCE(SUM(CASE WHEN c.crmBpNo IS NOT NULL
+                              AND COALESCE(c.status, '') <> COALESCE(a.status, '')
+                         THEN 1 ELSE 0 END), 0)
+        FROM {tables['accounts']} a
+        LEFT JOIN {tables['customers']} c ON c.crmBpNo = a.accountId
+        WHERE a.crmToErpFlag = TRUE
+    """)).fetchone()
+    return {name: int(value) for name, value in zip(ACCOUNT_DRIFT, row)}
+
+
+def detect_contact_drift(connection, tables: Dict[str, str]) -> Dict[str, int]:
+    """Count CONTACT_DRIFT cases of flagged contacts with one join."""
+    row = connection.execute(text(f"""
+        SELECT
+            COALESCE(SUM(CASE WHEN e.crmBpNo IS NULL THEN 1 ELSE 0 END), 0),
+            COALESCE(SUM(CASE WHEN e.crmBpNo IS NOT NULL AND p.erpContactPerson IS NULL THEN 1 ELSE 0 END), 0),
+            COALESCE(SUM(CASE WHEN p.erpContactPerson <> e.contactPersonId THEN 1 ELSE 0 END), 0),
+            COALESCE(SUM(CASE WHEN e.crmBpNo IS NOT NULL
+                              AND COALESCE(e.status, '') <> COALESCE(p.status, '')
+                         THEN 1 ELSE 0 END), 0)
+        FROM {tables['contacts']} p
+        LEFT JOIN {tables['erp_contacts']} e
+            ON e.crmBpNo = p.accountId AND e.email = p.email
+        WHERE p.crmToErpFlag = TRUE
+    """)).fetchone()
+    return {name: int(value) for name, value in zip(CONTACT_DRIFT, row)}
+
+
+def repair_customer_status(connection, tables: Dict[str, str]) -> int:
+    """Copy the CRM status onto ERP customers whose status differs (one executemany)."""
+    rows = connection.execute(text(f"""
+        SELECT c.crmBpNo, c.name, a.status
+        FROM {tables['accounts']} a
+        JOIN {tables['customers']} c ON c.crmBpNo = a.accountId
+        WHERE a.crmToErpFlag = TRUE
+          AND COALESCE(c.status, '') <> COALESCE(a.status, '')
+    """)).fetchall()
+    if not rows:
+        return 0
+
+    now_utc = datetime.utcnow()
+    params = [
+        {
+            "crmBpNo": crm_bp_no,
+            "status": status,
+            "lastModified": now_utc,
+            "rowHash": compute_row_hash({"name": name, "status": status}, ERP_CUSTOMER_HASH_FIELDS),
+        }
+        for crm_bp_no, name, status in rows
+    ]
+    connection.execute(text(f"""
+        UPDATE {tables['customers']}
+        SET status = :status, lastModified = :lastModified, rowHash = :rowHash
+        WHERE crmBpNo = :crmBpNo
+    """), params)
+    return len(params)
+
+
+def repair_contact_status(connection, tables: Dict[str, str]) -> int:
+    """Copy the CRM status onto ERP contacts whose status differs (one executemany)."""
+    rows = connection.execute(text(f"""
+        SELECT DISTINCT e.crmBpNo, e.email, e.firstName, e.lastName, e.department,
+               e.country, e.cshmeFlag, e.phoneNo, p.status
+        FROM {tables['contacts']} p
+        JOIN {tables['erp_contacts']} e
+            ON e.crmBpNo = p.accountId AND e.email = p.email
+        WHERE p.crmToErpFlag = TRUE
+          AND COALESCE(e.status, '') <> COALESCE(p.status, '')
+    """)).fetchall()
+    if not rows:
+        return 0
+
+    now_utc = datetime.utcnow()
+    params: List[Dict[str, Any]] = []
+    for row in rows:
+        values = dict(row._mapping)
+        params.append({
+            "crmBpNo": row.crmBpNo,
+            "email": row.email,
+            "status": row.status,
+            "lastModified": now_utc,
+            "rowHash": compute_row_hash(values, ERP_CONTACT_HASH_FIELDS),
+        })
+    connection.execute(text(f"""
+        UPDATE {tables['erp_contacts']}
+        SET status = :status, lastModified = :lastModified, rowHash = :rowHash
+        WHERE crmBpNo = :crmBpNo AND email = :email
+    """), params)
+    return len(params)
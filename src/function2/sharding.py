@@ -0,0 +1,64 @@
+import os
+import zlib
+from typing import Any, Callable, Iterable, Iterator, List, NamedTuple, TypeVar
+
+T = TypeVar("T")
+
+
+class Shard(NamedTuple):
+    """Slice of the input handled by one handler invocation (index in [0, count))."""
+    index: int = 0
+    count: int = 1
+
+    @property
+    def is_sharded(self) -> bool:
+        return self.count > 1
+
+    def __str__(self) -> str:
+        return f"{self.index + 1}/{self.count}"
+
+
+def get_shard(event: Any = None) -> Shard:
+    """
+    Shard of this invocation from event["shard_index"] / event["shard_count"],
+    else SHARD_INDEX / SHARD_COUNT (default: one shard with all records).
+    Shards may run in parallel: the ERP ids they register are allocated from the
+    row-locked counter of id_generation, never from MAX()+1.
+    """
+    event = event if isinstance(event, dict) else {}
+    index = event.get("shard_index", os.getenv("SHARD_INDEX", 0))
+    count = event.get("shard_count", os.getenv("SHARD_COUNT", 1))
+    try:
+        shard = Shard(int(index), int(count))
+    except (TypeError, ValueError):
+        raise ValueError(f"Invalid shard index/count: {index!r}/{count!r}")
+    if shard.count < 1 or not 0 <= shard.index < shard.count:
+        raise ValueError(f"Shard index {shard.index} is out of range for {shard.count} shard(s)")
+    return shard
+
+
+def shard_of(key: Any, count: int) -> int:
+    """
+    Shard number of a business key: CRC-32 of its text form, so every invocation
+    (and every Python process, unlike hash()) assigns the key to the same shard.
+    """
+    return zlib.crc32(str(key).encode("utf-8")) % count
+
+
+def shard_mask(keys: Iterable[Any], shard: Shard) -> List[bool]:
+    """True for the keys that belong to shard."""
+    if not shard.is_sharded:
+        return [True for _ in keys]
+    return [shard_of(key, shard.count) == shard.index for key in keys]
+
+
+def filter_shard(records: Iterable[T], key: Callable[[T], Any], shard: Shard) -> List[T]:
+    """Records whose business key (key(record)) belongs to shard."""
+    return list(iter_shard(records, key, shard))
+
+
+def iter_shard(records: Iterable[T], key: Callable[[T], Any], shard: Shard) -> Iterator[T]:
+    """Lazy filter_shard, for record streams."""
+    if not shard.is_sharded:
+        return iter(records)
+    return (record for record in records if shard_of(key(record), shard.count) == shard.index)
@@ -0,0 +1,212 @@
+import os
+import logging
+from typing import Any, Dict, Iterable, List, NamedTuple, Sequence, Tuple
+from sqlalchemy import text
+from record_types import insert_many
+
+logger = logging.getLogger(__name__)
+logging.basicConfig(level=logging.INFO)
+
+
+def is_initial_load() -> bool:
+    """LOAD_MODE=initial switches the handlers to the staging-table bulk load."""
+    return os.getenv("LOAD_MODE", "delta").strip().lower() == "initial"
+
+
+class StagingSpec(NamedTuple):
+    """Target table description for a staging-table load."""
+    table: str                        # e.g. SPUSER_STAGING_P_USERS (without schema)
+    key_column: str                   # business key used to match rows, e.g. userId
+    columns: Tuple[str, ...]          # columns loaded into staging and inserted into target
+    update_columns: Tuple[str, ...]   # columns set on matched rows whose rowHash differs
+    unique_columns: Tuple[str, ...] = ()  # other unique columns, checked by reject_conflicts()
+
+
+class StagingTable:
+    """
+    Set-based initial load through a session-local staging table:
+    - load(): bulk-insert the input with large positional executemany batches
+      (STAGING_BATCH_SIZE rows, default 10000).
+    - reject_conflicts(): drop staged rows that would break a unique column.
+    - classify(): count inserts / updates / unchanged with one join.
+    - select(): read staged rows joined with the target, e.g. the rows that
+      will be inserted or updated (for the ERP follow-up).
+    - merge(): apply all inserts and updates with set-based statements
+      (MERGE INTO on HANA, UPDATE ... FROM + INSERT ... SELECT on SQLite).
+    Used as a context manager, which creates and drops the staging table.
+    Rows are matched on key_column; rowHash decides whether a match changed.
+    """
+
+    def __init__(self, connection, schema: str, spec: StagingSpec):
+        self.connection = connection
+        self.schema = schema
+        self.spec = spec
+        self.dialect = connection.dialect.name
+        self.target = f"{schema}.{spec.table}"
+        if self.dialect == "hana":
+            self.name = f"#STG_{spec.table}"
+        elif self.dialect == "sqlite":
+            self.name = f"temp.STG_{spec.table}"
+        else:
+            raise ValueError(f"Staging load is not supported for dialect: {self.dialect}")
+
+    def __enter__(self):
+        self.drop()
+        if self.dialect == "hana":
+            self.connection.execute(text(
+                f"CREATE LOCAL TEMPORARY COLUMN TABLE {self.name} LIKE {self.target} WITH NO DATA"
+            ))
+        else:
+            self.connection.execute(text(
+                f"CREATE TEMP TABLE {self.name.split('.', 1)[1]} AS "
+                f"SELECT * FROM {self.target} WHERE 0 = 1"
+            ))
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.drop()
+
+    def drop(self) -> None:
+        if self.dialect == "sqlite":
+            self.connection.execute(text(f"DROP TABLE IF EXISTS {self.name}"))
+            return
+        try:
+            self.connection.execute(text(f"DROP TABLE {self.name}"))
+        except Exception:
+            # Not present (first use in this session) — nothing to drop
+            pass
+
+    def load(self, rows: Sequence[Any]) -> int:
+        """
+        Insert rows (records or dicts) into the staging table as positional
+        executemany batches. Returns the number of staged rows.
+        """
+        batch_size = int(os.getenv("STAGING_BATCH_SIZE", 10000))
+        staged = 0
+        for start in range(0, len(rows), batch_size):
+            staged += insert_many(
+                self.connection, self.name, self.spec.columns, rows[start:start + batch_size]
+            )
+        logger.info("Staged %d row(s) into %s", staged, self.name)
+        return staged
+
+    def reject_conflicts(self) -> Dict[Any, str]:
+        """
+        Remove staged rows that would violate one of spec.unique_columns, so one
+        bad record does not fail the whole set-based merge. A row is rejected when
+        its value is already used by a target row with another key, or by another
+        staged row with a smaller key.
+        Returns {rejected key: conflicting column}.
+        """
+        key = self.spec.key_column
+        rejected = {}
+        for column in self.spec.unique_columns:
+            condition = f"""
+                s.{column} IS NOT NULL AND (
+                    EXISTS (SELECT 1 FROM {self.target} t
+                            WHERE t.{column} = s.{column} AND t.{key} <> s.{key})
+                    OR EXISTS (SELECT 1 FROM {self.name} d
+                               WHERE d.{column} = s.{column} AND d.{key} < s.{key})
+                )
+            """
+            keys = self.connection.execute(text(
+                f"SELECT s.{key} FROM {self.name} s WHERE {condition}"
+            )).scalars().all()
+            if not keys:
+                continue
+            self.connection.execute(text(
+                f"DELETE FROM {self.name} WHERE {key} IN "
+                f"(SELECT s.{key} FROM {self.name} s WHERE {condition})"
+            ))
+            for value in keys:
+                rejected.setdefault(value, column)
+        if rejected:
+            logger.warning("Rejected %d staged row(s) with unique conflicts", len(rejected))
+        return rejected
+
+    def _changed_condition(self, target_alias: str, staging_alias: str) -> str:
+        return (
+            f"({target_alias}.rowHash IS NULL OR "
+            f"{target_alias}.rowHash <> {staging_alias}.rowHash)"
+        )
+
+    @property
+    def new_or_changed(self) -> str:
+        """Predicate over s (staged row) / t (target row): row will be inserted or updated."""
+        return f"(t.{self.spec.key_column} IS NULL OR {self._changed_condition('t', 's')})"
+
+    def classify(self) -> Dict[str, int]:
+        """Count staged rows that are new, changed or unchanged compared to the target."""
+        key = self.spec.key_column
+        changed = self._changed_condition("t", "s")
+        row = self.connection.execute(text(f"""
+            SELECT
+                COALESCE(SUM(CASE WHEN t.{key} IS NULL THEN 1 ELSE 0 END), 0),
+                COALESCE(SUM(CASE WHEN t.{key} IS NOT NULL AND {changed} THEN 1 ELSE 0 END), 0),
+                COALESCE(SUM(CASE WHEN t.{key} IS NOT NULL AND NOT {changed} THEN 1 ELSE 0 END), 0)
+            FROM {self.name} s
+            LEFT JOIN {self.target} t ON t.{key} = s.{key}
+        """)).fetchone()
+        return {"inserted": int(row[0]), "updated": int(row[1]), "unchanged": int(row[2])}
+
+    def select(self, columns: Sequence[str], condition: str) -> List[Any]:
+        """
+        Staged rows (s) joined with their target row (t) that match condition,
+        e.g. select(("s.accountId", "t.erpNo"), staging.new_or_changed).
+        Must run before merge(), which makes staged and target rows equal.
+        """
+        key = self.spec.key_column
+        return self.connection.execute(text(f"""
+            SELECT {', '.join(columns)}
+            FROM {self.name} s
+            LEFT JOIN {self.target} t ON t.{key} = s.{key}
+            WHERE {condition}
+        """)).fetchall()
+
+    def merge(self) -> None:
+        """Apply staged inserts and updates to the target with set-based statements."""
+        key = self.spec.key_column
+        columns = self.spec.columns
+        updates = self.spec.update_columns
+
+        if self.dialect == "hana":
+            self.connection.execute(text(f"""
+                MERGE INTO {self.target} t
+                USING {self.name} s
+                ON t.{key} = s.{key}
+                WHEN MATCHED AND {self._changed_condition('t', 's')} THEN UPDATE SET
+                    {', '.join(f't.{column} = s.{column}' for column in updates)}
+                WHEN NOT MATCHED THEN INSERT ({', '.join(columns)})
+                    VALUES ({', '.join(f's.{column}' for column in columns)})
+            """))
+            return
+
+        target_table = self.spec.table
+        self.connection.execute(text(f"""
+            UPDATE {self.target}
+            SET {', '.join(f'{column} = s.{column}' for column in updates)}
+            FROM {self.name} s
+            WHERE {target_table}.{key} = s.{key}
+              AND {self._changed_condition(target_table, 's')}
+        """))
+        self.connection.execute(text(f"""
+            INSERT INTO {self.target} ({', '.join(columns)})
+            SELECT {', '.join(f's.{column}' for column in columns)}
+            FROM {self.name} s
+            WHERE NOT EXISTS (
+                SELECT 1 FROM {self.target} t WHERE t.{key} = s.{key}
+            )
+        """))
+
+
+def dedupe_by_key(rows: Iterable[Any], key_column: str) -> Tuple[List[Any], int]:
+    """
+    Keep the last record per business key (a MERGE source must not contain duplicates).
+    Returns (rows, number of dropped duplicates).
+    """
+    by_key = {}
+    total = 0
+    for row in rows:
+        total += 1
+        by_key[row.get(key_column)] = row
+    return list(by_key.values()), total - len(by_key)
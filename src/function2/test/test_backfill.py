@@ -0,0 +1,58 @@
+import os
+import pytest
+from unittest.mock import patch
+from sqlalchemy import text
+from backfill import backfill_erp_ids
+from db_connection import get_hana_client
+from db_operation_company import insert_or_update_company
+from db_operation_contact import insert_or_update_contact
+
+
+@pytest.fixture
+def sqlite_env(tmp_path):
+    env = {
+        "DB_BACKEND": "sqlite",
+        "SQLITE_PATH": str(tmp_path / "local.sqlite"),
+        "HANA_SCHEMA": "TEST_SCHEMA",
+    }
+    with patch.dict(os.environ, env):
+        yield
+
+
+def test_backfill_erp_ids_sets_missing_and_stale_ids(sqlite_env):
+    """Should copy customerId / contactPersonId onto CRM rows with one UPDATE each."""
+    insert_or_update_company([
+        {"accountId": 10, "accountName": "NextGen", "crmToErpFlag": True, "status": "active"},
+        {"accountId": 20, "accountName": "Infosys", "crmToErpFlag": True, "status": "active"},
+    ])
+    insert_or_update_contact([
+        {"contactId": 101, "accountId": 10, "accountName": "NextGen", "crmToErpFlag": True,
+         "firstName": "Ravi", "lastName": "Kumar", "cshmeFlag": True,
+         "email": "ravi.kumar@nextgen.com", "department": "Engineering",
+         "country": "India", "zipCode": "122018", "phoneNo": "8882719739",
+         "status": "active"},
+    ])
+
+    engine = get_hana_client()
+    with engine.begin() as connection:
+        connection.execute(text(
+            "UPDATE TEST_SCHEMA.SPUSER_STAGING_CRM_COMPANY_ACCOUNTS "
+            "SET erpNo = CASE accountId WHEN 10 THEN NULL ELSE 'stale' END"
+        ))
+        connection.execute(text(
+            "UPDATE TEST_SCHEMA.SPUSER_STAGING_CRM_COMPANY_CONTACTS SET erpContactPerson = NULL"
+        ))
+
+    assert backfill_erp_ids() == {"erpNo": 2, "erpContactPerson": 1}
+    assert backfill_erp_ids() == {"erpNo": 0, "erpContactPerson": 0}
+
+    with engine.connect() as connection:
+        erp_nos = connection.execute(text(
+            "SELECT erpNo FROM TEST_SCHEMA.SPUSER_STAGING_CRM_COMPANY_ACCOUNTS ORDER BY accountId"
+        )).scalars().all()
+        erp_contact = connection.execute(text(
+            "SELECT erpContactPerson FROM TEST_SCHEMA.SPUSER_STAGING_CRM_COMPANY_CONTACTS"
+        )).scalar()
+
+    assert erp_nos == ["1000000", "1000001"]
+    assert erp_contact == "2000000"
@@ -0,0 +1,63 @@
+import os
+from unittest.mock import patch
+from batching import AdaptiveBatchSizer, batched, nonempty
+
+
+def test_chunks_follow_current_size():
+    sizer = AdaptiveBatchSizer(initial=2, minimum=1, maximum=10)
+    chunks = []
+    for chunk in sizer.chunks(list(range(7))):
+        chunks.append(chunk)
+        sizer.size = 3
+    assert chunks == [[0, 1], [2, 3, 4], [5, 6]]
+    assert sizer.describe() == "2→3 (3 chunks)"
+
+
+def test_grows_while_throughput_improves_up_to_maximum():
+    sizer = AdaptiveBatchSizer(initial=100, minimum=50, maximum=300)
+    sizer.record(100, 0.10)   # 1000 rows/s
+    assert sizer.size == 200
+    sizer.record(200, 0.10)   # 2000 rows/s
+    assert sizer.size == 300
+    sizer.record(300, 0.15)   # flat → hold
+    assert sizer.size == 300
+
+
+def test_backs_off_on_errors_slow_chunks_and_throughput_drop():
+    sizer = AdaptiveBatchSizer(initial=400, minimum=50, maximum=1000, target_ms=500)
+    sizer.record(400, 0.1, errors=40)
+    assert sizer.size == 200
+    sizer.record(200, 0.6)    # slower than target_ms
+    assert sizer.size == 100
+    sizer.record(100, 0.01)   # 10000 rows/s
+    assert sizer.size == 200
+    sizer.record(200, 0.1)    # 2000 rows/s → drop
+    assert sizer.size == 100
+    for _ in range(5):
+        sizer.record(sizer.size, 10)
+    assert sizer.size == 50
+
+
+def test_from_env_clamps_and_can_pin_size():
+    env = {"CRM_BATCH_SIZE": "5000", "BATCH_SIZE_MIN": "10", "BATCH_SIZE_MAX": "1000"}
+    with patch.dict(os.environ, env):
+        assert AdaptiveBatchSizer.from_env("CRM_BATCH_SIZE").size == 1000
+
+    with patch.dict(os.environ, {**env, "BATCH_ADAPTIVE": "0"}):
+        sizer = AdaptiveBatchSizer.from_env("CRM_BATCH_SIZE")
+        sizer.record(5000, 60, errors=5000)
+        assert sizer.size == 5000
+
+
+def test_batched_reads_a_stream_one_batch_at_a_time():
+    consumed = []
+    stream = (consumed.append(item) or item for item in range(5))
+    batches = batched(stream, 2)
+    assert next(batches) == [0, 1] and consumed == [0, 1]
+    assert list(batches) == [[2, 3], [4]]
+    assert list(batched([], 2)) == []
+
+
+def test_nonempty_keeps_the_peeked_item():
+    assert nonempty(iter(())) is None
+    assert list(nonempty(iter([1, 2]))) == [1, 2]
@@ -1,10 +1,17 @@
 import os
 import pytest
 from unittest.mock import patch, MagicMock
-from db_connection import get_hana_client
+from db_connection import clear_engine_cache, get_hana_client, get_hana_config
 from sqlalchemy.exc import SQLAlchemyError
 
 
+@pytest.fixture(autouse=True)
+def fresh_engine_cache():
+    clear_engine_cache()
+    yield
+    clear_engine_cache()
+
+
 def test_get_hana_client_success(caplog):
     env_vars = {
         "HANA_SERVER_NODE": "hana.example.com",
@@ -64,3 +71,46 @@ def test_get_hana_client_sqlalchemy_error():
             with pytest.raises(RuntimeError) as exc_info:
                 get_hana_client()
             assert "HANA connection failed" in str(exc_info.value)
+
+
+def test_get_hana_client_reuses_engine_across_calls():
+    env_vars = {
+        "DB_BACKEND": "hana",
+        "HANA_SERVER_NODE": "hana.example.com",
+        "HANA_USER": "test_user",
+        "HANA_PASSWORD": "test_pass",
+        "HANA_SCHEMA": "TEST_SCHEMA",
+    }
+
+    with patch.dict(os.environ, env_vars):
+        with patch("db_connection.create_engine") as mock_create_engine:
+            first = get_hana_client()
+            second = get_hana_client()
+
+            assert first is second
+            mock_create_engine.assert_called_once()
+
+            with patch.dict(os.environ, {"HANA_SCHEMA": "OTHER_SCHEMA"}):
+                get_hana_client()
+            assert mock_create_engine.call_count == 2
+
+
+def test_get_hana_config_parsed_once_per_settings():
+    env_vars = {
+        "HANA_SERVER_NODE": "hana.example.com",
+        "HANA_USER": "test_user",
+        "HANA_PASSWORD": "p@ss word",
+        "HANA_SCHEMA": "TEST_SCHEMA",
+    }
+
+    with patch.dict(os.environ, env_vars), patch("urllib.parse.quote_plus", wraps=str) as mock_quote:
+        first = get_hana_config()
+        assert get_hana_config() is first
+        assert first.connection_string == (
+            "hana+hdbcli://test_user:p@ss word@hana.example.com:443?currentSchema=TEST_SCHEMA"
+        )
+        mock_quote.assert_called_once()
+
+        with patch.dict(os.environ, {"HANA_PORT": "30015"}):
+            assert get_hana_config().port == "30015"
+        assert mock_quote.call_count == 2
@@ -1,7 +1,8 @@
 import os
 import uuid
-from unittest.mock import patch, MagicMock
+from unittest.mock import ANY, patch, MagicMock
 import db_operation_company as db
+from row_hash import compute_row_hash
 
 
 # Helper to mock engine and connection context
@@ -12,6 +13,11 @@ def mock_engine_context():
     return mock_engine, mock_conn
 
 
+# Helper to mock the chunk lookup (accountId, rowHash, erpNo)
+def stored_rows(*rows):
+    return [MagicMock(_mapping=row) for row in rows]
+
+
 def test_insert_new_company():
     """Should insert a new company if it does not exist, and call ERP if flag is set."""
     mock_engine, mock_conn = mock_engine_context()
@@ -46,7 +52,7 @@ def test_insert_new_company():
 
         # Should have called ERP registration
         db.register_company_as_customer.assert_called_once_with(
-            "A1", "Acme Corp", "active"
+            "A1", "Acme Corp", "active", record_log=ANY
         )
 
 
@@ -62,12 +68,9 @@ def test_update_existing_company():
 
         mock_get_client.return_value = mock_engine
 
-        # Simulate existing record
-        mock_conn.execute.return_value.fetchone.return_value = (
-            "Old Name",
-            True,
-            "ERP999",
-            "inactive",
+        # Simulate existing record with a different rowHash
+        mock_conn.execute.return_value.fetchall.return_value = stored_rows(
+            {"accountId": "A2", "rowHash": "old-hash", "erpNo": "ERP999"}
         )
 
         companies = [
@@ -86,7 +89,7 @@ def test_update_existing_company():
         assert result["failed"] == []
 
         db.register_company_as_customer.assert_called_once_with(
-            "A2", "Updated Co", "active"
+            "A2", "Updated Co", "active", record_log=ANY
         )
 
 
@@ -115,9 +118,9 @@ def test_handle_partial_failure_in_update():
     mock_engine, mock_conn = mock_engine_context()
 
     def failing_execute(query, params=None):
-        if "A1" in str(params):
+        if "INSERT" in str(query) and "A1" in str(params):
             raise Exception("Simulated DB failure")
-        return MagicMock(fetchone=lambda: None)
+        return MagicMock(fetchall=lambda: [])
 
     with patch("db_operation_company.get_hana_client") as mock_get_client, patch.dict(
         os.environ, {"HANA_SCHEMA": "TEST_SCHEMA"}
@@ -178,3 +181,146 @@ def test_does_not_call_erp_when_flag_false():
         assert result["updated"] == 0
         assert result["failed"] == []
         mock_register.assert_not_called()
+
+
+def test_skip_unchanged_company():
+    """Should skip CRM update and ERP registration if nothing changed."""
+    mock_engine, mock_conn = mock_engine_context()
+
+    with patch("db_operation_company.get_hana_client") as mock_get_client, patch.dict(
+        os.environ, {"HANA_SCHEMA": "TEST_SCHEMA"}
+    ), patch("db_operation_company.register_company_as_customer") as mock_register:
+
+        mock_get_client.return_value = mock_engine
+
+        companies = [
+            {
+                "accountId": "A4",
+                "accountName": "Same Co",
+                "crmToErpFlag": True,
+                "status": "active",
+            }
+        ]
+        mock_conn.execute.return_value.fetchall.return_value = stored_rows({
+            "accountId": "A4",
+            "rowHash": compute_row_hash(companies[0], db.COMPANY_HASH_FIELDS),
+            "erpNo": "ERP111",
+        })
+
+        result = db.insert_or_update_company(companies)
+
+        assert result["unchanged"] == 1
+        assert result["updated"] == 0
+        assert result["failed"] == []
+        mock_register.assert_not_called()
+        assert mock_conn.execute.call_count == 1  # only the lookup
+
+
+def test_flagged_company_without_erp_no_is_not_unchanged():
+    """Should still register in ERP if the flagged account has no erpNo yet."""
+    mock_engine, mock_conn = mock_engine_context()
+
+    with patch("db_operation_company.get_hana_client") as mock_get_client, patch.dict(
+        os.environ, {"HANA_SCHEMA": "TEST_SCHEMA"}
+    ), patch(
+        "db_operation_company.register_company_as_customer", return_value="ERP222"
+    ) as mock_register:
+
+        mock_get_client.return_value = mock_engine
+
+        companies = [
+            {
+                "accountId": "A5",
+                "accountName": "Same Co",
+                "crmToErpFlag": True,
+                "status": "active",
+            }
+        ]
+        mock_conn.execute.return_value.fetchall.return_value = stored_rows({
+            "accountId": "A5",
+            "rowHash": compute_row_hash(companies[0], db.COMPANY_HASH_FIELDS),
+            "erpNo": None,
+        })
+
+        result = db.insert_or_update_company(companies)
+
+        assert result["unchanged"] == 0
+        assert result["updated"] == 1
+        mock_register.assert_called_once_with("A5", "Same Co", "active", record_log=ANY)
+
+
+def test_erp_no_written_by_one_backfill_per_load():
+    """Should back-fill erpNo once per load instead of one UPDATE per account."""
+    mock_engine, mock_conn = mock_engine_context()
+
+    with patch("db_operation_company.get_hana_client", return_value=mock_engine), patch.dict(
+        os.environ, {"HANA_SCHEMA": "TEST_SCHEMA"}
+    ), patch(
+        "db_operation_company.register_company_as_customer", side_effect=["ERP1", "ERP2"]
+    ), patch("db_operation_company.backfill_erp_no", return_value=2) as mock_backfill:
+
+        mock_conn.execute.return_value.fetchall.return_value = []
+
+        result = db.insert_or_update_company([
+            {"accountId": "A1", "accountName": "One", "crmToErpFlag": True, "status": "active"},
+            {"accountId": "A2", "accountName": "Two", "crmToErpFlag": True, "status": "active"},
+        ])
+
+        assert result["inserted"] == 2
+        mock_backfill.assert_called_once_with(mock_conn, "TEST_SCHEMA")
+        assert not any("erpNo" in str(c.args[0]) for c in mock_conn.execute.call_args_list[1:])
+
+
+def test_chunk_retried_on_transient_error():
+    """Should re-run a chunk in a new transaction after a connection reset."""
+    mock_engine, mock_conn = mock_engine_context()
+    lookups = []
+
+    def execute(query, params=None):
+        if "SELECT" in str(query):
+            lookups.append(params)
+            if len(lookups) == 1:
+                raise ConnectionResetError("Connection reset by peer")
+        result = MagicMock()
+        result.fetchall.return_value = []
+        return result
+
+    mock_conn.execute.side_effect = execute
+
+    with patch("db_operation_company.get_hana_client", return_value=mock_engine), patch.dict(
+        os.environ, {"HANA_SCHEMA": "TEST_SCHEMA", "RETRY_BASE_DELAY_MS": "0"}
+    ):
+        result = db.insert_or_update_company([
+            {"accountId": "A1", "accountName": "One", "crmToErpFlag": False, "status": "active"},
+        ])
+
+    assert result["inserted"] == 1
+    assert result["failed"] == []
+    assert len(lookups) == 2
+    assert mock_engine.begin.call_count == 2
+
+
+def test_erp_registrations_summarized_per_load(caplog):
+    """Should count ERP registrations in a logger of the load and log its summary at the end."""
+    mock_engine, mock_conn = mock_engine_context()
+
+    with patch("db_operation_company.get_hana_client", return_value=mock_engine), patch.dict(
+        os.environ, {"HANA_SCHEMA": "TEST_SCHEMA"}
+    ), patch(
+        "db_operation_company.register_company_as_customer", return_value="ERP123"
+    ) as mock_register, caplog.at_level("INFO"):
+        mock_conn.execute.return_value.fetchall.return_value = []
+        companies = [
+            {"accountId": f"A{i}", "accountName": f"Co {i}", "crmToErpFlag": True, "status": "active"}
+            for i in range(3)
+        ]
+
+        db.insert_or_update_company(companies)
+        db.insert_or_update_company(companies[:1])
+
+    erp_logs = [call.kwargs["record_log"] for call in mock_register.call_args_list]
+    assert erp_logs[0] is erp_logs[2] and erp_logs[0] is not erp_logs[3]
+    assert (erp_logs[0].records, erp_logs[3].records) == (3, 1)
+    messages = [r.getMessage() for r in caplog.records]
+    assert "ERP Customer Summary: registrations=3" in messages
+    assert "ERP Customer Summary: registrations=1" in messages
@@ -1,7 +1,8 @@
 import os
 import uuid
-from unittest.mock import patch, MagicMock
+from unittest.mock import ANY, patch, MagicMock
 import db_operation_contact as db
+from row_hash import compute_row_hash
 
 
 # Helper to mock engine and connection context
@@ -12,6 +13,19 @@ def mock_engine_context():
     return mock_engine, mock_conn
 
 
+# Helper to mock the chunk lookups from stored rows {contactId: columns}
+def lookup_execute(stored):
+    def execute(query, params=None):
+        if str(query).lstrip().startswith("SELECT"):
+            rows = [
+                MagicMock(_mapping={**stored[key], "contactId": key})
+                for key in params.values() if key in stored
+            ]
+            return MagicMock(fetchall=lambda: rows)
+        return MagicMock()
+    return execute
+
+
 def test_insert_new_contact():
     """Should insert new contact and call ERP if crmToErpFlag is True."""
     mock_engine, mock_conn = mock_engine_context()
@@ -64,6 +78,7 @@ def test_insert_new_contact():
             phone_no="555-1234",
             status="active",
             contact_id="C1",
+            record_log=ANY,
         )
 
 
@@ -80,16 +95,17 @@ def test_update_existing_contact():
         mock_get_client.return_value = mock_engine
 
         # Simulate existing contact with different data
-        mock_conn.execute.return_value.fetchone.return_value = MagicMock(
-            _mapping={
+        mock_conn.execute.side_effect = lookup_execute({
+            "C2": {
                 "accountName": "Old Company",
                 "firstName": "Jane",
                 "lastName": "Smith",
                 "email": "jane@old.com",
                 "crmToErpFlag": False,
                 "erpContactPerson": None,
+                "rowHash": "old-hash",
             }
-        )
+        })
 
         contacts = [
             {
@@ -142,23 +158,11 @@ def test_no_update_if_fields_same_but_erp_called():
     """Should not run UPDATE if fields are the same, but ERP call still happens."""
     mock_engine, mock_conn = mock_engine_context()
 
-    existing_data = {
-        "accountName": "Company B",
-        "firstName": "Alice",
-        "lastName": "Smith",
-        "email": "alice@example.com",
-        "crmToErpFlag": True,
-        "erpContactPerson": "ERP789",
-    }
-
     with patch("db_operation_contact.get_hana_client") as mock_get_client, patch.dict(
         os.environ, {"HANA_SCHEMA": "TEST_SCHEMA"}
     ), patch("db_operation_contact.register_contact_as_erp", return_value="ERP789"):
 
         mock_get_client.return_value = mock_engine
-        mock_conn.execute.return_value.fetchone.return_value = MagicMock(
-            _mapping=existing_data
-        )
 
         contacts = [
             {
@@ -178,12 +182,21 @@ def test_no_update_if_fields_same_but_erp_called():
             }
         ]
 
+        mock_conn.execute.side_effect = lookup_execute({
+            "C3": {
+                "rowHash": compute_row_hash(contacts[0], db.CONTACT_UPDATE_COLUMNS),
+                "erpContactPerson": "ERP789",
+            }
+        })
+
         result = db.insert_or_update_contact(contacts)
 
-        assert result["updated"] == 1
+        assert result["updated"] == 0
+        assert result["unchanged"] == 1
         assert result["inserted"] == 0
         assert result["failed"] == []
         db.register_contact_as_erp.assert_called_once()
+        assert not any("UPDATE" in str(c.args[0]) for c in mock_conn.execute.call_args_list)
 
 
 def test_handle_partial_failure():
@@ -191,9 +204,9 @@ def test_handle_partial_failure():
     mock_engine, mock_conn = mock_engine_context()
 
     def failing_execute(query, params=None):
-        if "C1" in str(params):
+        if "INSERT" in str(query) and "C1" in str(params):
             raise Exception("Simulated DB failure")
-        return MagicMock(fetchone=lambda: None)
+        return MagicMock(fetchall=lambda: [])
 
     with patch("db_operation_contact.get_hana_client") as mock_get_client, patch.dict(
         os.environ, {"HANA_SCHEMA": "TEST_SCHEMA"}
@@ -223,3 +236,110 @@ def test_handle_partial_failure():
         assert len(result["failed"]) == 1
         assert result["failed"][0]["contact"]["contactId"] == "C1"
         assert "Simulated DB failure" in result["failed"][0]["error"]
+
+
+def test_changed_columns_grouped_into_one_update():
+    """Should write only changed columns, one executemany per changed-column set."""
+    mock_engine, mock_conn = mock_engine_context()
+
+    def contact(contact_id, phone_no):
+        return {
+            "contactId": contact_id,
+            "accountId": "A4",
+            "accountName": "Company D",
+            "firstName": "Bob",
+            "lastName": "Brown",
+            "email": f"{contact_id}@example.com",
+            "crmToErpFlag": False,
+            "department": "IT",
+            "country": "DE",
+            "cshmeFlag": False,
+            "zipCode": "10115",
+            "phoneNo": phone_no,
+            "status": "active",
+        }
+
+    stored = {
+        "C4": {**contact("C4", "111"), "rowHash": "old-hash", "erpContactPerson": None},
+        "C5": {**contact("C5", "222"), "rowHash": "old-hash", "erpContactPerson": None},
+        "C6": {
+            **contact("C6", "333"),
+            "rowHash": compute_row_hash(contact("C6", "333"), db.CONTACT_UPDATE_COLUMNS),
+            "erpContactPerson": None,
+        },
+    }
+    execute = lookup_execute(stored)
+
+    with patch("db_operation_contact.get_hana_client") as mock_get_client, patch.dict(
+        os.environ, {"HANA_SCHEMA": "TEST_SCHEMA"}
+    ):
+
+        mock_get_client.return_value = mock_engine
+        mock_conn.execute.side_effect = execute
+
+        # C4 and C5 change only phoneNo, C6 is unchanged
+        result = db.insert_or_update_contact(
+            [contact("C4", "999"), contact("C5", "888"), contact("C6", "333")]
+        )
+
+        assert result["updated"] == 2
+        assert result["unchanged"] == 1
+        assert result["failed"] == []
+
+        updates = [
+            c for c in mock_conn.execute.call_args_list if "UPDATE" in str(c.args[0])
+        ]
+        assert len(updates) == 1
+        assert "SET phoneNo = :phoneNo,\n                rowHash = :rowHash" in str(updates[0].args[0])
+        assert [(row["contactId"], row["phoneNo"]) for row in updates[0].args[1]] == [
+            ("C4", "999"),
+            ("C5", "888"),
+        ]
+
+
+def test_erp_registration_runs_after_grouped_update():
+    """Should register contacts in ERP only after the grouped CRM update, skipping rows whose update failed."""
+    mock_engine, mock_conn = mock_engine_context()
+    events = []
+
+    def contact(contact_id):
+        return {
+            "contactId": contact_id,
+            "accountId": "A7",
+            "accountName": "Company G",
+            "email": f"{contact_id}@example.com",
+            "crmToErpFlag": True,
+            "phoneNo": "new",
+        }
+
+    stored = {
+        contact_id: {**contact(contact_id), "phoneNo": "old", "rowHash": "old-hash", "erpContactPerson": None}
+        for contact_id in ("C7", "C8")
+    }
+    lookup = lookup_execute(stored)
+
+    def execute(query, params=None):
+        if "UPDATE" in str(query):
+            rows = params if isinstance(params, list) else [params]
+            events.append(("update", [row["contactId"] for row in rows]))
+            if any(row["contactId"] == "C8" for row in rows):
+                raise Exception("Simulated update failure")
+            return MagicMock()
+        return lookup(query, params)
+
+    def register(account_id, *args, contact_id=None, **kwargs):
+        events.append(("erp", contact_id))
+        return f"ERP_{contact_id}"
+
+    with patch("db_operation_contact.get_hana_client", return_value=mock_engine), patch.dict(
+        os.environ, {"HANA_SCHEMA": "TEST_SCHEMA"}
+    ), patch("db_operation_contact.register_contact_as_erp", side_effect=register):
+        mock_conn.execute.side_effect = execute
+
+        result = db.insert_or_update_contact([contact("C7"), contact("C8")])
+
+    assert events == [
+        ("update", ["C7", "C8"]), ("update", ["C7"]), ("update", ["C8"]), ("erp", "C7"),
+    ]
+    assert result["updated"] == 1
+    assert [failure["contact"]["contactId"] for failure in result["failed"]] == ["C8"]
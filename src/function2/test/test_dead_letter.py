@@ -0,0 +1,105 @@
+import os
+from unittest.mock import ANY, patch
+import handler
+import json_codec
+from dead_letter import DeadLetterFile, FailureLog, spill_failures
+from db_operation_company import insert_or_update_company
+
+
+def test_spill_failures_writes_ndjson_and_caps_summary(tmp_path):
+    """Should stream every failure to the file and keep only counts plus a sample."""
+    dead_letters = DeadLetterFile(str(tmp_path / "dead.ndjson"))
+    result = {
+        "inserted": 1,
+        "failed": [
+            {"company": {"accountId": i}, "error": "boom", "error_class": "IntegrityError"}
+            for i in range(4)
+        ] + [{"company": {"accountName": "X"}, "error": "Missing mandatory fields"}],
+    }
+
+    summary = spill_failures(result, "company", dead_letters, sample_size=2)
+
+    assert summary["inserted"] == 1
+    assert summary["failed"] == 5
+    assert summary["failed_sample"] == result["failed"][:2]
+    with open(dead_letters.path, "rb") as f:
+        entries = [json_codec.loads(line) for line in f]
+    assert [entry["record"] for entry in entries][:2] == [{"accountId": 0}, {"accountId": 1}]
+    assert entries[0]["stage"] == "company" and entries[0]["error_class"] == "IntegrityError"
+    assert entries[4]["error_class"] == "ValidationError"
+
+
+def test_failure_log_writes_as_failures_happen(tmp_path):
+    """Should write each failure when it is added and keep only the count, a sample and the failed keys."""
+    dead_letters = DeadLetterFile(str(tmp_path / "dead.ndjson"))
+    failures = FailureLog("company", dead_letters, key_field="accountId", sample_size=1)
+
+    failures.append({"company": {"accountId": 1}, "error": "boom"})
+    assert DeadLetterFile(dead_letters.path).take(("company",))["company"] == [{"accountId": 1}]
+    failures.extend([{"company": {"accountId": 2}, "error": "boom"}, {"company": {"accountId": 2}, "error": "again"}])
+
+    assert len(failures) == 3
+    assert failures.summary() == {
+        "failed": 3,
+        "failed_sample": [{"company": {"accountId": 1}, "error": "boom"}],
+        "dead_letter_file": dead_letters.path,
+        "failed_keys": [1, 2],
+    }
+    with open(dead_letters.path, "rb") as f:
+        assert [json_codec.loads(line)["record"] for line in f] == [{"accountId": 2}, {"accountId": 2}]
+
+    failures.append({"error": "no record"})
+    assert failures.summary()["failed_keys"] is None
+    assert FailureLog("user").summary() == {"failed": []}
+
+
+def test_company_load_writes_failures_to_dead_letters(tmp_path):
+    """Should hand the loader's failures to the dead-letter file and return only counts and a sample."""
+    dead_letters = DeadLetterFile(str(tmp_path / "dead.ndjson"))
+    env = {
+        "DB_BACKEND": "sqlite",
+        "SQLITE_PATH": str(tmp_path / "local.sqlite"),
+        "HANA_SCHEMA": "TEST_SCHEMA",
+        "DEAD_LETTER_SAMPLE_SIZE": "1",
+    }
+    with patch.dict(os.environ, env):
+        result = insert_or_update_company(
+            [{"accountId": 1, "accountName": "A"}, {"accountId": 2}, {"accountName": "X"}],
+            dead_letters=dead_letters,
+        )
+
+    assert result["inserted"] == 1
+    assert result["failed"] == 2 and len(result["failed_sample"]) == 1
+    assert result["failed_keys"] == [2]
+    assert DeadLetterFile(dead_letters.path).take(("company",))["company"] == [{"accountId": 2}, {"accountName": "X"}]
+
+
+def test_reprocess_mode_loads_only_dead_letters(tmp_path):
+    """Should load the dead-letter records per stage and re-spill the ones failing again."""
+    path = str(tmp_path / "dead.ndjson")
+    dead_letters = DeadLetterFile(path)
+    dead_letters.write("company", [{"company": {"accountId": 1, "accountName": "A"}, "error": "x"}])
+    dead_letters.write("contact", [
+        {"contact": {"contactId": 10, "accountId": 1}, "error": "x"},
+        {"contact": {"contactId": 20, "accountId": 2}, "error": "x"},
+    ])
+
+    with patch.dict(os.environ, {"HANDLER_MODE": "reprocess", "DEAD_LETTER_PATH": path}), \
+            patch("db_operation_company.insert_or_update_company") as mock_company, \
+            patch("db_operation_contact.insert_or_update_contact") as mock_contact, \
+            patch("builtins.print"):
+        mock_company.return_value = {"inserted": 1, "updated": 0, "failed": []}
+        mock_contact.return_value = {
+            "inserted": 1, "updated": 0,
+            "failed": [{"contact": {"contactId": 20, "accountId": 2}, "error": "still failing"}],
+        }
+        handler.main(event=None, context=None)
+
+    mock_company.assert_called_once_with([{"accountId": 1, "accountName": "A"}], dead_letters=ANY)
+    mock_contact.assert_called_once_with(
+        [{"contactId": 10, "accountId": 1}, {"contactId": 20, "accountId": 2}], dead_letters=ANY
+    )
+    assert not os.path.exists(dead_letters.reprocessing_path)
+    assert DeadLetterFile(path).take(("company", "contact")) == {
+        "company": [], "contact": [{"contactId": 20, "accountId": 2}],
+    }
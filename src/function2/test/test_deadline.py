@@ -0,0 +1,73 @@
+import os
+from itertools import count
+from unittest.mock import patch
+import pytest
+from db_operation_company import insert_or_update_company
+from deadline import Checkpoint, Deadline
+
+
+@pytest.fixture
+def sqlite_env(tmp_path):
+    env = {
+        "DB_BACKEND": "sqlite",
+        "SQLITE_PATH": str(tmp_path / "local.sqlite"),
+        "HANA_SCHEMA": "TEST_SCHEMA",
+        "CRM_BATCH_SIZE": "1",
+        "BATCH_ADAPTIVE": "0",
+    }
+    with patch.dict(os.environ, env):
+        yield
+
+
+def test_deadline_budget_from_context_or_env():
+    """Should take the remaining time from the context, else TIME_BUDGET_SECONDS, else unlimited."""
+    class Context:
+        def get_remaining_time_in_millis(self):
+            return 30000
+
+    with patch.dict(os.environ, {"TIME_BUDGET_SECONDS": "5", "DEADLINE_RESERVE_SECONDS": "1"}):
+        assert 29 < Deadline.from_context(Context()).remaining() <= 30
+        assert 4 < Deadline.from_context(None).remaining() <= 5
+    with patch.dict(os.environ, {}, clear=True):
+        assert not Deadline.from_context(None).is_limited
+
+    deadline = Deadline(budget_seconds=10, reserve_seconds=2, clock=lambda: 0.0)
+    deadline.record(rows=100, seconds=1.0)
+    assert deadline.allows(700)
+    assert not deadline.allows(900)
+
+
+def test_company_load_stops_at_deadline_with_resume_offset(sqlite_env):
+    """Should stop pulling chunks when the budget runs out and return the input offset to resume from."""
+    ticks = count()
+    deadline = Deadline(budget_seconds=1.0, reserve_seconds=0, clock=lambda: next(ticks) * 0.4)
+    companies = [
+        {"accountId": 1, "accountName": "A"},
+        {"accountId": 2},  # invalid, before the stop
+        {"accountId": 3, "accountName": "C"},
+        {"accountId": 4, "accountName": "D"},
+        {"accountId": 5, "accountName": "E"},
+        {"accountId": 6},  # invalid, after the stop → reported by the next invocation
+    ]
+
+    result = insert_or_update_company(companies, deadline=deadline)
+
+    assert result["continue"] is True
+    assert result["inserted"] == 3
+    assert result["next_offset"] == 4
+    assert [failure["company"]["accountId"] for failure in result["failed"]] == [2]
+
+    rest = insert_or_update_company(companies[result["next_offset"]:])
+    assert rest["inserted"] == 1 and "continue" not in rest
+    assert [failure["company"]["accountId"] for failure in rest["failed"]] == [6]
+
+
+def test_checkpoint_round_trip(tmp_path):
+    checkpoint = Checkpoint(str(tmp_path / "checkpoint.json"))
+    assert checkpoint.load() is None
+
+    checkpoint.save(stage="contact", offset=500, failed_accounts=[7])
+    assert checkpoint.load() == {"stage": "contact", "offset": 500, "failed_accounts": [7]}
+
+    checkpoint.clear()
+    assert checkpoint.load() is None
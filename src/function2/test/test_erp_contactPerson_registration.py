@@ -1,7 +1,7 @@
 import os
 import uuid
 from datetime import datetime
-from unittest.mock import patch, MagicMock
+from unittest.mock import ANY, patch, MagicMock
 import erp_contactPerson_registration as erp_module
 
 
@@ -35,6 +35,7 @@ def test_register_new_erp_contact():
             MagicMock(fetchone=MagicMock(return_value=("ERP_CUST_001",))),  # Customer lookup
             MagicMock(fetchone=MagicMock(return_value=None)),              # Contact lookup
             MagicMock(),                                                   # Insert contact
+            MagicMock(),                                                   # Outbox event
         ]
 
         contact_person_id = erp_module.register_contact_as_erp(
@@ -51,8 +52,11 @@ def test_register_new_erp_contact():
         )
 
         assert contact_person_id == "CP1234567"
+        outbox_params = mock_conn.execute.call_args_list[-1][0][1]
+        assert outbox_params["eventType"] == "erp.contact.registered"
+        assert outbox_params["contactPersonId"] == "CP1234567"
         mock_id_gen.assert_called_once_with(
-            id_type="contactPersonId", start_range=2000000, end_range=2999999
+            id_type="contactPersonId", start_range=2000000, end_range=2999999, record_log=ANY
         )
 
 
@@ -71,9 +75,10 @@ def test_update_existing_erp_contact():
         mock_conn.execute.side_effect = [
             MagicMock(fetchone=MagicMock(return_value=("ERP_CUST_002",))),  # Customer lookup
             MagicMock(fetchone=MagicMock(
-                return_value=("CP_EXISTING", True, datetime(2024, 1, 1))
+                return_value=("CP_EXISTING", True, datetime(2024, 1, 1), "old-hash")
             )),  # Contact exists
             MagicMock(),  # Update contact
+            MagicMock(),  # Outbox event
         ]
 
         contact_person_id = erp_module.register_contact_as_erp(
@@ -1,7 +1,7 @@
 import os
 import uuid
 from datetime import datetime
-from unittest.mock import patch, MagicMock
+from unittest.mock import ANY, patch, MagicMock
 import pytest
 import erp_customer_registration as erp_module
 
@@ -58,7 +58,8 @@ def test_register_new_erp_customer():
         mock_id_gen.assert_called_once_with(
             id_type="customerId",
             start_range=1000000,
-            end_range=9999999
+            end_range=9999999,
+            record_log=ANY,
         )
 
 
@@ -77,7 +78,7 @@ def test_update_existing_erp_customer():
 
         # Existing customer found → Update it
         mock_conn.execute.side_effect = [
-            MagicMock(fetchone=MagicMock(return_value=("CUST_EXISTING", datetime(2024, 1, 1)))),  # ✅ Only 2 values
+            MagicMock(fetchone=MagicMock(return_value=("CUST_EXISTING", datetime(2024, 1, 1), "old-hash"))),
             MagicMock(),
         ]
 
@@ -100,3 +101,28 @@ def test_missing_schema_raises_value_error():
                 status="active"
             )
         assert "HANA_SCHEMA is not set" in str(exc.value)
+
+
+def test_unchanged_erp_customer_is_not_updated():
+    """Should skip the UPDATE if rowHash shows name and status are unchanged."""
+    mock_engine, mock_conn = mock_engine_context()
+    row_hash = erp_module.compute_row_hash(
+        {"name": "Same Company", "status": "active"}, erp_module.ERP_CUSTOMER_HASH_FIELDS
+    )
+
+    with patch("erp_customer_registration.get_hana_client") as mock_get_client, \
+         patch.dict(os.environ, {"HANA_SCHEMA": "TEST_SCHEMA"}):
+
+        mock_get_client.return_value = mock_engine
+        mock_conn.execute.return_value.fetchone.return_value = (
+            "CUST_SAME", datetime(2024, 1, 1), row_hash
+        )
+
+        customer_id = erp_module.register_company_as_customer(
+            account_id="CRM003",
+            account_name="Same Company",
+            status="active"
+        )
+
+        assert customer_id == "CUST_SAME"
+        assert mock_conn.execute.call_count == 1  # lookup only
@@ -0,0 +1,54 @@
+import gzip
+import base64
+import pytest
+from deadline import EventCheckpoint
+from event_input import has_input, iter_records, read_records
+
+RECORDS = [{"accountId": 1, "accountName": "Acme"}, {"accountId": 2, "accountName": "Globex"}]
+JSON_ARRAY = b'[{"accountId": 1, "accountName": "Acme"}, {"accountId": 2, "accountName": "Globex"}]'
+NDJSON = b'{"accountId": 1, "accountName": "Acme"}\n\n{"accountId": 2, "accountName": "Globex"}\n'
+
+
+def test_iter_records_accepts_lists_json_arrays_and_ndjson():
+    """Should parse parsed lists, JSON arrays and NDJSON (str or bytes) alike."""
+    assert list(iter_records(RECORDS)) == RECORDS
+    assert list(iter_records(JSON_ARRAY)) == RECORDS
+    assert list(iter_records(JSON_ARRAY.decode("utf-8"))) == RECORDS
+    assert list(iter_records(b"\n  " + JSON_ARRAY)) == RECORDS
+    assert list(iter_records(NDJSON)) == RECORDS
+    assert list(iter_records(b"")) == []
+
+
+def test_iter_records_decompresses_gzip_and_base64():
+    """Should gunzip gzip payloads and base64-decode when flagged."""
+    assert list(iter_records(gzip.compress(NDJSON))) == RECORDS
+    encoded = base64.b64encode(gzip.compress(JSON_ARRAY)).decode("ascii")
+    assert list(iter_records(encoded, base64_encoded=True)) == RECORDS
+
+
+def test_read_records_from_event():
+    """Should stream the records of one key of the event, none if it is missing."""
+    event = {"companies": base64.b64encode(NDJSON).decode("ascii"), "isBase64Encoded": True}
+
+    assert has_input(event, ("companies", "contacts"))
+    assert not has_input({"mode": "load"}, ("companies", "contacts"))
+    assert not has_input(None, ("companies",))
+    assert list(read_records(event, "companies")) == RECORDS
+    assert list(read_records(event, "contacts")) == []
+
+
+def test_read_records_rejects_other_payloads():
+    """Should raise ValueError naming the expected shape for a dict (or other) payload."""
+    with pytest.raises(ValueError, match="expected a list of records or a JSON array / NDJSON"):
+        list(read_records({"companies": RECORDS[0]}, "companies"))
+    with pytest.raises(ValueError, match="type int"):
+        list(iter_records(42))
+
+
+def test_event_checkpoint_returns_position_to_caller():
+    """Should resume from event["resume"] and store nothing."""
+    checkpoint = EventCheckpoint({"resume": {"stage": "contact", "offset": 3}})
+
+    assert checkpoint.load() == {"stage": "contact", "offset": 3}
+    assert checkpoint.save(stage="company", offset=5) == {"stage": "company", "offset": 5}
+    assert EventCheckpoint(None).load() is None
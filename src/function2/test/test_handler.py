@@ -1,15 +1,32 @@
+import os
+import json
+import sys
+import tempfile
+import subprocess
 import unittest
-from unittest.mock import patch, mock_open
+from unittest.mock import ANY, patch, mock_open
 import handler
+from dead_letter import DeadLetterFile
 
 
 
 class TestHandler(unittest.TestCase):
 
+    def setUp(self):
+        # Keep checkpoints and dead letters of these runs out of the shared temp files
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        env = patch.dict(os.environ, {
+            "CHECKPOINT_PATH": os.path.join(self.tmp_dir.name, "checkpoint.json"),
+            "DEAD_LETTER_PATH": os.path.join(self.tmp_dir.name, "dead_letters.ndjson"),
+        })
+        env.start()
+        self.addCleanup(env.stop)
+        self.addCleanup(self.tmp_dir.cleanup)
+
     @patch("builtins.open", new_callable=mock_open)
-    @patch("json.load")
-    @patch("handler.insert_or_update_company")
-    @patch("handler.insert_or_update_contact")
+    @patch("json_codec.load")
+    @patch("db_operation_company.insert_or_update_company")
+    @patch("db_operation_contact.insert_or_update_contact")
     def test_full_successful_flow(
         self, mock_insert_contact, mock_insert_company,
         mock_json_load, mock_file
@@ -55,8 +72,8 @@ class TestHandler(unittest.TestCase):
                 "Contact data insertion completed successfully.")
 
     @patch("builtins.open", new_callable=mock_open)
-    @patch("json.load")
-    @patch("handler.insert_or_update_company")
+    @patch("json_codec.load")
+    @patch("db_operation_company.insert_or_update_company")
     def test_failed_company_inserts_should_skip_contacts(
         self, mock_insert_company, mock_json_load, mock_file
     ):
@@ -87,7 +104,7 @@ class TestHandler(unittest.TestCase):
             )
 
     @patch("builtins.open", new_callable=mock_open)
-    @patch("json.load")
+    @patch("json_codec.load")
     def test_no_company_data(self, mock_json_load, mock_file):
         mock_json_load.return_value = []  # Empty company data
 
@@ -97,8 +114,8 @@ class TestHandler(unittest.TestCase):
                 "⚠️ No company data found in company_data.json\n")
 
     @patch("builtins.open", new_callable=mock_open)
-    @patch("json.load")
-    @patch("handler.insert_or_update_company")
+    @patch("json_codec.load")
+    @patch("db_operation_company.insert_or_update_company")
     def test_no_contact_data(
         self, mock_insert_company, mock_json_load, mock_file
     ):
@@ -130,6 +147,160 @@ class TestHandler(unittest.TestCase):
             mock_open_file.assert_called()
             mock_print.assert_not_called()  # Error occurs before prints
 
+    @patch("db_operation_company.insert_or_update_company")
+    @patch("reconciliation.reconcile")
+    def test_reconcile_mode_skips_file_load(self, mock_reconcile, mock_insert_company):
+        mock_reconcile.return_value = {"detected": {}, "repaired": {}, "failed": []}
+
+        with patch("builtins.print"):
+            handler.main(event={"mode": "reconcile", "repair": False}, context=None)
+
+        mock_reconcile.assert_called_once_with(repair=False)
+        mock_insert_company.assert_not_called()
+
+    @patch("builtins.open", new_callable=mock_open)
+    @patch("json_codec.load")
+    @patch("db_operation_company.insert_or_update_company")
+    @patch("db_operation_contact.insert_or_update_contact")
+    def test_sharded_run_keeps_contacts_with_their_account(
+        self, mock_insert_contact, mock_insert_company, mock_json_load, mock_file
+    ):
+        companies = [{"accountId": account_id, "accountName": f"Company {account_id}"} for account_id in range(1, 21)]
+        contacts = [{"contactId": 100 + account_id, "accountId": account_id} for account_id in range(1, 21)]
+        mock_json_load.side_effect = [companies, contacts]
+        mock_insert_company.return_value = {"inserted": 1, "updated": 0, "failed": []}
+        mock_insert_contact.return_value = {"inserted": 1, "updated": 0, "failed": []}
+
+        with patch("builtins.print"):
+            handler.main(event={"shard_index": 1, "shard_count": 3}, context=None)
+
+        loaded_companies = mock_insert_company.call_args[0][0]
+        loaded_contacts = mock_insert_contact.call_args[0][0]
+        self.assertTrue(0 < len(loaded_companies) < len(companies))
+        self.assertEqual(
+            [company["accountId"] for company in loaded_companies],
+            [contact["accountId"] for contact in loaded_contacts],
+        )
+
+    @patch("builtins.open", new_callable=mock_open)
+    @patch("json_codec.load")
+    @patch("db_operation_company.insert_or_update_company")
+    @patch("db_operation_contact.insert_or_update_contact")
+    def test_contacts_of_failed_accounts_are_deferred(
+        self, mock_insert_contact, mock_insert_company, mock_json_load, mock_file
+    ):
+        mock_json_load.side_effect = [
+            [{"accountId": 1, "accountName": "Good"}, {"accountId": 2, "accountName": "Bad"}],
+            [{"contactId": 10, "accountId": 1}, {"contactId": 20, "accountId": 2}],
+        ]
+        mock_insert_company.return_value = {
+            "inserted": 1,
+            "updated": 0,
+            "failed": [{"company": {"accountId": 2, "accountName": "Bad"}, "error": "DB error"}],
+        }
+        mock_insert_contact.return_value = {"inserted": 1, "updated": 0, "failed": []}
+
+        with patch("builtins.print") as mock_print:
+            handler.main(event=None, context=None)
+
+        mock_insert_contact.assert_called_once_with([{"contactId": 10, "accountId": 1}], dead_letters=ANY)
+        mock_print.assert_any_call("⏸️ Deferred 1 contact(s) of failed accounts [2]")
+
+    @patch("builtins.open", new_callable=mock_open)
+    @patch("json_codec.load")
+    @patch("db_operation_company.insert_or_update_company")
+    @patch("db_operation_contact.insert_or_update_contact")
+    def test_contacts_are_deferred_by_failed_keys_of_spilled_failures(
+        self, mock_insert_contact, mock_insert_company, mock_json_load, mock_file
+    ):
+        mock_json_load.side_effect = [
+            [{"accountId": 1, "accountName": "Good"}, {"accountId": 2, "accountName": "Bad"}],
+            [{"contactId": 10, "accountId": 1}, {"contactId": 20, "accountId": 2}],
+        ]
+        mock_insert_company.return_value = {"inserted": 1, "updated": 0, "failed": 1, "failed_keys": [2]}
+        mock_insert_contact.return_value = {"inserted": 1, "updated": 0, "failed": 0}
+
+        with patch("builtins.print"):
+            handler.main(event=None, context=None)
+
+        mock_insert_contact.assert_called_once_with([{"contactId": 10, "accountId": 1}], dead_letters=ANY)
+
+    @patch("json_codec.load")
+    @patch("db_operation_company.insert_or_update_company")
+    @patch("db_operation_contact.insert_or_update_contact")
+    def test_event_records_replace_bundled_files(
+        self, mock_insert_contact, mock_insert_company, mock_json_load
+    ):
+        mock_insert_contact.return_value = {"inserted": 1, "updated": 0, "failed": []}
+        event = {"contacts": b'{"contactId": 10, "accountId": 1}\n{"contactId": 20, "accountId": 1}\n'}
+
+        with patch("builtins.print"):
+            result = handler.main(event=event, context=None)
+
+        mock_json_load.assert_not_called()
+        mock_insert_company.assert_not_called()
+        mock_insert_contact.assert_called_once_with(
+            [{"contactId": 10, "accountId": 1}, {"contactId": 20, "accountId": 1}], dead_letters=ANY
+        )
+        self.assertEqual(result, {"continue": False})
+
+    @patch("db_operation_contact.insert_or_update_contact")
+    def test_event_contacts_are_loaded_in_input_batches(self, mock_insert_contact):
+        contacts = [{"contactId": 10 * i, "accountId": 2 - i % 2} for i in range(1, 6)]
+        event = {
+            "contacts": "".join(json.dumps(contact) + "\n" for contact in contacts),
+            "resume": {"stage": "contact", "offset": 1, "failed_accounts": [2]},
+        }
+        # The second batch stops before its ready contact: the deferral before it is reported
+        mock_insert_contact.side_effect = [
+            {"inserted": 1, "updated": 0, "failed": []},
+            {"inserted": 0, "updated": 0, "failed": [], "continue": True, "next_offset": 0},
+        ]
+
+        with patch.dict(os.environ, {"INPUT_BATCH_SIZE": "2"}), patch("builtins.print") as mock_print:
+            result = handler.main(event=event, context=None)
+
+        self.assertEqual(
+            [call.args[0] for call in mock_insert_contact.call_args_list], [[contacts[2]], [contacts[4]]]
+        )
+        self.assertEqual(result["checkpoint"], {"stage": "contact", "offset": 4, "failed_accounts": [2]})
+        mock_print.assert_any_call("⏸️ Deferred 2 contact(s) of failed accounts [2]")
+        deferred = DeadLetterFile(os.environ["DEAD_LETTER_PATH"]).take(("contact",))["contact"]
+        self.assertEqual(deferred, [contacts[1], contacts[3]])
+
+    @patch("event_input.read_file")
+    @patch("db_operation_company.insert_or_update_company")
+    @patch("db_operation_contact.insert_or_update_contact")
+    def test_deadline_stop_with_untied_failures_saves_checkpoint(
+        self, mock_insert_contact, mock_insert_company, mock_read_file
+    ):
+        companies = [{"accountId": i, "accountName": f"Company {i}"} for i in range(1, 5)]
+        mock_read_file.return_value = companies
+        mock_insert_company.side_effect = [
+            {"inserted": 1, "updated": 0, "failed": [{"error": "DB error"}], "continue": True, "next_offset": 2},
+            {"inserted": 2, "updated": 0, "failed": []},
+        ]
+
+        with patch("builtins.print"):
+            first = handler.main(event=None, context=None)
+            second = handler.main(event=None, context=None)
+
+        self.assertEqual(first["checkpoint"], {"stage": "company", "offset": 2, "failed_accounts": None})
+        self.assertEqual(mock_insert_company.call_args_list[1].args[0], companies[2:])
+        self.assertIsNone(second)  # failures of the first run still skip the contacts
+        mock_insert_contact.assert_not_called()
+
+    def test_feature_modules_are_not_imported_with_the_handler(self):
+        probe = (
+            "import sys, handler; print(sorted(m for m in ('work_queue', 'reconciliation', "
+            "'backfill', 'id_store_outbox', 'db_operation_company', 'cProfile') if m in sys.modules))"
+        )
+        output = subprocess.run(
+            [sys.executable, "-c", probe], cwd=os.path.dirname(handler.__file__),
+            capture_output=True, text=True, check=True,
+        ).stdout
+        self.assertEqual(output.strip(), "[]")
+
 
 if __name__ == "__main__":
     unittest.main()
@@ -1,5 +1,7 @@
 import os
+import tempfile
 import unittest
+from concurrent.futures import ThreadPoolExecutor
 from unittest.mock import patch, MagicMock
 from id_generation import generate_sequential_id
 
@@ -22,8 +24,8 @@ class TestIdGeneration(unittest.TestCase):
         mock_engine, mock_conn = mock_engine_context()
         mock_get_client.return_value = mock_engine
 
-        # Simulate no data in the table (MAX returns None)
-        mock_conn.execute.return_value.fetchone.return_value = (None,)
+        # Simulate no counter row yet and no data in the table (MAX returns None)
+        mock_conn.execute.return_value.fetchone.side_effect = [None, (None,)]
 
         start_range = 1000
         end_range = 9999
@@ -39,8 +41,8 @@ class TestIdGeneration(unittest.TestCase):
         mock_engine, mock_conn = mock_engine_context()
         mock_get_client.return_value = mock_engine
 
-        # Simulate existing max ID = 1005
-        mock_conn.execute.return_value.fetchone.return_value = (1005,)
+        # Simulate no counter row yet and existing max ID = 1005
+        mock_conn.execute.return_value.fetchone.side_effect = [None, (1005,)]
 
         start_range = 1000
         end_range = 9999
@@ -56,8 +58,8 @@ class TestIdGeneration(unittest.TestCase):
         mock_engine, mock_conn = mock_engine_context()
         mock_get_client.return_value = mock_engine
 
-        # Simulate existing max ID = 9999 (equal to end_range)
-        mock_conn.execute.return_value.fetchone.return_value = (9999,)
+        # Simulate the counter incremented past end_range
+        mock_conn.execute.return_value.fetchone.return_value = (10000,)
 
         start_range = 1000
         end_range = 9999
@@ -101,6 +103,34 @@ class TestIdGeneration(unittest.TestCase):
                 "Environment variable HANA_SCHEMA is not set."
             )
 
+    @patch("id_generation.get_hana_client")
+    def test_generate_sequential_id_from_counter(self, mock_get_client):
+        """Test when the counter row exists, it should return its incremented value without reading MAX."""
+        mock_engine, mock_conn = mock_engine_context()
+        mock_get_client.return_value = mock_engine
+        mock_conn.execute.return_value.fetchone.return_value = (1007,)
+
+        new_id = generate_sequential_id("customerId", 1000, 9999)
+
+        self.assertEqual(new_id, "1007")
+        statements = [str(call.args[0]) for call in mock_conn.execute.call_args_list]
+        self.assertTrue(statements[0].startswith("UPDATE TEST_SCHEMA.SPUSER_STAGING_ID_COUNTERS"))
+        self.assertFalse(any("MAX(" in statement for statement in statements))
+
+    def test_concurrent_allocations_are_unique(self):
+        """Test that parallel workers never receive the same ID (local SQLite backend)."""
+        with tempfile.TemporaryDirectory() as tmp, patch.dict(os.environ, {
+            "DB_BACKEND": "sqlite",
+            "SQLITE_PATH": os.path.join(tmp, "ids.sqlite"),
+            "HANA_SCHEMA": "TEST_SCHEMA",
+        }):
+            with ThreadPoolExecutor(max_workers=8) as pool:
+                ids = list(pool.map(
+                    lambda _: generate_sequential_id("contactPersonId", 2000000, 2999999), range(40)
+                ))
+
+        self.assertEqual(sorted(ids), [str(2000000 + i) for i in range(40)])
+
 
 if __name__ == "__main__":
     unittest.main()
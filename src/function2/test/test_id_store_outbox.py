@@ -0,0 +1,100 @@
+import os
+import json
+import threading
+import pytest
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from unittest.mock import MagicMock, patch
+from sqlalchemy import text
+from db_connection import get_hana_client
+from db_operation_company import insert_or_update_company
+from db_operation_contact import insert_or_update_contact
+from id_store_outbox import FileSink, HttpSink, dispatch_outbox
+
+CONTACT = {
+    "contactId": 101, "accountId": 10, "accountName": "NextGen", "crmToErpFlag": True,
+    "firstName": "Ravi", "lastName": "Kumar", "cshmeFlag": True,
+    "email": "ravi.kumar@nextgen.com", "department": "Engineering",
+    "country": "India", "zipCode": "122018", "phoneNo": "8882719739", "status": "active",
+}
+
+
+@pytest.fixture
+def sqlite_env(tmp_path):
+    env = {
+        "DB_BACKEND": "sqlite",
+        "SQLITE_PATH": str(tmp_path / "local.sqlite"),
+        "HANA_SCHEMA": "TEST_SCHEMA",
+    }
+    with patch.dict(os.environ, env):
+        insert_or_update_company([
+            {"accountId": 10, "accountName": "NextGen", "crmToErpFlag": True, "status": "active"},
+        ])
+        yield
+
+
+def outbox_rows():
+    with get_hana_client().connect() as connection:
+        return connection.execute(text(
+            "SELECT eventType, contactPersonId, attempts, dispatchedAt, lastError "
+            "FROM TEST_SCHEMA.SPUSER_STAGING_ID_STORE_OUTBOX ORDER BY createdAt"
+        )).fetchall()
+
+
+def test_erp_contact_changes_are_written_to_outbox_and_dispatched(sqlite_env, tmp_path):
+    """Should add one event per ERP insert/update and mark them dispatched after the sink accepted them."""
+    insert_or_update_contact([CONTACT])
+    insert_or_update_contact([{**CONTACT, "status": "inactive"}])
+    insert_or_update_contact([{**CONTACT, "status": "inactive"}])  # unchanged → no event
+
+    assert [row.eventType for row in outbox_rows()] == ["erp.contact.registered", "erp.contact.updated"]
+
+    sink_path = tmp_path / "events.ndjson"
+    result = dispatch_outbox(FileSink(str(sink_path)), batch_size=1)
+
+    assert result == {"dispatched": 2, "failed_batches": 0, "pending": 0, "dead": 0}
+    events = [json.loads(line) for line in sink_path.read_text().splitlines()]
+    assert [event["data"]["status"] for event in events] == ["active", "inactive"]
+    assert {event["contactPersonId"] for event in events} == {"2000000"}
+    assert all(row.dispatchedAt is not None for row in outbox_rows())
+    assert dispatch_outbox(FileSink(str(sink_path)))["dispatched"] == 0
+
+
+def test_failed_batches_are_retried_until_max_attempts(sqlite_env):
+    """Should count an attempt per failed batch and stop picking events up after max_attempts."""
+    insert_or_update_contact([CONTACT])
+    sink = MagicMock()
+    sink.send.side_effect = ConnectionError("ID store down")
+
+    assert dispatch_outbox(sink, max_attempts=2) == {"dispatched": 0, "failed_batches": 1, "pending": 1, "dead": 0}
+    assert dispatch_outbox(sink, max_attempts=2) == {"dispatched": 0, "failed_batches": 1, "pending": 0, "dead": 1}
+    assert dispatch_outbox(sink, max_attempts=2)["failed_batches"] == 0
+    (row,) = outbox_rows()
+    assert row.attempts == 2 and row.dispatchedAt is None
+    assert row.lastError == "ConnectionError: ID store down"
+
+
+def test_http_sink_posts_batch_to_stub():
+    """Should POST the batch as {"events": [...]} and raise on error responses."""
+    received = []
+
+    class Stub(BaseHTTPRequestHandler):
+        def do_POST(self):
+            received.append(json.loads(self.rfile.read(int(self.headers["Content-Length"]))))
+            self.send_response(200 if len(received) == 1 else 503)
+            self.end_headers()
+
+        def log_message(self, *args):
+            pass
+
+    server = HTTPServer(("127.0.0.1", 0), Stub)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    try:
+        sink = HttpSink(f"http://127.0.0.1:{server.server_port}/events", timeout=5)
+        sink.send([{"eventId": "e1"}])
+        with pytest.raises(Exception):
+            sink.send([{"eventId": "e2"}])
+    finally:
+        server.shutdown()
+        server.server_close()
+
+    assert received == [{"events": [{"eventId": "e1"}]}, {"events": [{"eventId": "e2"}]}]
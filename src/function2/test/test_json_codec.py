@@ -0,0 +1,31 @@
+import os
+import importlib
+from datetime import datetime
+from unittest.mock import patch
+import json_codec
+
+
+def test_every_backend_parses_and_serializes_the_same():
+    """Should give identical results for stdlib json and any faster installed backend."""
+    document = b'[{"accountId": 1, "accountName": "Caf\xc3\xa9", "crmToErpFlag": true, "zip": null}]'
+    report = {"failed": [{"accountId": 1, "error": ValueError("boom")}], "at": datetime(2024, 1, 2, 3, 4, 5)}
+
+    results = {
+        name: (loads(document), json_codec.BACKENDS["json"][0](dumps(report)))
+        for name, (loads, dumps) in json_codec.BACKENDS.items()
+    }
+
+    for parsed, dumped in results.values():
+        assert parsed == [{"accountId": 1, "accountName": "Café", "crmToErpFlag": True, "zip": None}]
+        assert dumped == {"failed": [{"accountId": 1, "error": "boom"}], "at": "2024-01-02T03:04:05"}
+
+
+def test_unknown_backend_falls_back_to_stdlib_json():
+    """Should use stdlib json when JSON_BACKEND names a library that is not installed."""
+    with patch.dict(os.environ, {"JSON_BACKEND": "no-such-json"}):
+        assert json_codec.select_backend() == "json"
+    with patch.dict(os.environ, {"JSON_BACKEND": "json"}):
+        codec = importlib.reload(json_codec)
+        assert codec.BACKEND == "json"
+        assert codec.loads('{"a": [1, 2]}') == {"a": [1, 2]}
+    importlib.reload(json_codec)
@@ -0,0 +1,89 @@
+import os
+import uuid
+import pytest
+from unittest.mock import patch
+from sqlalchemy import create_engine, text
+from key_generation import deterministic_key, make_key, upsert_statement
+
+
+def test_make_key_is_random_by_default():
+    """Should generate a UUIDv4 if DETERMINISTIC_KEYS is not set."""
+    with patch.dict(os.environ, {}, clear=True):
+        assert uuid.UUID(make_key("P_USERS", "P1")).version == 4
+        assert make_key("P_USERS", "P1") != make_key("P_USERS", "P1")
+
+
+def test_make_key_is_deterministic_when_enabled():
+    """Should derive the same UUIDv5 from entity and business key."""
+    with patch.dict(os.environ, {"DETERMINISTIC_KEYS": "1"}):
+        key = make_key("ERP_CUSTOMERS_CONTACTS", 10, "a@example.com")
+
+    assert key == deterministic_key("ERP_CUSTOMERS_CONTACTS", 10, "a@example.com")
+    assert uuid.UUID(key).version == 5
+    assert key != deterministic_key("CRM_COMPANY_CONTACTS", 10, "a@example.com")
+
+
+def test_upsert_statement_sqlite_inserts_then_updates_listed_columns():
+    """Should insert new keys and update only the listed columns of existing ones."""
+    engine = create_engine("sqlite://")
+    with engine.begin() as connection:
+        connection.execute(text(
+            "CREATE TABLE t (uuid TEXT PRIMARY KEY, name TEXT, erpNo TEXT)"
+        ))
+        connection.execute(text("INSERT INTO t VALUES ('k1', 'old', 'ERP1')"))
+
+        statement = upsert_statement(connection, "t", ("uuid", "name"))
+        connection.execute(statement, [{"uuid": "k1", "name": "new"}, {"uuid": "k2", "name": "b"}])
+        rows = connection.execute(text("SELECT uuid, name, erpNo FROM t ORDER BY uuid")).fetchall()
+
+    assert rows == [("k1", "new", "ERP1"), ("k2", "b", None)]
+
+
+def test_upsert_statement_hana_syntax():
+    """Should use UPSERT ... WITH PRIMARY KEY on HANA."""
+    connection = type("Conn", (), {"dialect": type("Dialect", (), {"name": "hana"})()})()
+    statement = upsert_statement(connection, "S.T", ("uuid", "name"))
+    assert str(statement) == "UPSERT S.T (uuid, name) VALUES (:uuid, :name) WITH PRIMARY KEY"
+
+    connection.dialect.name = "postgresql"
+    with pytest.raises(ValueError):
+        upsert_statement(connection, "S.T", ("uuid", "name"))
+
+
+def test_upsert_statement_sqlite_update_columns_keep_insert_only_columns():
+    """Should match on key_column, keep columns outside update_columns and skip rows with the same rowHash."""
+    engine = create_engine("sqlite://")
+    with engine.begin() as connection:
+        connection.execute(text(
+            "CREATE TABLE t (uuid TEXT PRIMARY KEY, userId TEXT UNIQUE, name TEXT, created TEXT, rowHash TEXT)"
+        ))
+        connection.execute(text("INSERT INTO t VALUES ('legacy', 'U1', 'old', '2020', 'h1')"))
+        connection.execute(text("INSERT INTO t VALUES ('k3', 'U3', 'same', '2020', 'h3')"))
+
+        statement = upsert_statement(
+            connection, "t", ("uuid", "userId", "name", "created", "rowHash"), "userId",
+            update_columns=("name", "rowHash"),
+        )
+        result = connection.execute(statement, [
+            {"uuid": "k1", "userId": "U1", "name": "new", "created": "2024", "rowHash": "h2"},
+            {"uuid": "k2", "userId": "U2", "name": "b", "created": "2024", "rowHash": "h4"},
+            {"uuid": "k3", "userId": "U3", "name": "other", "created": "2024", "rowHash": "h3"},
+        ])
+        rows = connection.execute(text("SELECT uuid, userId, name, created FROM t ORDER BY userId")).fetchall()
+
+    assert result.rowcount == 2
+    assert rows == [("legacy", "U1", "new", "2020"), ("k2", "U2", "b", "2024"), ("k3", "U3", "same", "2020")]
+
+
+def test_upsert_statement_hana_update_columns_merge_syntax():
+    """Should use MERGE INTO with a changed-rowHash condition on HANA when update_columns are given."""
+    connection = type("Conn", (), {"dialect": type("Dialect", (), {"name": "hana"})()})()
+    statement = upsert_statement(
+        connection, "S.T", ("uuid", "userId", "rowHash"), "userId", update_columns=("rowHash",),
+    )
+    assert str(statement) == (
+        "MERGE INTO S.T t USING (SELECT :uuid AS uuid, :userId AS userId, :rowHash AS rowHash FROM DUMMY) s "
+        "ON t.userId = s.userId WHEN MATCHED AND (t.rowHash IS NULL OR t.rowHash <> s.rowHash) "
+        "THEN UPDATE SET t.rowHash = s.rowHash "
+        "WHEN NOT MATCHED THEN INSERT (uuid, userId, rowHash) VALUES (s.uuid, s.userId, s.rowHash)"
+    )
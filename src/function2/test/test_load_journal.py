@@ -0,0 +1,133 @@
+import os
+import pytest
+from unittest.mock import MagicMock, patch
+from deadline import Deadline
+from load_journal import LoadJournal, load_in_batches, load_with_journal, record_fingerprints
+
+RECORDS = [{"accountId": account_id, "accountName": f"Company {account_id}"} for account_id in range(1, 8)]
+
+
+@pytest.fixture
+def sqlite_env(tmp_path):
+    env = {
+        "DB_BACKEND": "sqlite",
+        "SQLITE_PATH": str(tmp_path / "local.sqlite"),
+        "HANA_SCHEMA": "TEST_SCHEMA",
+    }
+    with patch.dict(os.environ, env):
+        yield
+
+
+def counting_loader():
+    return MagicMock(side_effect=lambda batch, **kwargs: {
+        "inserted": len(batch), "updated": 0, "unchanged": 0, "failed": [],
+    })
+
+
+def test_fingerprints_depend_on_stage_and_content():
+    """Should fingerprint batches and input from the records, per stage."""
+    journal = LoadJournal("company", RECORDS, batch_size=3)
+
+    assert [(start, end) for start, end, _ in journal.batches] == [(0, 3), (3, 6), (6, 7)]
+    assert journal.fingerprint == LoadJournal("company", list(RECORDS), batch_size=3).fingerprint
+    assert journal.fingerprint != LoadJournal("contact", RECORDS, batch_size=3).fingerprint
+    changed = RECORDS[:6] + [{"accountId": 7, "accountName": "Renamed"}]
+    assert LoadJournal("company", changed, batch_size=3).batches[:2] == journal.batches[:2]
+    assert LoadJournal("company", changed, batch_size=3).fingerprint != journal.fingerprint
+
+
+def test_redelivered_input_is_skipped(sqlite_env):
+    """Should load every batch once and skip the whole input on re-delivery."""
+    load = counting_loader()
+
+    first = load_with_journal(load, RECORDS, "company", batch_size=3)
+    second = load_with_journal(load, RECORDS, "company", batch_size=3)
+
+    assert first == {"inserted": 7, "updated": 0, "unchanged": 0, "failed": [], "skipped": 0}
+    assert second == {"inserted": 0, "updated": 0, "unchanged": 0, "failed": [], "skipped": 7}
+    assert load.call_count == 3
+
+
+def test_partially_applied_input_resumes_at_first_unapplied_batch(sqlite_env):
+    """Should skip the batches journaled before a crash and load the rest."""
+    load = counting_loader()
+    load.side_effect = [{"inserted": 3, "failed": []}, RuntimeError("crash")]
+    with pytest.raises(RuntimeError):
+        load_with_journal(load, RECORDS, "company", batch_size=3)
+
+    load = counting_loader()
+    result = load_with_journal(load, RECORDS, "company", batch_size=3)
+
+    assert [call.args[0] for call in load.call_args_list] == [RECORDS[3:6], RECORDS[6:]]
+    assert result["inserted"] == 4 and result["skipped"] == 3
+
+
+def test_deadline_stops_between_batches(sqlite_env):
+    """Should stop before a batch the deadline does not allow and report its input offset."""
+    deadline = Deadline(budget_seconds=50, reserve_seconds=0)
+    load = MagicMock(side_effect=lambda batch, deadline: (
+        deadline.record(len(batch), 60.0), {"inserted": len(batch), "failed": []}
+    )[1])
+
+    result = load_with_journal(load, RECORDS, "company", deadline=deadline, batch_size=3)
+
+    assert result["continue"] is True and result["next_offset"] == 3
+    assert load.call_count == 1
+    resumed = load_with_journal(counting_loader(), RECORDS, "company", batch_size=3)
+    assert resumed["inserted"] == 4 and resumed["skipped"] == 3
+
+
+def test_fingerprints_are_canonical():
+    """Should fingerprint records independently of key order and the active JSON backend."""
+    reordered = [{"accountName": record["accountName"], "accountId": record["accountId"]} for record in RECORDS]
+
+    with patch("json_codec.dumps", side_effect=AssertionError("backend JSON used")):
+        assert record_fingerprints(reordered) == record_fingerprints(RECORDS)
+
+
+
+def test_earlier_content_in_a_later_input_is_applied_again(sqlite_env):
+    """Should apply a delta that sets records back to an earlier state (A→B→A)."""
+    original, changed = RECORDS[:3], [{**record, "accountName": "Renamed"} for record in RECORDS[:3]]
+    for records in (original, changed):
+        load_with_journal(counting_loader(), records, "company", batch_size=3)
+
+    load = counting_loader()
+    result = load_with_journal(load, original + RECORDS[3:4], "company", batch_size=3)
+
+    assert [call.args[0] for call in load.call_args_list] == [original, RECORDS[3:4]]
+    assert result["inserted"] == 4 and result["skipped"] == 0
+
+
+def test_batches_with_failures_are_retried_on_redelivery(sqlite_env):
+    """Should not journal a batch with failed records, so the same input retries it."""
+    load = counting_loader()
+    load.side_effect = lambda batch, **kwargs: {
+        "inserted": len(batch) - 1, "failed": [{"company": batch[-1], "error": "boom"}],
+    } if batch[0] is RECORDS[3] else {"inserted": len(batch), "failed": []}
+    first = load_with_journal(load, RECORDS, "company", batch_size=3)
+
+    load = counting_loader()
+    second = load_with_journal(load, RECORDS, "company", batch_size=3)
+
+    assert len(first["failed"]) == 1
+    assert [call.args[0] for call in load.call_args_list] == [RECORDS[3:6]]
+    assert second["skipped"] == 4
+    assert load_with_journal(counting_loader(), RECORDS, "company", batch_size=3)["skipped"] == 7
+
+
+def test_load_in_batches_merges_results_and_offsets():
+    """Should load a stream of batches and report a loader stop as an offset into the stream."""
+    load = counting_loader()
+    load.side_effect = [
+        {"inserted": 3, "failed": [{"error": "a"}]},
+        {"inserted": 1, "failed": [], "continue": True, "next_offset": 1},
+    ]
+    batches = (RECORDS[start:start + 3] for start in range(0, len(RECORDS), 3))
+
+    result = load_in_batches(load, batches, dead_letters=None)
+
+    assert result == {"inserted": 4, "failed": [{"error": "a"}], "continue": True, "next_offset": 4}
+    assert load.call_count == 2
+    assert next(batches) == RECORDS[6:]  # the rest of the stream is never read
+    assert load_in_batches(load, iter([[]])) is None
@@ -0,0 +1,62 @@
+import os
+import logging
+from unittest.mock import patch
+from log_sampling import RecordLogger, get_sample_rate
+
+test_logger = logging.getLogger("test_log_sampling")
+
+
+def test_full_mode_logs_every_record(caplog):
+    """Should log every record line when LOG_MODE is not set."""
+    with patch.dict(os.environ, {}, clear=True), caplog.at_level("INFO"):
+        record_log = RecordLogger(test_logger, "test")
+        for i in range(5):
+            record_log.info("record %d", i)
+
+    assert len([r for r in caplog.records if r.getMessage().startswith("record")]) == 5
+
+
+def test_sampled_mode_logs_one_in_n_and_all_failures(caplog):
+    """Should log only 1 in N record lines but every failure."""
+    with patch.dict(os.environ, {"LOG_MODE": "sampled", "LOG_SAMPLE_RATE": "10"}), \
+         caplog.at_level("INFO"):
+        record_log = RecordLogger(test_logger, "test")
+        for i in range(25):
+            record_log.info("record %d", i)
+        record_log.warning("bad record %d", 99)
+        record_log.summary("Test Summary", inserted=25, failed=1)
+
+    messages = [r.getMessage() for r in caplog.records]
+    assert [m for m in messages if m.startswith("record")] == ["record 0", "record 10", "record 20"]
+    assert "bad record 99" in messages
+    assert any("Test Summary: inserted=25, failed=1" in m and "logged=3 of 25" in m for m in messages)
+
+
+def test_invalid_sample_rate_falls_back_to_default():
+    """Should fall back to the default rate on invalid input."""
+    with patch.dict(os.environ, {"LOG_SAMPLE_RATE": "abc"}):
+        assert get_sample_rate() == 1000
+
+
+def test_records_counted_separately_from_lines(caplog):
+    """Should report handled records, not the number of info lines, in the summary."""
+    with patch.dict(os.environ, {"LOG_MODE": "sampled", "LOG_SAMPLE_RATE": "10"}), \
+         caplog.at_level("INFO"):
+        record_log = RecordLogger(test_logger, "test")
+        record_log.record(4)
+        for i in range(6):
+            record_log.info("record %d", i)
+        record_log.summary("Test Summary", inserted=4)
+
+    assert (record_log.records, record_log.lines) == (4, 6)
+    assert any("records=4" in m and "logged=1 of 6" in m for m in (r.getMessage() for r in caplog.records))
+
+
+def test_log_mode_read_per_logger():
+    """Should pick up LOG_MODE changes in the next logger (one per invocation or batch)."""
+    with patch.dict(os.environ, {"LOG_MODE": "full"}):
+        first = RecordLogger(test_logger, "test")
+    with patch.dict(os.environ, {"LOG_MODE": "sampled"}):
+        second = RecordLogger(test_logger, "test")
+
+    assert (first.sampled, second.sampled) == (False, True)
@@ -0,0 +1,36 @@
+from datetime import datetime
+from sqlalchemy import create_engine, text
+from partial_update import GroupedUpdates, changed_columns
+
+
+def test_changed_columns_normalizes_values():
+    """Should treat '' as NULL, compare timestamps as ISO text and keep column order."""
+    existing = {"a": None, "b": datetime(2024, 1, 1, 12, 0), "c": 1, "d": "x"}
+    incoming = {"a": "", "b": "2024-01-01T12:00:00", "c": True, "d": "y"}
+    assert changed_columns(incoming, existing, ["a", "b", "c", "d"]) == ("d",)
+
+
+def test_grouped_updates_retry_failing_group_row_by_row():
+    """Should apply each group as one executemany and isolate failing rows."""
+    engine = create_engine("sqlite://")
+    with engine.begin() as connection:
+        connection.execute(text(
+            "CREATE TABLE t (id INTEGER PRIMARY KEY, name TEXT UNIQUE, city TEXT)"
+        ))
+        connection.execute(text(
+            "INSERT INTO t VALUES (1, 'a', 'x'), (2, 'b', 'y'), (3, 'c', 'z')"
+        ))
+
+        updates = GroupedUpdates("t", "id")
+        updates.add(1, {"city": "berlin"}, ("city",), record="r1")
+        updates.add(2, {"name": "c"}, ("name",), record="r2")  # violates UNIQUE
+        updates.add(3, {"name": "cc"}, ("name",), record="r3")
+        assert len(updates) == 3
+
+        updated, failures = updates.execute(connection)
+        rows = connection.execute(text("SELECT id, name, city FROM t ORDER BY id")).fetchall()
+
+    assert updated == 2
+    assert [(record, type(e).__name__) for record, e in failures] == [("r2", "IntegrityError")]
+    assert rows == [(1, "a", "berlin"), (2, "b", "y"), (3, "cc", "z")]
+    assert len(updates) == 0
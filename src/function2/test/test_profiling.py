@@ -0,0 +1,35 @@
+import os
+from unittest.mock import patch
+from profiling import profile_invocation
+
+
+def test_profiling_disabled_calls_function_directly(tmp_path):
+    """Should not write any profile output when PROFILE_HANDLER is not set."""
+    @profile_invocation("test")
+    def work(x):
+        return x * 2
+
+    with patch.dict(os.environ, {"PROFILE_DIR": str(tmp_path)}, clear=True):
+        assert work(21) == 42
+
+    assert os.listdir(tmp_path) == []
+
+
+def test_profiling_enabled_writes_stats_and_allocation_report(tmp_path):
+    """Should write a .pstats file and an allocation report when enabled."""
+    @profile_invocation("test")
+    def work(n):
+        return [str(i) for i in range(n)]
+
+    env = {"PROFILE_HANDLER": "1", "PROFILE_DIR": str(tmp_path), "PROFILE_TOP_N": "5"}
+    with patch.dict(os.environ, env):
+        assert len(work(1000)) == 1000
+
+    files = sorted(os.listdir(tmp_path))
+    assert len(files) == 2
+    assert files[0].endswith("-alloc.txt")
+    assert files[1].endswith(".pstats")
+
+    with open(os.path.join(tmp_path, files[0])) as f:
+        report = f.read()
+    assert "Top 5 allocation sites:" in report
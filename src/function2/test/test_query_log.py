@@ -0,0 +1,37 @@
+import os
+from unittest.mock import patch
+from sqlalchemy import create_engine, text
+from query_log import describe_parameters, install_slow_query_log
+
+
+def test_not_installed_without_threshold():
+    """Should not attach listeners when SLOW_QUERY_THRESHOLD_MS is not set."""
+    with patch.dict(os.environ, {}, clear=True):
+        assert install_slow_query_log(create_engine("sqlite://")) is False
+
+
+def test_slow_query_logged_with_sqlite_plan(caplog):
+    """Should log statements above the threshold with their EXPLAIN QUERY PLAN."""
+    engine = create_engine("sqlite://")
+    with engine.begin() as connection:
+        connection.execute(text("CREATE TABLE accounts (accountId INTEGER, name TEXT)"))
+
+    env = {"SLOW_QUERY_THRESHOLD_MS": "0", "SLOW_QUERY_EXPLAIN": "1"}
+    with patch.dict(os.environ, env):
+        assert install_slow_query_log(engine) is True
+
+    with caplog.at_level("WARNING"), engine.begin() as connection:
+        connection.execute(
+            text("SELECT name FROM accounts WHERE accountId = :accountId"), {"accountId": 10}
+        )
+
+    assert "Slow query" in caplog.text
+    assert "params=(int)" in caplog.text
+    assert "SCAN accounts" in caplog.text
+
+
+def test_describe_parameters_for_executemany():
+    """Should describe executemany batches by row count and first-row shape."""
+    rows = [{"id": 1, "name": "a"}, {"id": 2, "name": "b"}]
+    assert describe_parameters(rows, True) == "2 rows x {id: int, name: str}"
+    assert describe_parameters((1, "a"), False) == "(int, str)"
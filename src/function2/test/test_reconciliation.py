@@ -0,0 +1,96 @@
+import os
+import pytest
+from unittest.mock import patch
+from sqlalchemy import text
+from db_connection import get_hana_client
+from db_operation_company import insert_or_update_company
+from db_operation_contact import insert_or_update_contact
+from reconciliation import reconcile
+
+
+@pytest.fixture
+def sqlite_env(tmp_path):
+    env = {
+        "DB_BACKEND": "sqlite",
+        "SQLITE_PATH": str(tmp_path / "local.sqlite"),
+        "HANA_SCHEMA": "TEST_SCHEMA",
+    }
+    with patch.dict(os.environ, env):
+        yield
+
+
+def load_sample():
+    insert_or_update_company([
+        {"accountId": 10, "accountName": "NextGen", "crmToErpFlag": True, "status": "active"},
+        {"accountId": 20, "accountName": "Infosys", "crmToErpFlag": True, "status": "active"},
+    ])
+    insert_or_update_contact([
+        {"contactId": 101, "accountId": 10, "accountName": "NextGen", "crmToErpFlag": True,
+         "firstName": "Ravi", "lastName": "Kumar", "cshmeFlag": True,
+         "email": "ravi.kumar@nextgen.com", "department": "Engineering",
+         "country": "India", "zipCode": "122018", "phoneNo": "8882719739",
+         "status": "active"},
+    ])
+
+
+def test_reconcile_reports_no_drift_after_clean_load(sqlite_env):
+    load_sample()
+
+    result = reconcile()
+
+    assert not any(result["detected"].values())
+    assert not any(result["repaired"].values())
+
+
+def test_reconcile_detects_and_repairs_drift(sqlite_env):
+    """Should detect every drift kind with joins and repair it in bulk."""
+    load_sample()
+    with get_hana_client().begin() as connection:
+        connection.execute(text(
+            "UPDATE TEST_SCHEMA.SPUSER_STAGING_CRM_COMPANY_ACCOUNTS SET erpNo = NULL WHERE accountId = 10"
+        ))
+        connection.execute(text(
+            "UPDATE TEST_SCHEMA.SPUSER_STAGING_CRM_COMPANY_ACCOUNTS SET erpNo = '999' WHERE accountId = 20"
+        ))
+        connection.execute(text(
+            "UPDATE TEST_SCHEMA.SPUSER_STAGING_ERP_CUSTOMERS SET status = 'inactive' WHERE crmBpNo = 20"
+        ))
+        connection.execute(text(
+            "INSERT INTO TEST_SCHEMA.SPUSER_STAGING_CRM_COMPANY_ACCOUNTS "
+            "(uuid, accountId, accountName, crmToErpFlag, status) "
+            "VALUES ('a30', 30, 'TATA', 1, 'active')"
+        ))
+        connection.execute(text(
+            "UPDATE TEST_SCHEMA.SPUSER_STAGING_CRM_COMPANY_CONTACTS "
+            "SET erpContactPerson = NULL, status = 'inactive' WHERE contactId = 101"
+        ))
+
+    dry_run = reconcile(repair=False)
+    assert dry_run["detected"] == {
+        "account_missing_erp_customer": 1,
+        "account_missing_erp_no": 1,
+        "account_erp_no_mismatch": 1,
+        "customer_status_mismatch": 1,
+        "contact_missing_erp_contact": 0,
+        "contact_missing_erp_person": 1,
+        "contact_erp_person_mismatch": 0,
+        "contact_status_mismatch": 1,
+    }
+    assert not any(dry_run["repaired"].values())
+
+    result = reconcile()
+    assert result["repaired"] == dry_run["detected"]
+    assert not any(result["remaining"].values())
+    assert result["failed"] == []
+
+    with get_hana_client().connect() as connection:
+        accounts = connection.execute(text(
+            "SELECT accountId, erpNo FROM TEST_SCHEMA.SPUSER_STAGING_CRM_COMPANY_ACCOUNTS "
+            "ORDER BY accountId"
+        )).fetchall()
+        contact_status = connection.execute(text(
+            "SELECT status FROM TEST_SCHEMA.SPUSER_STAGING_ERP_CUSTOMERS_CONTACTS WHERE crmBpNo = 10"
+        )).scalar()
+
+    assert [tuple(row) for row in accounts] == [(10, "1000000"), (20, "1000001"), (30, "1000002")]
+    assert contact_status == "inactive"
@@ -0,0 +1,37 @@
+from sqlalchemy import create_engine, text
+from record_types import CompanyAccount, Contact, insert_many, param_tuples, parse_records
+
+
+def test_from_dict_keeps_field_order_and_dict_access():
+    """Should parse a JSON dict into fields in INSERT order and keep .get access."""
+    account = CompanyAccount.from_dict(
+        {"accountName": "NextGen", "accountId": 10, "crmToErpFlag": True, "extra": "ignored"}
+    )
+    assert account == (None, 10, "NextGen", True, None, None)
+    assert account.get("accountName") == "NextGen"
+    assert account.get("unknown", "default") == "default"
+    assert parse_records(CompanyAccount, [account, {"accountId": 20}])[0] is account
+
+
+def test_param_tuples_from_records_and_dicts():
+    """Should build positional parameters from records (as-is or by column) and dicts."""
+    contact = Contact.from_dict({"contactId": 1, "accountId": 10, "email": "a@b.c"})
+    assert param_tuples([contact], Contact._fields) == [contact]
+    assert param_tuples([contact], ("email", "contactId")) == [("a@b.c", 1)]
+    assert param_tuples([contact], ("email",)) == [("a@b.c",)]
+    assert param_tuples([{"email": "x@y.z"}], ("email", "contactId")) == [("x@y.z", None)]
+
+
+def test_insert_many_executes_positional_insert():
+    """Should insert all records with one executemany on SQLite (qmark paramstyle)."""
+    engine = create_engine("sqlite://")
+    with engine.begin() as connection:
+        connection.execute(text(
+            "CREATE TABLE ACCOUNTS (uuid TEXT, accountId INTEGER, accountName TEXT, "
+            "crmToErpFlag BOOLEAN, status TEXT, rowHash TEXT)"
+        ))
+        rows = [CompanyAccount(uuid=str(i), accountId=i, accountName=f"A{i}") for i in range(3)]
+        assert insert_many(connection, "ACCOUNTS", CompanyAccount._fields, rows) == 3
+        assert insert_many(connection, "ACCOUNTS", CompanyAccount._fields, []) == 0
+        stored = connection.execute(text("SELECT accountId, accountName FROM ACCOUNTS ORDER BY accountId")).fetchall()
+    assert [tuple(row) for row in stored] == [(0, "A0"), (1, "A1"), (2, "A2")]
@@ -0,0 +1,105 @@
+import os
+import pytest
+from unittest.mock import MagicMock, patch
+from sqlalchemy.exc import IntegrityError, OperationalError
+from retry import (
+    CircuitBreaker,
+    CircuitOpenError,
+    RetryPolicy,
+    call_with_retry,
+    is_transient_error,
+)
+
+
+class HanaError(Exception):
+    def __init__(self, errorcode, message):
+        super().__init__(message)
+        self.errorcode = errorcode
+
+
+def db_error(orig):
+    return OperationalError("SELECT 1", {}, orig)
+
+
+def test_is_transient_error_classification():
+    assert is_transient_error(db_error(HanaError(133, "transaction rolled back by detected deadlock")))
+    assert is_transient_error(db_error(HanaError(-10807, "Connection down")))
+    assert is_transient_error(ConnectionResetError("Connection reset by peer"))
+    assert is_transient_error(db_error(Exception("database is locked")))
+    assert not is_transient_error(IntegrityError("INSERT", {}, HanaError(301, "unique constraint violated")))
+    assert not is_transient_error(ValueError("HANA_SCHEMA is not set."))
+    assert not is_transient_error(CircuitOpenError("open"))
+
+
+def test_retry_policy_backoff_is_capped_and_jittered():
+    policy = RetryPolicy(attempts=5, base_delay=0.1, max_delay=0.3)
+    with patch("retry.random.uniform", side_effect=lambda low, high: high):
+        assert [policy.delay(attempt) for attempt in range(1, 5)] == [0.1, 0.2, 0.3, 0.3]
+
+
+def test_call_with_retry_retries_transient_errors_then_succeeds():
+    func = MagicMock(side_effect=[ConnectionResetError("reset"), TimeoutError("timed out"), "ok"])
+    sleep = MagicMock()
+
+    result = call_with_retry(func, "chunk", RetryPolicy(attempts=3), CircuitBreaker(), sleep)
+
+    assert result == "ok"
+    assert func.call_count == 3
+    assert sleep.call_count == 2
+
+
+def test_call_with_retry_raises_non_transient_and_exhausted_errors():
+    sleep = MagicMock()
+    func = MagicMock(side_effect=ValueError("bad record"))
+    with pytest.raises(ValueError):
+        call_with_retry(func, "chunk", RetryPolicy(attempts=3), CircuitBreaker(), sleep)
+    assert func.call_count == 1
+
+    func = MagicMock(side_effect=ConnectionResetError("reset"))
+    with pytest.raises(ConnectionResetError):
+        call_with_retry(func, "chunk", RetryPolicy(attempts=3), CircuitBreaker(), sleep)
+    assert func.call_count == 3
+
+
+def test_circuit_breaker_opens_fails_fast_and_half_opens():
+    now = [0.0]
+    breaker = CircuitBreaker(failure_threshold=2, reset_seconds=30, clock=lambda: now[0])
+    failing = MagicMock(side_effect=ConnectionResetError("reset"))
+
+    with pytest.raises(ConnectionResetError):
+        call_with_retry(failing, "chunk", RetryPolicy(attempts=5), breaker, MagicMock())
+    assert failing.call_count == 2
+    assert breaker.is_open
+
+    healthy = MagicMock(return_value="ok")
+    with pytest.raises(CircuitOpenError):
+        call_with_retry(healthy, "chunk", RetryPolicy(attempts=1), breaker, MagicMock())
+    healthy.assert_not_called()
+
+    now[0] = 31.0
+    assert call_with_retry(healthy, "chunk", RetryPolicy(attempts=1), breaker, MagicMock()) == "ok"
+    assert not breaker.is_open
+
+
+def test_get_hana_client_retries_transient_connect_errors():
+    env_vars = {
+        "DB_BACKEND": "hana",
+        "HANA_SERVER_NODE": "hana.example.com",
+        "HANA_USER": "test_user",
+        "HANA_PASSWORD": "test_pass",
+        "HANA_SCHEMA": "TEST_SCHEMA",
+        "RETRY_BASE_DELAY_MS": "0",
+    }
+    from db_connection import clear_engine_cache, get_hana_client
+
+    clear_engine_cache()
+    with patch.dict(os.environ, env_vars), patch("db_connection.create_engine") as mock_create_engine:
+        mock_engine = mock_create_engine.return_value
+        mock_engine.connect.side_effect = [
+            db_error(HanaError(-10709, "Connection failed")),
+            MagicMock(),
+        ]
+
+        assert get_hana_client() is mock_engine
+        assert mock_engine.connect.call_count == 2
+    clear_engine_cache()
@@ -0,0 +1,19 @@
+from datetime import datetime
+from row_hash import compute_row_hash
+
+FIELDS = ("name", "flag", "modified")
+
+
+def test_row_hash_is_stable_across_db_and_json_values():
+    """Should hash DB values (1, datetime, NULL) like their JSON counterparts."""
+    from_json = {"name": "Acme", "flag": True, "modified": "2024-01-01T00:00:00"}
+    from_db = {"name": "Acme", "flag": 1, "modified": datetime(2024, 1, 1)}
+    assert compute_row_hash(from_json, FIELDS) == compute_row_hash(from_db, FIELDS)
+    assert len(compute_row_hash(from_json, FIELDS)) == 64
+
+
+def test_row_hash_changes_with_any_field():
+    """Should produce a different hash when a single field changes."""
+    record = {"name": "Acme", "flag": False, "modified": None}
+    assert compute_row_hash(record, FIELDS) != compute_row_hash(dict(record, flag=True), FIELDS)
+    assert compute_row_hash(record, FIELDS) != compute_row_hash(dict(record, name="Acme "), FIELDS)
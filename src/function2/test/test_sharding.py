@@ -0,0 +1,66 @@
+import os
+import multiprocessing
+import pytest
+from unittest.mock import patch
+from sqlalchemy import text
+from sharding import Shard, filter_shard, get_shard, shard_mask, shard_of
+
+ACCOUNT_IDS = list(range(1, 31))
+
+
+def register_shard(index, count, env):
+    """One shard invocation: registers the ERP customers of its accounts."""
+    os.environ.update(env)
+    from erp_customer_registration import register_company_as_customer
+    for account_id in filter_shard(ACCOUNT_IDS, lambda account_id: account_id, Shard(index, count)):
+        register_company_as_customer(account_id, f"Company {account_id}", "active")
+
+
+def test_get_shard_from_event_or_env():
+    """Should prefer the event over SHARD_INDEX / SHARD_COUNT and default to one shard."""
+    with patch.dict(os.environ, {"SHARD_INDEX": "2", "SHARD_COUNT": "4"}):
+        assert get_shard(None) == Shard(2, 4)
+        assert get_shard({"shard_index": 0, "shard_count": 2}) == Shard(0, 2)
+    with patch.dict(os.environ, {}, clear=True):
+        assert get_shard({}) == Shard(0, 1)
+
+    with pytest.raises(ValueError):
+        get_shard({"shard_index": 3, "shard_count": 3})
+    with pytest.raises(ValueError):
+        get_shard({"shard_index": "x", "shard_count": 2})
+
+
+def test_shards_partition_keys_stably():
+    """Should put every key in exactly one shard, the same for int and str keys."""
+    keys = list(range(1000))
+    shards = [Shard(index, 4) for index in range(4)]
+
+    selected = [filter_shard(keys, lambda key: key, shard) for shard in shards]
+
+    assert sorted(key for part in selected for key in part) == keys
+    assert all(len(part) > 150 for part in selected)
+    assert shard_of(42, 4) == shard_of("42", 4)
+    assert shard_mask(keys, shards[1]) == [shard_of(key, 4) == 1 for key in keys]
+    assert filter_shard(keys, lambda key: key, Shard()) == keys
+
+
+def test_parallel_shards_allocate_unique_erp_ids(tmp_path):
+    """Should give every account its own customerId when shards register in parallel processes."""
+    env = {"DB_BACKEND": "sqlite", "SQLITE_PATH": str(tmp_path / "shards.sqlite"), "HANA_SCHEMA": "TEST_SCHEMA"}
+    context = multiprocessing.get_context("spawn")
+    shards = [context.Process(target=register_shard, args=(index, 3, env)) for index in range(3)]
+    for process in shards:
+        process.start()
+    for process in shards:
+        process.join(60)
+    assert [process.exitcode for process in shards] == [0, 0, 0]
+
+    with patch.dict(os.environ, env):
+        from db_connection import get_hana_client
+        with get_hana_client().connect() as connection:
+            rows = connection.execute(
+                text("SELECT crmBpNo, customerId FROM TEST_SCHEMA.SPUSER_STAGING_ERP_CUSTOMERS")
+            ).fetchall()
+
+    assert sorted(row.crmBpNo for row in rows) == ACCOUNT_IDS
+    assert len({row.customerId for row in rows}) == len(ACCOUNT_IDS)
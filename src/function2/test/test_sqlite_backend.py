@@ -0,0 +1,156 @@
+import os
+import pytest
+from unittest.mock import patch
+from sqlalchemy import text
+from db_connection import get_hana_client
+from db_operation_company import insert_or_update_company
+from db_operation_contact import insert_or_update_contact
+from sqlite_backend import DEFAULT_CDS_PATH, parse_cds
+
+
+@pytest.fixture
+def sqlite_env(tmp_path):
+    env = {
+        "DB_BACKEND": "sqlite",
+        "SQLITE_PATH": str(tmp_path / "local.sqlite"),
+        "HANA_SCHEMA": "TEST_SCHEMA",
+    }
+    with patch.dict(os.environ, env):
+        yield
+
+
+def test_parse_cds_schema():
+    """Should parse all entities of schema.cds, skipping associations."""
+    with open(DEFAULT_CDS_PATH) as f:
+        namespace, entities = parse_cds(f.read())
+
+    assert namespace == "SPUSER_STAGING"
+    assert {"P_USERS", "CRM_COMPANY_ACCOUNTS", "CRM_COMPANY_CONTACTS",
+            "ERP_CUSTOMERS", "ERP_CUSTOMERS_CONTACTS"} <= set(entities)
+
+    users = {c.name: c for c in entities["P_USERS"]}
+    assert users["userUuid"].key
+    assert users["userId"].unique
+    assert users["status"].sql_type == "VARCHAR(8)"
+    assert "contacts" not in {c.name for c in entities["CRM_COMPANY_ACCOUNTS"]}
+
+
+def test_get_hana_client_uses_sqlite_backend(sqlite_env):
+    """Should return a cached SQLite engine with WAL and the CDS tables."""
+    engine = get_hana_client()
+    assert get_hana_client() is engine
+
+    with engine.connect() as connection:
+        journal_mode = connection.execute(text("PRAGMA TEST_SCHEMA.journal_mode")).scalar()
+        count = connection.execute(
+            text("SELECT COUNT(*) FROM TEST_SCHEMA.SPUSER_STAGING_P_USERS")
+        ).scalar()
+
+    assert journal_mode == "wal"
+    assert count == 0
+
+
+def test_company_and_contact_load_end_to_end(sqlite_env):
+    """Should load companies and contacts, registering flagged ones in ERP."""
+    companies = [
+        {"accountId": 10, "accountName": "NextGen", "crmToErpFlag": True, "status": "active"},
+        {"accountId": 30, "accountName": "TATA", "crmToErpFlag": False, "status": "active"},
+    ]
+    contacts = [
+        {"contactId": 101, "accountId": 10, "accountName": "NextGen", "crmToErpFlag": True,
+         "firstName": "Ravi", "lastName": "Kumar", "cshmeFlag": True,
+         "email": "ravi.kumar@nextgen.com", "department": "Engineering",
+         "country": "India", "zipCode": "122018", "phoneNo": "8882719739",
+         "status": "active"},
+    ]
+
+    result_company = insert_or_update_company(companies)
+    result_contact = insert_or_update_contact(contacts)
+
+    assert result_company["inserted"] == 2
+    assert result_company["failed"] == []
+    assert result_contact["inserted"] == 1
+    assert result_contact["failed"] == []
+
+    with get_hana_client().connect() as connection:
+        erp_no = connection.execute(text(
+            "SELECT erpNo FROM TEST_SCHEMA.SPUSER_STAGING_CRM_COMPANY_ACCOUNTS WHERE accountId = 10"
+        )).scalar()
+        erp_contact = connection.execute(text(
+            "SELECT erpContactPerson FROM TEST_SCHEMA.SPUSER_STAGING_CRM_COMPANY_CONTACTS "
+            "WHERE contactId = 101"
+        )).scalar()
+
+    assert erp_no == "1000000"
+    assert erp_contact == "2000000"
+
+    # Replaying the same file leaves every account untouched
+    replay = insert_or_update_company(companies)
+    assert replay["unchanged"] == 2
+    assert replay["inserted"] == replay["updated"] == 0
+
+
+def test_contact_replay_only_reads_hashes(sqlite_env):
+    """Should report unchanged contacts on replay and write rowHash on every row."""
+    contacts = [
+        {"contactId": 201, "accountId": 30, "accountName": "TATA", "crmToErpFlag": False,
+         "firstName": "Asha", "lastName": "Rao", "cshmeFlag": False,
+         "email": "asha.rao@tata.com", "department": None, "country": "India",
+         "zipCode": "400001", "phoneNo": "9820000000", "status": "active"},
+    ]
+
+    assert insert_or_update_contact(contacts)["inserted"] == 1
+    replay = insert_or_update_contact(contacts)
+    assert replay["unchanged"] == 1
+
+    changed = [dict(contacts[0], phoneNo="9820000001")]
+    assert insert_or_update_contact(changed)["updated"] == 1
+
+    with get_hana_client().connect() as connection:
+        row = connection.execute(text(
+            "SELECT phoneNo, rowHash FROM TEST_SCHEMA.SPUSER_STAGING_CRM_COMPANY_CONTACTS "
+            "WHERE contactId = 201"
+        )).one()
+
+    assert row.phoneNo == "9820000001"
+    assert len(row.rowHash) == 64
+
+
+def test_failed_nested_registration_rolls_back_only_its_own_work(sqlite_env):
+    """Should keep the chunk's CRM rows and other registrations when one ERP registration rolls back."""
+    engine = get_hana_client()
+    with engine.connect() as first, engine.connect() as second:
+        assert first.connection.dbapi_connection is not second.connection.dbapi_connection
+
+    insert_or_update_company([{"accountId": 10, "accountName": "NextGen", "crmToErpFlag": True}])
+    with engine.begin() as connection:
+        # The outbox event of the second new contact fails after its ERP contact was inserted
+        connection.execute(text("""
+            CREATE TRIGGER TEST_SCHEMA.REJECT_OUTBOX BEFORE INSERT ON SPUSER_STAGING_ID_STORE_OUTBOX
+            WHEN NEW.contactPersonId = '2000001'
+            BEGIN SELECT RAISE(ABORT, 'outbox rejected'); END
+        """))
+
+    contacts = [
+        {"contactId": 101 + i, "accountId": 10, "accountName": "NextGen", "crmToErpFlag": True,
+         "firstName": name, "lastName": "Kumar", "email": f"{name.lower()}@nextgen.com", "status": "active"}
+        for i, name in enumerate(("Ravi", "Asha"))
+    ]
+    result = insert_or_update_contact(contacts)
+
+    assert result["inserted"] == 2
+    assert [failure["contact"]["contactId"] for failure in result["failed"]] == [102]
+    with engine.connect() as connection:
+        crm_contacts = connection.execute(text(
+            "SELECT contactId FROM TEST_SCHEMA.SPUSER_STAGING_CRM_COMPANY_CONTACTS ORDER BY contactId"
+        )).scalars().all()
+        erp_contacts = connection.execute(text(
+            "SELECT email FROM TEST_SCHEMA.SPUSER_STAGING_ERP_CUSTOMERS_CONTACTS"
+        )).scalars().all()
+        events = connection.execute(text(
+            "SELECT COUNT(*) FROM TEST_SCHEMA.SPUSER_STAGING_ID_STORE_OUTBOX"
+        )).scalar()
+
+    assert crm_contacts == [101, 102]
+    assert erp_contacts == ["ravi@nextgen.com"]
+    assert events == 1
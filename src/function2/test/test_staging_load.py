@@ -0,0 +1,161 @@
+import os
+import pytest
+from unittest.mock import patch
+from sqlalchemy import text
+from db_connection import get_hana_client
+from db_operation_company import initial_load_companies, insert_or_update_company
+from db_operation_contact import initial_load_contacts
+from staging_load import StagingSpec, StagingTable, dedupe_by_key, is_initial_load
+
+
+@pytest.fixture
+def sqlite_env(tmp_path):
+    env = {
+        "DB_BACKEND": "sqlite",
+        "SQLITE_PATH": str(tmp_path / "local.sqlite"),
+        "HANA_SCHEMA": "TEST_SCHEMA",
+        "STAGING_BATCH_SIZE": "2",
+    }
+    with patch.dict(os.environ, env):
+        yield
+
+
+def company(account_id, name, flag=True, status="active"):
+    return {"accountId": account_id, "accountName": name, "crmToErpFlag": flag, "status": status}
+
+
+def test_is_initial_load():
+    with patch.dict(os.environ, {"LOAD_MODE": "Initial"}):
+        assert is_initial_load()
+    with patch.dict(os.environ, {}, clear=True):
+        assert not is_initial_load()
+
+
+def test_dedupe_by_key_keeps_last_record():
+    rows, duplicates = dedupe_by_key([{"id": 1, "v": "a"}, {"id": 2}, {"id": 1, "v": "b"}], "id")
+    assert duplicates == 1
+    assert rows == [{"id": 1, "v": "b"}, {"id": 2}]
+
+
+def test_staging_table_rejects_unknown_dialect():
+    class Connection:
+        class dialect:
+            name = "postgresql"
+
+    spec = StagingSpec("T", "id", ("id",), ())
+    with pytest.raises(ValueError, match="postgresql"):
+        StagingTable(Connection(), "S", spec)
+
+
+def test_initial_load_companies_merges_and_registers_erp(sqlite_env):
+    """Should bulk-load accounts, register flagged ones in ERP and classify a reload."""
+    first = initial_load_companies([
+        company(10, "NextGen"),
+        company(30, "TATA", flag=False),
+        company(40, "Old name", flag=False),
+        company(40, "Infosys", flag=False),  # duplicate → last record wins
+    ])
+    assert (first["inserted"], first["updated"], first["unchanged"]) == (3, 0, 0)
+    assert first["failed"] == []
+
+    second = initial_load_companies([
+        company(10, "NextGen"),
+        company(30, "TATA", status="inactive"),
+        company(50, "Wipro", flag=False),
+    ])
+    assert (second["inserted"], second["updated"], second["unchanged"]) == (1, 1, 1)
+
+    with get_hana_client().connect() as connection:
+        rows = connection.execute(text(
+            "SELECT accountId, accountName, status, erpNo "
+            "FROM TEST_SCHEMA.SPUSER_STAGING_CRM_COMPANY_ACCOUNTS ORDER BY accountId"
+        )).fetchall()
+        erp_customers = connection.execute(text(
+            "SELECT COUNT(*) FROM TEST_SCHEMA.SPUSER_STAGING_ERP_CUSTOMERS"
+        )).scalar()
+
+    assert [tuple(row) for row in rows] == [
+        (10, "NextGen", "active", "1000000"),
+        (30, "TATA", "inactive", "1000001"),
+        (40, "Infosys", "active", None),
+        (50, "Wipro", "active", None),
+    ]
+    assert erp_customers == 2
+
+    # The delta loader sees the merged rows as unchanged
+    assert insert_or_update_company([company(10, "NextGen")])["unchanged"] == 1
+
+
+def test_initial_load_contacts_merges_and_registers_erp(sqlite_env):
+    """Should bulk-load contacts and write erpContactPerson for flagged ones."""
+    initial_load_companies([company(10, "NextGen")])
+    contact = {
+        "contactId": 101, "accountId": 10, "accountName": "NextGen", "crmToErpFlag": True,
+        "firstName": "Ravi", "lastName": "Kumar", "cshmeFlag": True,
+        "email": "ravi.kumar@nextgen.com", "department": "Engineering",
+        "country": "India", "zipCode": "122018", "phoneNo": "8882719739",
+        "status": "active",
+    }
+
+    result = initial_load_contacts([contact, {"contactId": 102}])
+    assert result["inserted"] == 1
+    assert len(result["failed"]) == 1
+
+    replay = initial_load_contacts([contact])
+    assert (replay["inserted"], replay["updated"], replay["unchanged"]) == (0, 0, 1)
+
+    with get_hana_client().connect() as connection:
+        erp_contact = connection.execute(text(
+            "SELECT erpContactPerson FROM TEST_SCHEMA.SPUSER_STAGING_CRM_COMPANY_CONTACTS "
+            "WHERE contactId = 101"
+        )).scalar()
+
+    assert erp_contact == "2000000"
+
+
+def test_failed_initial_registrations_keep_reloadable_records(sqlite_env):
+    """Should report failed ERP registrations with their full record, which a reload accepts."""
+    contact = {
+        "contactId": 101, "accountId": 10, "crmToErpFlag": True, "firstName": "Ravi",
+        "lastName": "Kumar", "email": "ravi.kumar@nextgen.com", "status": "active",
+    }
+    with patch("db_operation_company.register_company_as_customer", side_effect=RuntimeError("ERP down")), \
+         patch("db_operation_contact.register_contact_as_erp", side_effect=RuntimeError("ERP down")):
+        companies = initial_load_companies([company(10, "NextGen")])
+        contacts = initial_load_contacts([contact])
+
+    failed_company = companies["failed"][0]["company"]
+    failed_contact = contacts["failed"][0]["contact"]
+    assert (failed_company["accountName"], failed_company["crmToErpFlag"]) == ("NextGen", True)
+    assert (failed_contact["accountId"], failed_contact["email"]) == (10, "ravi.kumar@nextgen.com")
+
+    assert initial_load_companies([failed_company])["failed"] == []
+    assert initial_load_contacts([failed_contact])["failed"] == []
+
+
+def test_reject_conflicts_drops_rows_with_taken_unique_values(sqlite_env):
+    """Should keep the smallest key per unique value and skip values taken in the target."""
+    spec = StagingSpec(
+        table="SPUSER_STAGING_P_USERS",
+        key_column="userId",
+        columns=("userUuid", "userId", "email", "userName", "rowHash"),
+        update_columns=("email", "userName", "rowHash"),
+        unique_columns=("email", "userName"),
+    )
+    engine = get_hana_client()
+    with engine.begin() as connection:
+        connection.execute(text(
+            "INSERT INTO TEST_SCHEMA.SPUSER_STAGING_P_USERS (userUuid, userId, email, userName) "
+            "VALUES ('u0', 'P0', 'taken@example.com', 'p0')"
+        ))
+        with StagingTable(connection, "TEST_SCHEMA", spec) as staging:
+            staging.load([
+                {"userUuid": "u1", "userId": "P1", "email": "a@example.com", "userName": "p1"},
+                {"userUuid": "u2", "userId": "P2", "email": "a@example.com", "userName": "p2"},
+                {"userUuid": "u3", "userId": "P3", "email": "taken@example.com", "userName": "p3"},
+            ])
+            rejected = staging.reject_conflicts()
+            assert staging.classify() == {"inserted": 1, "updated": 0, "unchanged": 0}
+            staging.merge()
+
+    assert rejected == {"P2": "email", "P3": "email"}
@@ -0,0 +1,111 @@
+from dead_letter import DeadLetterFile, FailureLog
+from work_queue import DEAD, DONE, PENDING, StageInput, WorkQueue, produce_and_drain, run_worker_pool
+
+calls = []
+
+
+def record_batch(records):
+    calls.append([record["id"] for record in records])
+    return {"inserted": len(records), "failed": []}
+
+
+def fail_batch(records):
+    raise RuntimeError("DB unavailable")
+
+
+def load_accounts(records, dead_letters=None):
+    """Account 2 fails as a record, a batch with account 3 fails as a whole."""
+    if any(record["accountId"] == 3 for record in records):
+        raise RuntimeError("DB unavailable")
+    failed = FailureLog("company", dead_letters, key_field="accountId")
+    failed.extend({"company": record, "error": "boom"} for record in records if record["accountId"] == 2)
+    return {"inserted": len(records) - len(failed), **failed.summary()}
+
+
+def load_account_contacts(records, dead_letters=None):
+    calls.append([record["id"] for record in records])
+    return {"inserted": len(records), "failed": []}
+
+
+def test_claim_runs_stages_in_order_and_acks(tmp_path):
+    """Should hand out stage 0 batches before stage 1 and sum the results of done batches."""
+    calls.clear()
+    queue = WorkQueue(str(tmp_path / "queue.sqlite"))
+    summary = produce_and_drain(
+        queue,
+        [
+            ("test_work_queue:record_batch", [{"id": i} for i in range(5)]),
+            ("test_work_queue:record_batch", [{"id": i} for i in range(100, 103)]),
+        ],
+        batch_size=2,
+        processes=1,
+    )
+
+    assert calls == [[0, 1], [2, 3], [4], [100, 101], [102]]
+    assert summary[DONE] == 5 and summary[PENDING] == 0
+    assert summary["records"] == {"inserted": 8, "failed": 0}
+
+
+def test_contacts_of_failed_and_dead_accounts_are_deferred(tmp_path):
+    """Should defer later-stage records of failed keys and write every failure to the dead-letter file."""
+    calls.clear()
+    dead_letters = DeadLetterFile(str(tmp_path / "dead.ndjson"))
+    queue = WorkQueue(str(tmp_path / "queue.sqlite"), max_attempts=1)
+    summary = produce_and_drain(
+        queue,
+        [
+            StageInput("test_work_queue:load_accounts",
+                       [{"accountId": i} for i in (1, 2, 3)], "company", "accountId"),
+            StageInput("test_work_queue:load_account_contacts",
+                       [{"id": 10 + i, "accountId": i} for i in (1, 2, 3)], "contact", "accountId"),
+        ],
+        batch_size=1,
+        processes=1,
+        dead_letters=dead_letters,
+    )
+
+    assert calls == [[11]]
+    assert summary[DEAD] == 1
+    assert summary["records"] == {"inserted": 2, "failed": 1, "deferred": 2}
+    assert dead_letters.take(("company", "contact")) == {
+        "company": [{"accountId": 2}, {"accountId": 3}],
+        "contact": [{"id": 12, "accountId": 2}, {"id": 13, "accountId": 3}],
+    }
+
+
+def test_failed_batch_is_retried_then_dead_lettered(tmp_path):
+    """Should put a failing batch back until max_attempts, then mark it dead with the error."""
+    queue = WorkQueue(str(tmp_path / "queue.sqlite"), max_attempts=2)
+    queue.enqueue("test_work_queue:fail_batch", [{"id": 1}], batch_size=10)
+
+    summary = run_worker_pool(queue, processes=1)
+
+    assert summary[DEAD] == 1
+    assert summary["dead_letters"][0]["error"] == "RuntimeError: DB unavailable"
+    assert queue.connection.execute("SELECT attempts FROM batches").fetchone()[0] == 2
+
+
+def test_stale_claim_is_resumed(tmp_path):
+    """Should re-deliver a batch whose worker crashed (claim older than the visibility timeout)."""
+    calls.clear()
+    path = str(tmp_path / "queue.sqlite")
+    crashed = WorkQueue(path, visibility_timeout=0)
+    crashed.enqueue("test_work_queue:record_batch", [{"id": 7}], batch_size=10)
+    assert crashed.claim("crashed-worker") is not None
+
+    queue = WorkQueue(path, visibility_timeout=0)
+    summary = produce_and_drain(queue, [("test_work_queue:record_batch", [{"id": 8}])], 10, processes=1)
+
+    assert calls == [[7]]  # resumed, the new input is not enqueued on top
+    assert summary[DONE] == 1
+
+
+def test_worker_processes_drain_queue(tmp_path):
+    """Should process every batch exactly once with several worker processes."""
+    queue = WorkQueue(str(tmp_path / "queue.sqlite"))
+    queue.enqueue("test_work_queue:record_batch", [{"id": i} for i in range(20)], batch_size=3)
+
+    summary = run_worker_pool(queue, processes=2)
+
+    assert summary[DONE] == 7
+    assert summary["records"]["inserted"] == 20
@@ -0,0 +1,143 @@
+import os
+import logging
+from itertools import chain, islice
+from typing import Any, Iterable, Iterator, List, Optional, Sequence, TypeVar
+
+logger = logging.getLogger(__name__)
+logging.basicConfig(level=logging.INFO)
+
+T = TypeVar("T")
+
+DEFAULT_INPUT_BATCH_SIZE = 5000
+
+
+def get_input_batch_size() -> int:
+    """Records per input batch of the handlers (INPUT_BATCH_SIZE, default 5000)."""
+    return max(1, int(os.getenv("INPUT_BATCH_SIZE", DEFAULT_INPUT_BATCH_SIZE)))
+
+
+def batched(items: Iterable[T], size: int) -> Iterator[List[T]]:
+    """
+    Lists of up to size consecutive items, read lazily from any iterable
+    (e.g. the record stream of an event payload), so only one is held at a time.
+    """
+    iterator = iter(items)
+    while True:
+        batch = list(islice(iterator, max(1, size)))
+        if not batch:
+            return
+        yield batch
+
+
+def nonempty(items: Iterable[T]) -> Optional[Iterator[T]]:
+    """items as an iterator, or None if there are none (reads only the first item)."""
+    iterator = iter(items)
+    for first in iterator:
+        return chain((first,), iterator)
+    return None
+
+
+def is_adaptive_batching_enabled() -> bool:
+    """BATCH_ADAPTIVE=0 pins the chunk size to the configured *_BATCH_SIZE."""
+    return os.getenv("BATCH_ADAPTIVE", "1").strip().lower() not in ("0", "false", "no")
+
+
+class AdaptiveBatchSizer:
+    """
+    Chunk size controller for the batched loaders, driven by per-chunk latency
+    and error rate (hill climbing on rows per second):
+    - grow (x growth) while throughput improves,
+    - hold when throughput is flat,
+    - shrink (x shrink) when a chunk is slower than target_ms, when its error
+      rate exceeds max_error_rate (timeouts, lock waits) or when throughput drops.
+    The size always stays within [minimum, maximum].
+    """
+
+    def __init__(
+        self,
+        initial: int,
+        minimum: int = 50,
+        maximum: int = 2000,
+        target_ms: float = 2000.0,
+        max_error_rate: float = 0.05,
+        growth: float = 2.0,
+        shrink: float = 0.5,
+        adaptive: bool = True,
+    ):
+        self.minimum = max(1, minimum)
+        self.maximum = max(self.minimum, maximum)
+        self.size = min(max(initial, self.minimum), self.maximum) if adaptive else max(1, initial)
+        self.target_ms = target_ms
+        self.max_error_rate = max_error_rate
+        self.growth = growth
+        self.shrink = shrink
+        self.adaptive = adaptive
+        self.best_throughput = 0.0
+        self.history: List[int] = []
+
+    @classmethod
+    def from_env(cls, size_variable: str, default: int = 500) -> "AdaptiveBatchSizer":
+        """
+        Sizer configured from the environment: initial size from size_variable
+        (e.g. USER_BATCH_SIZE), bounds from BATCH_SIZE_MIN / BATCH_SIZE_MAX,
+        latency target from BATCH_TARGET_MS.
+        """
+        return cls(
+            initial=int(os.getenv(size_variable, default)),
+            minimum=int(os.getenv("BATCH_SIZE_MIN", 50)),
+            maximum=int(os.getenv("BATCH_SIZE_MAX", 2000)),
+            target_ms=float(os.getenv("BATCH_TARGET_MS", 2000)),
+            adaptive=is_adaptive_batching_enabled(),
+        )
+
+    def chunks(self, items: Sequence[Any]) -> Iterator[Sequence[Any]]:
+        """
+        Yield consecutive chunks of items, each sized by the current batch size.
+        A chunk enters history once the caller asks for the next one (or the
+        loop ends), so chunks skipped by breaking out of the loop are not counted.
+        """
+        start = 0
+        while start < len(items):
+            size = self.size
+            chunk = items[start:start + size]
+            start += len(chunk)
+            yield chunk
+            self.history.append(size)
+
+    def record(self, rows: int, seconds: float, errors: int = 0) -> None:
+        """Feed back the outcome of one chunk and pick the next size."""
+        if not self.adaptive or rows <= 0:
+            return
+
+        elapsed_ms = seconds * 1000.0
+        throughput = rows / max(seconds, 1e-6)
+
+        if errors / rows > self.max_error_rate or elapsed_ms > self.target_ms:
+            self._resize(self.size * self.shrink)
+            self.best_throughput = 0.0
+        elif rows < self.size:
+            # Last (partial) chunk — not comparable
+            return
+        elif throughput > self.best_throughput * 1.05:
+            self.best_throughput = throughput
+            self._resize(self.size * self.growth)
+        elif throughput < self.best_throughput * 0.8:
+            self._resize(self.size * self.shrink)
+            self.best_throughput = throughput
+
+    def _resize(self, size: float) -> None:
+        new_size = int(min(max(size, self.minimum), self.maximum))
+        if new_size != self.size:
+            logger.debug("Batch size %d → %d", self.size, new_size)
+        self.size = new_size
+
+    def describe(self) -> str:
+        """Chosen chunk sizes for the run summary, e.g. "500→1000→2000 (3 chunks)"."""
+        if not self.history:
+            return "none"
+        sizes = [self.history[0]]
+        for size in self.history[1:]:
+            if size != sizes[-1]:
+                sizes.append(size)
+        return f"{'→'.join(str(size) for size in sizes)} ({len(self.history)} chunks)"
+
@@ -1,53 +1,133 @@
 import os
 import logging
 import urllib.parse
+from typing import Dict, NamedTuple, Optional, Tuple
 from sqlalchemy import create_engine
 from sqlalchemy.exc import SQLAlchemyError
+from log_sampling import is_sampled_mode
+from query_log import install_slow_query_log
+from retry import call_with_retry
+from sqlite_backend import get_sqlite_client
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# In sampled logging mode the connection details are only logged once per process
+_connection_logged = False
+
+# Warm state: one engine (with its connection pool and compiled-statement cache)
+# per connection string, reused by every call and across warm invocations
+_engines = {}
+
+# Environment variables of the HANA connection (HANA_PORT defaults to 443)
+HANA_ENV = ("HANA_SERVER_NODE", "HANA_PORT", "HANA_USER", "HANA_PASSWORD", "HANA_SCHEMA")
+
+# Parsed HANA settings per raw environment values, kept like the engines
+_configs: Dict[Tuple[Optional[str], ...], "HanaConfig"] = {}
+
+
+class HanaConfig(NamedTuple):
+    """Parsed HANA connection settings (the password only inside connection_string)."""
+    server_node: str
+    port: str
+    user: str
+    schema: str
+    connection_string: str
+
+
+def get_hana_config() -> HanaConfig:
+    """
+    HANA settings from the environment, parsed (validated, password encoded,
+    connection string built) once per process and set of values.
+    """
+    raw = tuple(os.getenv(name) for name in HANA_ENV)
+    if raw in _configs:
+        return _configs[raw]
+
+    server_node, port, user, password, schema = raw
+    port = port or "443"
+
+    # Check if all required env vars are present
+    if not all([server_node, user, password, schema]):
+        raise ValueError("Required HANA environment variables are missing")
+
+    # Encode password
+    encoded_password = urllib.parse.quote_plus(password)
+
+    # Build connection string
+    connection_string = (
+        f"hana+hdbcli://{user}:{encoded_password}@"
+        f"{server_node}:{port}?currentSchema={schema}"
+    )
+    config = HanaConfig(server_node, port, user, schema, connection_string)
+    _configs[raw] = config
+    return config
+
+
+def get_db_backend() -> str:
+    """Return the configured backend: "hana" (default) or "sqlite" (local)."""
+    return os.getenv("DB_BACKEND", "hana").strip().lower()
+
 
 def get_hana_client():
-    try:
-        # Read environment variables
-        server_node = os.getenv("HANA_SERVER_NODE")
-        port = os.getenv("HANA_PORT", "443")
-        user = os.getenv("HANA_USER")
-        password = os.getenv("HANA_PASSWORD")
-        schema = os.getenv("HANA_SCHEMA")
+    """
+    Return the SQLAlchemy engine for the configured backend.
+    The HANA engine is created (and its connection tested) once per process and
+    connection settings; later calls, including those of warm invocations,
+    reuse it. The hdbcli driver and HANA dialect are only imported on creation.
+    """
+    global _connection_logged
+    backend = get_db_backend()
+    if backend == "sqlite":
+        return get_sqlite_client()
+    if backend != "hana":
+        raise ValueError(f"Unsupported DB_BACKEND: {backend}")
 
-        # Check if all required env vars are present
-        if not all([server_node, user, password, schema]):
-            raise ValueError("Required HANA environment variables are missing")
+    try:
+        config = get_hana_config()
+        connection_string = config.connection_string
+        if connection_string in _engines:
+            return _engines[connection_string]
 
         # Basic log (do not expose password)
-        logger.info("Initializing SAP HANA connection...")
-        logger.info(
+        log = logger.debug if is_sampled_mode() and _connection_logged else logger.info
+        log("Initializing SAP HANA connection...")
+        log(
             "HANA_SERVER_NODE=%s, PORT=%s, USER=%s, SCHEMA=%s",
-            server_node,
-            port,
-            user,
-            schema,
+            config.server_node,
+            config.port,
+            config.user,
+            config.schema,
         )
 
-        # Encode password
-        encoded_password = urllib.parse.quote_plus(password)
+        # Create SQLAlchemy engine (pooled connections are pinged before reuse,
+        # they may have been dropped between warm invocations)
+        engine = create_engine(connection_string, pool_pre_ping=True)
 
-        # Build connection string
-        connection_string = (
-            f"hana+hdbcli://{user}:{encoded_password}@"
-            f"{server_node}:{port}?currentSchema={schema}"
-        )
+        # Slow-query log (only when SLOW_QUERY_THRESHOLD_MS is set)
+        install_slow_query_log(engine)
 
-        # Create SQLAlchemy engine
-        engine = create_engine(connection_string)
-
-        # Test connection
-        with engine.connect():
-            logger.info("✅ Successfully connected to SAP HANA")
-            return engine
+        # Test connection (transient connect errors are retried with backoff)
+        call_with_retry(lambda: check_connection(engine), "HANA connect")
+        log("✅ Successfully connected to SAP HANA")
+        _connection_logged = True
+        _engines[connection_string] = engine
+        return engine
 
     except SQLAlchemyError as e:
         logger.exception("HANA Connection Error: %s", e)
         raise RuntimeError(f"HANA connection failed: {e}") from e
+
+
+def clear_engine_cache() -> None:
+    """Dispose and forget the cached HANA engines and settings (next call reconnects)."""
+    for engine in _engines.values():
+        engine.dispose()
+    _engines.clear()
+    _configs.clear()
+
+
+def check_connection(engine) -> None:
+    """Open and close one connection to surface connect errors early."""
+    with engine.connect():
+        pass
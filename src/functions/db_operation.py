@@ -1,182 +1,376 @@
 import os
+import time
 import logging
-import uuid
-from typing import List, Dict, Any
-from sqlalchemy import text
+from itertools import compress
+from typing import List, Dict, Any, Mapping, Optional, Union
+from batching import AdaptiveBatchSizer
 from db_connection import get_hana_client
+from dead_letter import DeadLetterFile, FailureLog
+from deadline import Deadline, resume_offset, stop_early, take_invalid
+from log_sampling import RecordLogger
+from partial_update import GroupedUpdates, changed_columns
+from record_types import User, parse_records, positional_insert
+from retry import CircuitOpenError, call_with_retry, is_transient_error
+from row_hash import compute_row_hash, fetch_row_hashes, fetch_rows
+from key_generation import is_deterministic_keys_enabled, make_key, upsert_statement
+from staging_load import StagingSpec, StagingTable, dedupe_by_key
+from user_columns import UserColumns, as_user_columns
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# P_USERS columns maintained by updates (compared field by field, covered by rowHash)
+USER_UPDATE_COLUMNS = (
+    "firstName", "lastName", "displayName", "email", "phoneNumber", "country",
+    "zip", "userName", "status", "userType", "mailVerified", "phoneVerified",
+    "lastModified", "modifiedBy",
+)
 
-def insert_or_update_users_bulk(users: List[Dict[str, Any]]) -> Dict[str, int]:
+# All P_USERS columns written on insert (the User record fields, in order)
+USER_INSERT_COLUMNS = User._fields
+
+# Staging-table layout for the initial load
+USER_STAGING = StagingSpec(
+    table="SPUSER_STAGING_P_USERS",
+    key_column="userId",
+    columns=USER_INSERT_COLUMNS,
+    update_columns=USER_UPDATE_COLUMNS + ("rowHash",),
+    unique_columns=("email", "userName"),
+)
+
+
+def insert_or_update_users_bulk(
+    users: Union[UserColumns, List[Dict[str, Any]]],
+    deadline: Optional[Deadline] = None,
+    dead_letters: Optional[DeadLetterFile] = None,
+) -> Dict[str, int]:
     """
-    Insert or update users into SPUSER_STAGING_P_USERS table.
-    Handles each user independently: errors for one user do not block others.
-    Returns a summary dict: inserted count, updated count, failed userIds.
+    Insert or update users (a UserColumns batch or JSON dicts) into SPUSER_STAGING_P_USERS table.
+    - Validation, rowHash and insert parameters work on the columns (see UserColumns).
+    - Users are processed in chunks (starting at USER_BATCH_SIZE, adapted to the
+      measured chunk latency, see AdaptiveBatchSizer): one key + rowHash lookup,
+      one insert executemany and one executemany per changed-column set per chunk.
+      Full rows are only read for users whose rowHash differs.
+    - With DETERMINISTIC_KEYS=1, each chunk is written with one upsert by userId
+      and no prior lookup (see upsert_users_bulk); the result then counts
+      "upserted" (new or changed) and "unchanged" users.
+    - Every chunk is its own transaction and is retried with backoff on
+      transient errors (see retry.call_with_retry). If a chunk fails otherwise,
+      its users are retried one by one, so errors for one user do not block others.
+    - With a deadline, no new chunk is started once it would not finish in
+      the remaining budget; the result then has "continue": True and the
+      input offset to resume from ("next_offset").
+    - With dead_letters, failed users are written to it as they happen and the
+      result only keeps their count and a sample (see FailureLog).
+    Returns a summary dict: inserted, updated and unchanged counts, failed userIds.
     """
     schema = os.getenv("HANA_SCHEMA")
     if not schema:
         raise ValueError("Environment variable HANA_SCHEMA is not set.")
 
     engine = get_hana_client()
+    record_log = RecordLogger(logger, "user")
+    sizer = AdaptiveBatchSizer.from_env("USER_BATCH_SIZE")
 
-    inserted_count = 0
-    updated_count = 0
-    failed_users = []
+    counts = {"inserted": 0, "updated": 0, "unchanged": 0}
+    failed_users = FailureLog("user", dead_letters)
 
-    with engine.begin() as connection:
-        for u in users:
-            user_id = u.get("userId")
-            if not user_id:
-                logger.warning("Skipping user with missing userId: %s", u)
-                failed_users.append({"user": u, "error": "Missing userId"})
-                continue
-
-            try:
-                # Check if user exists
-                existing = get_existing_users(connection, schema, [user_id])
-                if not existing:
-                    # Insert single user
-                    insert_users_bulk(connection, schema, [u])
-                    inserted_count += 1
-                else:
-                    # Update single user
-                    update_users_bulk(connection, schema, [u])
-                    updated_count += 1
-
-            except Exception as e:
-                logger.exception(
-                    "Failed to insert/update userId=%s: %s",
-                    user_id,
-                    e,
+    batch = as_user_columns(users)
+    validation_errors = batch.validation_errors()
+    valid_users, invalid_users = batch.validate(validation_errors)
+    for failure in invalid_users:
+        record_log.warning("Skipping user %s: %s", failure["user"].get("userId"), failure["error"])
+    positions = [index for index, error in enumerate(validation_errors) if error is None]
+    invalid = list(zip((index for index, error in enumerate(validation_errors) if error), invalid_users))
+
+    deadline = deadline or Deadline()
+    processed = 0
+    stopped = False
+    for chunk in sizer.chunks(valid_users):
+        if processed and not deadline.allows(len(chunk)):
+            stopped = True
+            break
+        failed_users.extend(take_invalid(invalid, resume_offset(positions, processed, len(batch))))
+        processed += len(chunk)
+        record_log.record(len(chunk))
+        started = time.perf_counter()
+        errors = 0
+        chunk_counts = {}
+        try:
+            # Each chunk runs in its own transaction, retried on transient errors
+            chunk_counts = call_with_retry(
+                lambda: run_user_chunk(engine, schema, chunk, record_log),
+                f"user chunk ({len(chunk)} records)",
+            )
+        except Exception as e:
+            # Counts as a failed chunk for batch sizing even if the retries succeed
+            errors = len(chunk)
+            chunk_counts = {}
+            if is_transient_error(e) or isinstance(e, CircuitOpenError):
+                # Retries exhausted — one-by-one retries would hit the same outage
+                record_log.exception("Chunk of %d user(s) failed: %s", len(chunk), e)
+                failed_users.extend(
+                    {
+                        "user": u._asdict(),
+                        "error": str(e),
+                        "error_class": type(e).__name__,
+                    }
+                    for u in chunk.records()
+                )
+                retry_users = []
+            else:
+                record_log.warning(
+                    "Chunk of %d user(s) failed (%s) — retrying one by one", len(chunk), e
                 )
-                failed_users.append({"user": u, "error": str(e)})
+                retry_users = chunk.records()
+            for u in retry_users:
+                try:
+                    single = call_with_retry(
+                        lambda: run_user_chunk(engine, schema, [u], record_log),
+                        f"userId={u.get('userId')}",
+                    )
+                except Exception as user_error:
+                    record_log.exception(
+                        "Failed to insert/update userId=%s: %s",
+                        u.get("userId"),
+                        user_error,
+                    )
+                    failed_users.append({
+                        "user": u._asdict(),
+                        "error": str(user_error),
+                        "error_class": type(user_error).__name__,
+                    })
+                    continue
+                for key, value in single.items():
+                    chunk_counts[key] = chunk_counts.get(key, 0) + value
+
+        for key, value in chunk_counts.items():
+            counts[key] = counts.get(key, 0) + value
+        sizer.record(len(chunk), time.perf_counter() - started, errors=errors)
+        deadline.record(len(chunk), time.perf_counter() - started)
 
-    logger.info(
-        "Insert/Update Summary: inserted=%d, updated=%d, failed=%d",
-        inserted_count,
-        updated_count,
-        len(failed_users),
+    failed_users.extend(take_invalid(invalid, resume_offset(positions, processed, len(batch))))
+    summary = {**counts, **failed_users.summary()}
+    if stopped:
+        stop_early(summary, positions, processed, len(batch))
+        record_log.warning("Time budget exhausted — stopping at input offset %d", summary["next_offset"])
+
+    record_log.summary(
+        "Insert/Update Summary",
+        **counts,
+        failed=len(failed_users),
+        batch_sizes=sizer.describe(),
     )
-    return {
-        "inserted": inserted_count,
-        "updated": updated_count,
-        "failed": failed_users,
-    }
+    return summary
 
 
-def get_existing_users(connection, schema: str, user_ids: List[str]) -> List[str]:
+def initial_load_users(
+    users: Union[UserColumns, List[Dict[str, Any]]], dead_letters: Optional[DeadLetterFile] = None
+) -> Dict[str, int]:
     """
-    Return list of userIds that already exist in SPUSER_STAGING_P_USERS.
+    Initial-load variant of insert_or_update_users_bulk (LOAD_MODE=initial).
+    All users are bulk-inserted into a staging table, classified with one join
+    and applied with set-based MERGE statements (see StagingTable).
+    Duplicate userIds in the input keep their last record; users whose email or
+    userName is already taken are reported as failed instead of failing the merge.
+    The load runs in one transaction: any other DB error fails the whole load.
+    With dead_letters, failed users are written to it as they happen (see FailureLog).
     """
-    if not user_ids:
-        return []
+    schema = os.getenv("HANA_SCHEMA")
+    if not schema:
+        raise ValueError("Environment variable HANA_SCHEMA is not set.")
 
-    placeholders = ", ".join([f":id_{i}" for i in range(len(user_ids))])
-    query = (
-        f"SELECT userId FROM {schema}.SPUSER_STAGING_P_USERS "
-        f"WHERE userId IN ({placeholders})"
+    engine = get_hana_client()
+    record_log = RecordLogger(logger, "user")
+    record_log.record(len(users))
+    valid_users, invalid_users = as_user_columns(users).validate()
+    for failure in invalid_users:
+        record_log.warning("Skipping user %s: %s", failure["user"].get("userId"), failure["error"])
+    failed_users = FailureLog("user", dead_letters)
+    failed_users.extend(invalid_users)
+
+    valid_users, duplicates = dedupe_by_key(valid_users.records(), "userId")
+    staged = [user_row(u, make_key("P_USERS", u.userId)) for u in valid_users]
+
+    with engine.begin() as connection:
+        with StagingTable(connection, schema, USER_STAGING) as staging:
+            staging.load(staged)
+            rejected = staging.reject_conflicts()
+            counts = staging.classify()
+            staging.merge()
+
+    users_by_id = {u.get("userId"): u for u in valid_users}
+    for user_id, column in rejected.items():
+        record_log.warning("Skipping userId=%s: %s already in use", user_id, column)
+        failed_users.append({"user": users_by_id[user_id]._asdict(), "error": f"Duplicate {column}"})
+
+    record_log.summary(
+        "Initial Load Summary",
+        inserted=counts["inserted"],
+        updated=counts["updated"],
+        unchanged=counts["unchanged"],
+        duplicates=duplicates,
+        failed=len(failed_users),
     )
+    return {
+        "inserted": counts["inserted"],
+        "updated": counts["updated"],
+        "unchanged": counts["unchanged"],
+        **failed_users.summary(),
+    }
 
-    params = {f"id_{i}": val for i, val in enumerate(user_ids)}
 
-    result = connection.execute(text(query), params)
-    return [row[0] for row in result.fetchall()]
+def run_user_chunk(engine, schema: str, users: Union[UserColumns, List[Any]], record_log=None) -> Dict[str, int]:
+    """Insert or update one chunk of users in its own transaction."""
+    with engine.begin() as connection:
+        return upsert_user_chunk(connection, schema, users, record_log)
 
 
-def insert_users_bulk(connection, schema: str, users: List[Dict[str, Any]]):
+def upsert_user_chunk(connection, schema: str, users: Union[UserColumns, List[Any]], record_log=None) -> Dict[str, int]:
     """
-    Insert new users into SPUSER_STAGING_P_USERS.
-    Handles a list of users (usually one in the new per-user loop).
+    Insert or update one chunk of users (raises on the first DB error).
+    New and changed users are split off with masks over the rowHash column.
+    Returns inserted/updated/unchanged counts for the chunk
+    (upserted/unchanged with DETERMINISTIC_KEYS=1, which skips the lookup).
     """
-    sql = f"""
-        INSERT INTO {schema}.SPUSER_STAGING_P_USERS (
-            userUuid, userId, firstName, lastName, displayName, email,
-            phoneNumber, country, zip, userName, status, userType,
-            mailVerified, phoneVerified, created, lastModified, modifiedBy
-        )
-        VALUES (
-            :userUuid, :userId, :firstName, :lastName, :displayName, :email,
-            :phoneNumber, :country, :zip, :userName, :status, :userType,
-            :mailVerified, :phoneVerified, :created, :lastModified, :modifiedBy
+    table = f"{schema}.SPUSER_STAGING_P_USERS"
+    users = as_user_columns(users)
+    if is_deterministic_keys_enabled():
+        upserted = upsert_users_bulk(connection, schema, users, record_log)
+        return {"upserted": upserted, "unchanged": len(users) - upserted}
+
+    user_ids = users.column("userId")
+    row_hashes = users.row_hashes(USER_UPDATE_COLUMNS)
+    stored_hashes = fetch_row_hashes(connection, table, "userId", user_ids)
+
+    stored = [stored_hashes.get(user_id) for user_id in user_ids]
+    new_mask = [row is None for row in stored]
+    changed_mask = [row is not None and row["rowHash"] != row_hash for row, row_hash in zip(stored, row_hashes)]
+    inserted = sum(new_mask)
+    changed = sum(changed_mask)
+    unchanged = len(users) - inserted - changed
+
+    changed_users = users.compress(changed_mask).records()
+    existing_rows = get_existing_users(connection, schema, [u.userId for u in changed_users])
+
+    if inserted:
+        new_users = users.compress(new_mask).with_columns(
+            rowHash=list(compress(row_hashes, new_mask))
         )
+        insert_users_bulk(connection, schema, new_users, record_log)
+    updated = update_users_bulk(connection, schema, changed_users, record_log, existing_rows)
+
+    return {
+        "inserted": inserted,
+        "updated": updated,
+        "unchanged": unchanged,
+    }
+
+
+def get_existing_users(connection, schema: str, user_ids: List[str]) -> Dict[str, Mapping[str, Any]]:
+    """
+    Return the stored rows (userId → column mapping) of the userIds that
+    already exist in SPUSER_STAGING_P_USERS.
     """
+    return fetch_rows(
+        connection, f"{schema}.SPUSER_STAGING_P_USERS", "userId", user_ids, USER_UPDATE_COLUMNS
+    )
 
-    batch = []
-    for u in users:
-        batch.append(
-            {
-                "userUuid": str(uuid.uuid4()),
-                "userId": u.get("userId"),
-                "firstName": u.get("firstName"),
-                "lastName": u.get("lastName"),
-                "displayName": u.get("displayName"),
-                "email": u.get("email"),
-                "phoneNumber": u.get("phoneNumber"),
-                "country": u.get("country"),
-                "zip": u.get("zip"),
-                "userName": u.get("userName"),
-                "status": u.get("status"),
-                "userType": u.get("userType"),
-                "mailVerified": u.get("mailVerified"),
-                "phoneVerified": u.get("phoneVerified"),
-                "created": u.get("created"),
-                "lastModified": u.get("lastModified"),
-                "modifiedBy": u.get("modifiedBy"),
-            }
-        )
 
-    connection.execute(text(sql), batch)
-    logger.info("Inserted %d user(s)", len(users))
+def insert_users_bulk(connection, schema: str, users: Union[UserColumns, List[Any]], record_log=None):
+    """
+    Insert new users (a UserColumns batch, User records or dicts) into SPUSER_STAGING_P_USERS.
+    Handles the batch as one executemany whose positional tuples are zipped from
+    the columns; userUuid and rowHash (unless already set) are computed per column.
+    Per-call log lines go through record_log (sampled) when given.
+    """
+    users = as_user_columns(users)
+    if not len(users):
+        return
+    row_hashes = users.column("rowHash")
+    if not all(row_hashes):
+        row_hashes = users.row_hashes(USER_UPDATE_COLUMNS)
+    batch = users.with_columns(
+        userUuid=[make_key("P_USERS", user_id) for user_id in users.column("userId")],
+        rowHash=row_hashes,
+    )
 
+    connection.exec_driver_sql(
+        positional_insert(connection, f"{schema}.SPUSER_STAGING_P_USERS", USER_INSERT_COLUMNS),
+        batch.param_rows(USER_INSERT_COLUMNS),
+    )
+    (record_log or logger).info("Inserted %d user(s)", len(users))
 
-def update_users_bulk(connection, schema: str, users: List[Dict[str, Any]]):
+
+def upsert_users_bulk(
+    connection, schema: str, users: Union[UserColumns, List[Any]], record_log=None
+) -> int:
     """
-    Update existing users in SPUSER_STAGING_P_USERS.
-    Handles a list of users (usually one in the new per-user loop).
+    Insert or update users with one upsert by userId and no prior lookup (DETERMINISTIC_KEYS=1).
+    - New rows get the UUIDv5 of their userId as userUuid.
+    - Existing rows only get USER_UPDATE_COLUMNS + rowHash, and only if their rowHash
+      differs: userUuid (also of rows keyed before deterministic keys were enabled)
+      and created keep their stored values.
+    Returns the number of written (new or changed) users.
+    """
+    users = as_user_columns(users)
+    if not len(users):
+        return 0
+
+    batch = users.with_columns(
+        userUuid=[make_key("P_USERS", user_id) for user_id in users.column("userId")],
+        rowHash=users.row_hashes(USER_UPDATE_COLUMNS),
+    )
+    statement = upsert_statement(
+        connection, f"{schema}.SPUSER_STAGING_P_USERS", USER_INSERT_COLUMNS, "userId",
+        update_columns=USER_UPDATE_COLUMNS + ("rowHash",),
+    )
+    rows = [dict(zip(USER_INSERT_COLUMNS, row)) for row in batch.param_rows(USER_INSERT_COLUMNS)]
+    result = connection.execute(statement, rows)
+    # rowcount of the executemany (-1 if the driver does not report it)
+    upserted = result.rowcount if result.rowcount >= 0 else len(rows)
+    (record_log or logger).info("Upserted %d user(s)", upserted)
+    return upserted
+
+
+def user_row(u: User, user_uuid: str) -> User:
+    """Full P_USERS row (positional parameters) with its key and rowHash filled in."""
+    return u._replace(userUuid=user_uuid, rowHash=compute_row_hash(u, USER_UPDATE_COLUMNS))
+
+
+def update_users_bulk(
+    connection,
+    schema: str,
+    users: List[Dict[str, Any]],
+    record_log=None,
+    existing_rows: Dict[str, Mapping[str, Any]] = None,
+) -> int:
     """
-    sql = f"""
-        UPDATE {schema}.SPUSER_STAGING_P_USERS
-        SET firstName = :firstName,
-            lastName = :lastName,
-            displayName = :displayName,
-            email = :email,
-            phoneNumber = :phoneNumber,
-            country = :country,
-            zip = :zip,
-            userName = :userName,
-            status = :status,
-            userType = :userType,
-            mailVerified = :mailVerified,
-            phoneVerified = :phoneVerified,
-            lastModified = :lastModified,
-            modifiedBy = :modifiedBy
-        WHERE userId = :userId
+    Update existing users in SPUSER_STAGING_P_USERS.
+    - With existing_rows, only the changed columns of each user (plus rowHash)
+      are written and users sharing the same changed-column set are sent as
+      one executemany; users without column changes only get rowHash refreshed
+      (e.g. rows written before rowHash existed).
+    - Without existing_rows, all columns are written.
+    Raises on the first failing row. Returns the number of updated users.
     """
+    updates = GroupedUpdates(f"{schema}.SPUSER_STAGING_P_USERS", "userId")
+    for u in parse_records(User, users):
+        user_id = u.userId
+        if existing_rows is None:
+            columns = USER_UPDATE_COLUMNS
+        else:
+            columns = changed_columns(u, existing_rows[user_id], USER_UPDATE_COLUMNS)
+        values = u._replace(rowHash=compute_row_hash(u, USER_UPDATE_COLUMNS))
+        updates.add(user_id, values, columns + ("rowHash",), record=u)
 
-    batch = []
-    for u in users:
-        batch.append(
-            {
-                "userId": u.get("userId"),
-                "firstName": u.get("firstName"),
-                "lastName": u.get("lastName"),
-                "displayName": u.get("displayName"),
-                "email": u.get("email"),
-                "phoneNumber": u.get("phoneNumber"),
-                "country": u.get("country"),
-                "zip": u.get("zip"),
-                "userName": u.get("userName"),
-                "status": u.get("status"),
-                "userType": u.get("userType"),
-                "mailVerified": u.get("mailVerified"),
-                "phoneVerified": u.get("phoneVerified"),
-                "lastModified": u.get("lastModified"),
-                "modifiedBy": u.get("modifiedBy"),
-            }
-        )
+    if not len(updates):
+        return 0
 
-    connection.execute(text(sql), batch)
-    logger.info("Updated %d user(s)", len(users))
+    updated, failures = updates.execute(connection)
+    if failures:
+        _, error = failures[0]
+        raise error
+    (record_log or logger).info("Updated %d user(s)", updated)
+    return updated
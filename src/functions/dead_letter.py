@@ -0,0 +1,179 @@
+import os
+import logging
+from datetime import datetime
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Set
+import json_codec
+
+logger = logging.getLogger(__name__)
+logging.basicConfig(level=logging.INFO)
+
+DEFAULT_SAMPLE_SIZE = 5
+
+# Failures without an exception behind them (validation, duplicates)
+DEFAULT_ERROR_CLASS = "ValidationError"
+
+
+def get_sample_size() -> int:
+    """Failures kept in the returned summary (DEAD_LETTER_SAMPLE_SIZE, default 5)."""
+    return max(0, int(os.getenv("DEAD_LETTER_SAMPLE_SIZE", DEFAULT_SAMPLE_SIZE)))
+
+
+class DeadLetterFile:
+    """
+    Failed records spilled to an NDJSON file (DEAD_LETTER_PATH), one line per record:
+    {"stage", "error_class", "error", "record", "failedAt"}.
+    - write() appends the failures of one loader result.
+    - take() hands the file over for reprocessing (renamed to <path>.reprocessing,
+      so records failing again are written to a fresh file); done() removes it.
+      An interrupted reprocessing run is resumed from the .reprocessing file.
+    """
+
+    def __init__(self, path: str):
+        self.path = os.path.abspath(path)
+        self.reprocessing_path = self.path + ".reprocessing"
+
+    @classmethod
+    def from_env(cls, default_path: str) -> "DeadLetterFile":
+        return cls(os.getenv("DEAD_LETTER_PATH", default_path))
+
+    def write(self, stage: str, failures: Iterable[Dict[str, Any]]) -> int:
+        """Append failures ({"<stage>": record, "error", "error_class"?}). Returns the number written."""
+        failed_at = datetime.utcnow().isoformat()
+        lines = [
+            json_codec.dumps({
+                "stage": stage,
+                "error_class": failure.get("error_class", DEFAULT_ERROR_CLASS),
+                "error": failure.get("error"),
+                "record": failure.get(stage),
+                "failedAt": failed_at,
+            })
+            for failure in failures
+        ]
+        if lines:
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write("\n".join(lines) + "\n")
+        return len(lines)
+
+    def take(self, stages: Sequence[str]) -> Dict[str, List[Dict[str, Any]]]:
+        """Records of the dead-letter file grouped by stage (only stages, in file order)."""
+        records: Dict[str, List[Dict[str, Any]]] = {stage: [] for stage in stages}
+        if os.path.exists(self.reprocessing_path):
+            logger.info("Resuming reprocessing of %s", self.reprocessing_path)
+        elif os.path.exists(self.path):
+            os.replace(self.path, self.reprocessing_path)
+        else:
+            return records
+
+        with open(self.reprocessing_path, "rb") as f:
+            for line in f:
+                if not line.strip():
+                    continue
+                entry = json_codec.loads(line)
+                if entry.get("stage") in records and entry.get("record"):
+                    records[entry["stage"]].append(entry["record"])
+        return records
+
+    def done(self) -> None:
+        """Drop the reprocessed file (its records either loaded or were written again)."""
+        if os.path.exists(self.reprocessing_path):
+            os.remove(self.reprocessing_path)
+
+
+class FailureLog:
+    """
+    Failures of one loader run ({"<stage>": record, "error", "error_class"?}),
+    collected with append() / extend() like a list.
+    - With a dead-letter file, failures are written to it as they are added;
+      only their count and the first sample_size of them are kept.
+    - Without one, every failure is kept (summary() returns them as a list).
+    - With key_field, the key values of the failed records are collected
+      (None once a failure has no record to take the key from).
+    """
+
+    def __init__(
+        self,
+        stage: str,
+        dead_letters: Optional[DeadLetterFile] = None,
+        key_field: Optional[str] = None,
+        sample_size: Optional[int] = None,
+    ):
+        self.stage = stage
+        self.dead_letters = dead_letters
+        self.key_field = key_field
+        self.sample_size = get_sample_size() if sample_size is None else sample_size
+        self.count = 0
+        self.failures: List[Dict[str, Any]] = []
+        self.keys: Optional[Set[Any]] = set()
+
+    def __len__(self) -> int:
+        return self.count
+
+    def append(self, failure: Dict[str, Any]) -> None:
+        self.extend([failure])
+
+    def extend(self, failures: Iterable[Dict[str, Any]]) -> None:
+        failures = list(failures)
+        if not failures:
+            return
+        self.count += len(failures)
+        if self.key_field:
+            self._collect_keys(failures)
+        if self.dead_letters is None:
+            self.failures.extend(failures)
+            return
+        self.dead_letters.write(self.stage, failures)
+        self.failures.extend(failures[:max(0, self.sample_size - len(self.failures))])
+
+    def _collect_keys(self, failures: List[Dict[str, Any]]) -> None:
+        for failure in failures:
+            record = failure.get(self.stage)
+            if self.keys is None or not isinstance(record, dict):
+                self.keys = None
+                return
+            if record.get(self.key_field) is not None:
+                self.keys.add(record[self.key_field])
+
+    def summary(self, key: str = "failed") -> Dict[str, Any]:
+        """
+        Result entries of the failures: key → the failures, or with a dead-letter
+        file key → count, "<key>_sample" and "dead_letter_file". With key_field
+        also "<key>_keys" (sorted key values, None if unknown).
+        """
+        if self.dead_letters is None:
+            summary: Dict[str, Any] = {key: list(self.failures)}
+        else:
+            summary = {key: self.count}
+            if self.count:
+                summary[f"{key}_sample"] = list(self.failures)
+                summary["dead_letter_file"] = self.dead_letters.path
+        if self.key_field:
+            summary[f"{key}_keys"] = None if self.keys is None else sorted(self.keys, key=str)
+        return summary
+
+
+def spill_failures(
+    result: Dict[str, Any],
+    stage: str,
+    dead_letters: DeadLetterFile,
+    keys: Sequence[str] = ("failed",),
+    sample_size: Optional[int] = None,
+) -> Dict[str, Any]:
+    """
+    Write the failure lists of a loader result (keys, e.g. "failed", "deferred")
+    to the dead-letter file and return the summary with each list replaced by
+    its count plus a "<key>_sample" of the first sample_size failures.
+    Counts of loaders that already wrote their failures (see FailureLog) are kept.
+    """
+    sample_size = get_sample_size() if sample_size is None else sample_size
+    summary = dict(result)
+    for key in keys:
+        failures = result.get(key) or []
+        if not isinstance(failures, list):
+            continue
+        dead_letters.write(stage, failures)
+        summary[key] = len(failures)
+        if failures:
+            summary[f"{key}_sample"] = failures[:sample_size]
+    if any(summary.get(key) for key in keys):
+        summary["dead_letter_file"] = dead_letters.path
+    return summary
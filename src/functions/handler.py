@@ -1,31 +1,140 @@
 import os
-import json
-from db_operation import insert_or_update_users_bulk
+import tempfile
+from functools import partial
+from itertools import compress
+from batching import batched, get_input_batch_size
+from dead_letter import DeadLetterFile, spill_failures
+from db_operation import initial_load_users, insert_or_update_users_bulk
+from event_input import has_input, read_file, read_records
+from staging_load import is_initial_load
+from profiling import profile_invocation
+from sharding import get_shard, shard_mask
+from user_columns import UserColumns
 
+# Modules only some modes need (work_queue for the queue, journal and checkpoints
+# for load / reprocess) are imported in their branch, off the other modes' cold start
 
+
+def get_handler_mode(event) -> str:
+    """
+    Run mode from event["mode"] or HANDLER_MODE: "load" (default), "queue" or
+    "reprocess" (only the records of the dead-letter file).
+    """
+    mode = event.get("mode") if isinstance(event, dict) else None
+    return (mode or os.getenv("HANDLER_MODE", "load")).strip().lower()
+
+
+@profile_invocation("users_handler")
 def main(event, context):
-    json_file_path = os.path.join(os.path.dirname(__file__), "data.json")
-    with open(json_file_path, "r") as f:
-        json_array = json.load(f)
-
-    # Filter users whose userID starts with 'P'
-    valid_users = [
-        user for user in json_array if str(user.get("userId", "")).startswith("P")
-    ]
-
-    # Optionally, log or print skipped users
-    skipped_users = [
-        user for user in json_array if not str(user.get("userId", "")).startswith("P")
-    ]
-    if skipped_users:
-        print(
-            "Skipped users (invalid userID): "
-            f"{[user.get('userId') for user in skipped_users]}"
+    mode = get_handler_mode(event)
+
+    # The loader writes failed users to the dead-letter file as they happen, the result only keeps a sample
+    dead_letters = DeadLetterFile.from_env(os.path.join(tempfile.gettempdir(), "users_dead_letters.ndjson"))
+
+    # Records sent in the event (event["users"]: a list, JSON array or NDJSON,
+    # optionally gzipped / base64) replace the bundled data.json
+    from_event = has_input(event, ("users",))
+
+    if mode == "reprocess":
+        json_array = dead_letters.take(("user",))["user"]
+        print(f"Reprocessing {len(json_array)} user(s) from {dead_letters.reprocessing_path}")
+    elif from_event:
+        json_array = read_records(event, "users")
+    else:
+        json_array = read_file(os.path.join(os.path.dirname(__file__), "data.json"))
+
+    # SHARD_INDEX / SHARD_COUNT → only the userIds hashing into this shard
+    shard = get_shard(event)
+    if shard.is_sharded:
+        print(f"Shard {shard}: loading the users of this shard")
+
+    def user_batches(offset=0):
+        # Input batches of INPUT_BATCH_SIZE records (event input is a stream), parsed into
+        # columns, then filtered to the users whose userID starts with 'P'; the first
+        # offset valid users are skipped
+        for batch in batched(json_array, get_input_batch_size()):
+            users = UserColumns.from_records(batch)
+            valid_mask = users.p_prefix_mask()
+            in_shard = shard_mask(users.column("userId"), shard)
+            valid_users = users.compress([valid and own for valid, own in zip(valid_mask, in_shard)])
+
+            # Optionally, log or print skipped users
+            skipped_ids = list(compress(
+                users.column("userId"), [not valid and own for valid, own in zip(valid_mask, in_shard)]
+            ))
+            if skipped_ids:
+                print(f"Skipped users (invalid userID): {skipped_ids}")
+
+            if offset >= len(valid_users):
+                offset -= len(valid_users)
+                continue
+            yield valid_users[offset:] if offset else valid_users
+            offset = 0
+
+    # Queue mode → batches in a local SQLite queue, drained by worker processes
+    if mode == "queue":
+        from work_queue import StageInput, WorkQueue, produce_and_drain
+        load = initial_load_users if is_initial_load() else insert_or_update_users_bulk
+        queue = WorkQueue.from_env(os.path.join(tempfile.gettempdir(), "users_work_queue.sqlite"))
+        try:
+            result = produce_and_drain(
+                queue,
+                [StageInput(
+                    f"{load.__module__}:{load.__name__}",
+                    (user._asdict() for users in user_batches() for user in users.records()), "user",
+                )],
+                int(os.getenv("QUEUE_BATCH_SIZE", 500)),
+                dead_letters=dead_letters,
+            )
+        finally:
+            queue.close()
+        print(f"Queue Result: {result}")
+        return
+
+    # Time budget (context / TIME_BUDGET_SECONDS): a load stopped by it resumes
+    # from its checkpoint, an offset into the (shard-filtered) valid users of the input
+    # (event input: the caller resends the event with the returned position as "resume").
+    # Only load mode has a resume position, so only it runs under the budget:
+    # reprocessing always attempts every dead-letter record.
+    from deadline import Checkpoint, Deadline, EventCheckpoint
+    from load_journal import is_journal_enabled, load_in_batches, load_with_journal
+    from record_types import User
+    deadline = Deadline.from_context(context)
+    budget = {"deadline": deadline} if mode == "load" and not is_initial_load() else {}
+    checkpoint = EventCheckpoint(event) if from_event else Checkpoint.from_env(os.path.join(
+        tempfile.gettempdir(), f"users_checkpoint_{shard.index}_of_{shard.count}.json"
+    ))
+    offset = 0
+
+    # LOAD_JOURNAL=1 → already applied inputs / batches are skipped (see load_journal),
+    # the journal also replaces the checkpoint offset as resume position
+    load_users = initial_load_users if is_initial_load() else insert_or_update_users_bulk
+    if is_journal_enabled() and mode == "load":
+        load_users = partial(
+            load_with_journal, load_users, stage="user",
+            row_hashes=lambda batch: batch.row_hashes(User._fields),
         )
+    elif mode == "load":
+        position = checkpoint.load()
+        offset = position["offset"] if position else 0
+        if offset:
+            print(f"Resuming at user {offset} from {checkpoint.path}")
 
-    # Call the DB operation
-    if valid_users:
-        result = insert_or_update_users_bulk(valid_users)
+    # Call the DB operation, one input batch at a time
+    marker = {"continue": False}
+    result = load_in_batches(load_users, user_batches(offset), dead_letters=dead_letters, **budget)
+    if result is not None:
+        if result.get("continue"):
+            position = checkpoint.save(stage="user", offset=offset + result["next_offset"])
+            marker = {"continue": True, "checkpoint": position}
+        result = spill_failures(result, "user", dead_letters)
         print(f"DB Operation Result: {result}")
     else:
         print("No valid users to process.")
+
+    if mode == "reprocess" and not marker["continue"]:
+        # Every record was attempted: failures were written to a fresh dead-letter file
+        dead_letters.done()
+    if mode == "load" and not marker["continue"]:
+        checkpoint.clear()
+    return marker
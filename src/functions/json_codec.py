@@ -0,0 +1,85 @@
+import os
+import json
+import logging
+from datetime import date, datetime
+from typing import IO, Any, Callable, Dict, Tuple, Union
+
+try:
+    import orjson
+except ImportError:  # optional speed-up, stdlib json otherwise
+    orjson = None
+
+logger = logging.getLogger(__name__)
+logging.basicConfig(level=logging.INFO)
+
+
+def _default(value: Any) -> str:
+    """Fallback encoding: ISO timestamps (as orjson writes them), str() for anything else."""
+    if isinstance(value, (date, datetime)):
+        return value.isoformat()
+    return str(value)
+
+
+def _stdlib_loads(data: Union[str, bytes]) -> Any:
+    return json.loads(data)
+
+
+def _stdlib_dumps(obj: Any, indent: bool = False) -> str:
+    return json.dumps(obj, default=_default, ensure_ascii=False, indent=2 if indent else None)
+
+
+def _orjson_loads(data: Union[str, bytes]) -> Any:
+    return orjson.loads(data)
+
+
+def _orjson_dumps(obj: Any, indent: bool = False) -> str:
+    option = orjson.OPT_NON_STR_KEYS | (orjson.OPT_INDENT_2 if indent else 0)
+    return orjson.dumps(obj, default=_default, option=option).decode("utf-8")
+
+
+# name → (loads, dumps); only installed libraries are listed
+BACKENDS: Dict[str, Tuple[Callable[..., Any], Callable[..., str]]] = {"json": (_stdlib_loads, _stdlib_dumps)}
+if orjson is not None:
+    BACKENDS["orjson"] = (_orjson_loads, _orjson_dumps)
+
+
+def select_backend() -> str:
+    """
+    JSON library used by the handlers and reports: JSON_BACKEND (json | orjson)
+    when set, else the fastest installed one. An unavailable backend falls back
+    to stdlib json.
+    """
+    requested = os.getenv("JSON_BACKEND", "").strip().lower()
+    if not requested:
+        return "orjson" if "orjson" in BACKENDS else "json"
+    if requested not in BACKENDS:
+        logger.warning("JSON_BACKEND=%s is not installed — using stdlib json", requested)
+        return "json"
+    return requested
+
+
+BACKEND = select_backend()
+_loads, _dumps = BACKENDS[BACKEND]
+
+
+def loads(data: Union[str, bytes]) -> Any:
+    """Parse a JSON document (str or bytes)."""
+    return _loads(data)
+
+
+def load(fp: IO) -> Any:
+    """Parse the JSON document of an open (text or binary) file."""
+    return _loads(fp.read())
+
+
+def dumps(obj: Any, indent: bool = False) -> str:
+    """
+    Serialize obj (e.g. a failure report) to a JSON string; values the backend
+    cannot encode (datetimes, Decimals, exceptions) are written as str().
+    """
+    return _dumps(obj, indent)
+
+
+def dump(obj: Any, fp: IO, indent: bool = False) -> None:
+    """Write obj as JSON to an open text file."""
+    fp.write(_dumps(obj, indent))
@@ -0,0 +1,241 @@
+import os
+import json
+import uuid
+import hashlib
+import logging
+from datetime import datetime
+from typing import Any, Callable, Dict, Iterable, List, Optional, Sequence, Set, Tuple
+from sqlalchemy import text
+from db_connection import get_hana_client
+from dead_letter import DeadLetterFile, get_sample_size
+from deadline import Deadline
+
+logger = logging.getLogger(__name__)
+logging.basicConfig(level=logging.INFO)
+
+JOURNAL_TABLE = "SPUSER_STAGING_LOAD_JOURNAL"
+DEFAULT_BATCH_SIZE = 500
+
+# batchIndex of the journal row marking the whole input as applied
+INPUT_APPLIED = -1
+
+
+def is_journal_enabled() -> bool:
+    """LOAD_JOURNAL=1 skips inputs and batches that were already applied."""
+    return os.getenv("LOAD_JOURNAL", "").strip().lower() in ("1", "true", "yes")
+
+
+def canonical_json(record: Any) -> str:
+    """
+    Canonical JSON text of a record (sorted keys, no whitespace, str() for other
+    types), always with the stdlib encoder: fingerprints must not change with the
+    active JSON backend (see json_codec) or the key order of the input.
+    """
+    return json.dumps(record, sort_keys=True, separators=(",", ":"), default=str)
+
+
+def record_fingerprints(records: Sequence[Dict[str, Any]]) -> List[str]:
+    """SHA-256 of every record's canonical JSON text (records of a re-delivered file serialize the same)."""
+    return [hashlib.sha256(canonical_json(record).encode("utf-8")).hexdigest() for record in records]
+
+
+def combine(parts: Sequence[str]) -> str:
+    return hashlib.sha256("\n".join(parts).encode("utf-8")).hexdigest()
+
+
+class LoadJournal:
+    """
+    Applied inputs of one stage in the journal table (SPUSER_STAGING_LOAD_JOURNAL).
+    The input is split into fixed batches (JOURNAL_BATCH_SIZE, default 500); each
+    batch is fingerprinted from its records, the input from its batches. One row
+    per applied batch, plus one (batchIndex -1) once the whole input is applied.
+    Lookups are scoped to the input's fingerprint: a later input with a batch of
+    earlier content (e.g. a delta setting records back, A→B→A) is applied again.
+    """
+
+    def __init__(
+        self,
+        stage: str,
+        records: Sequence[Any],
+        row_hashes: Callable[[Any], List[str]] = record_fingerprints,
+        batch_size: Optional[int] = None,
+    ):
+        self.stage = stage
+        batch_size = max(1, batch_size or int(os.getenv("JOURNAL_BATCH_SIZE", DEFAULT_BATCH_SIZE)))
+        self.batches: List[Tuple[int, int, str]] = [
+            (start, min(start + batch_size, len(records)),
+             combine([stage] + row_hashes(records[start:start + batch_size])))
+            for start in range(0, len(records), batch_size)
+        ]
+        self.fingerprint = combine([stage] + [batch[2] for batch in self.batches])
+
+    def lookup(self, connection, schema: str) -> Tuple[bool, Set[int]]:
+        """(whole input applied, indexes of the applied batches), with one query."""
+        rows = connection.execute(
+            text(f"""
+                SELECT batchIndex, batchFingerprint FROM {schema}.{JOURNAL_TABLE}
+                WHERE inputFingerprint = :fingerprint AND stage = :stage
+            """),
+            {"fingerprint": self.fingerprint, "stage": self.stage},
+        ).fetchall()
+        applied = {
+            row.batchIndex for row in rows
+            if 0 <= row.batchIndex < len(self.batches)
+            and row.batchFingerprint == self.batches[row.batchIndex][2]
+        }
+        return any(row.batchIndex == INPUT_APPLIED for row in rows), applied
+
+    def mark(self, connection, schema: str, batch_index: int, record_count: int) -> None:
+        """Journal one applied batch (or, with INPUT_APPLIED, the whole input)."""
+        connection.execute(
+            text(f"""
+                INSERT INTO {schema}.{JOURNAL_TABLE} (
+                    uuid, inputFingerprint, stage, batchIndex, batchFingerprint, recordCount, appliedAt
+                )
+                VALUES (
+                    :uuid, :inputFingerprint, :stage, :batchIndex, :batchFingerprint, :recordCount, :appliedAt
+                )
+            """),
+            {
+                "uuid": str(uuid.uuid4()),
+                "inputFingerprint": self.fingerprint,
+                "stage": self.stage,
+                "batchIndex": batch_index,
+                "batchFingerprint": (
+                    self.fingerprint if batch_index == INPUT_APPLIED else self.batches[batch_index][2]
+                ),
+                "recordCount": record_count,
+                "appliedAt": datetime.utcnow(),
+            },
+        )
+
+
+def merge_result(total: Dict[str, Any], result: Dict[str, Any]) -> None:
+    """
+    Add one batch's loader result to the total: counts summed, failure lists
+    joined (samples capped at DEAD_LETTER_SAMPLE_SIZE), other values kept.
+    A list that is None in any batch (e.g. unknown "failed_keys") stays None.
+    """
+    for key, value in result.items():
+        if key in ("continue", "next_offset"):
+            continue
+        if value is None or (key in total and total[key] is None):
+            total[key] = None
+        elif isinstance(value, list):
+            total[key] = (total.get(key) or []) + value
+            if key.endswith("_sample"):
+                total[key] = total[key][:get_sample_size()]
+        elif isinstance(value, str):
+            total[key] = value
+        elif isinstance(value, int) and not isinstance(value, bool):
+            total[key] = total.get(key, 0) + value
+
+
+def load_in_batches(
+    load: Callable[..., Dict[str, Any]],
+    batches: Iterable[Sequence[Any]],
+    deadline: Optional[Deadline] = None,
+    **options: Any,
+) -> Optional[Dict[str, Any]]:
+    """
+    Run a loader over a stream of input batches (e.g. batching.batched over
+    event_input.read_records), holding one batch at a time; the results are
+    merged with merge_result. A deadline that does not allow the next batch
+    stops the load, as does a stop of the loader itself: "continue" and
+    "next_offset" (an offset into the whole stream) are then set.
+    Returns None if there was no record to load. deadline and options
+    (e.g. dead_letters) are passed on to the loader.
+    """
+    if deadline is not None:
+        options["deadline"] = deadline
+    result: Optional[Dict[str, Any]] = None
+    offset = 0
+    for batch in batches:
+        if not len(batch):
+            continue
+        if result is not None and deadline is not None and not deadline.allows(len(batch)):
+            result.update({"continue": True, "next_offset": offset})
+            break
+
+        batch_result = load(batch, **options)
+        result = result if result is not None else {}
+        merge_result(result, batch_result)
+        if batch_result.get("continue"):
+            result.update({"continue": True, "next_offset": offset + batch_result["next_offset"]})
+            break
+        offset += len(batch)
+
+    if result is not None:
+        result.setdefault("failed", [])
+    return result
+
+
+def load_with_journal(
+    load: Callable[..., Dict[str, Any]],
+    records: Sequence[Any],
+    stage: str,
+    deadline: Optional[Deadline] = None,
+    row_hashes: Callable[[Any], List[str]] = record_fingerprints,
+    batch_size: Optional[int] = None,
+    dead_letters: Optional[DeadLetterFile] = None,
+) -> Dict[str, Any]:
+    """
+    Run a loader over records batch by batch, skipping what the journal has seen:
+    - an input applied before is skipped after one lookup ("skipped": all records),
+    - a partially applied input resumes at its first unapplied batch.
+    Each batch is journaled once its load returned without failures; a batch
+    with failed records (and so the input) stays unjournaled, so re-delivering
+    the input retries it. A crash in between re-runs that batch, which the
+    rowHash-based loaders apply idempotently. A deadline stop ("continue" /
+    "next_offset", an offset into records) leaves the stopped batch unjournaled.
+    deadline and dead_letters are passed on to the loader.
+    """
+    schema = os.getenv("HANA_SCHEMA")
+    if not schema:
+        raise ValueError("HANA_SCHEMA is not set.")
+
+    engine = get_hana_client()
+    journal = LoadJournal(stage, records, row_hashes, batch_size)
+    with engine.connect() as connection:
+        input_applied, applied = journal.lookup(connection, schema)
+
+    result: Dict[str, Any] = {"inserted": 0, "updated": 0, "unchanged": 0, "skipped": 0}
+    if input_applied:
+        logger.info("⏭️ %s input %s was already applied — skipping %d record(s)",
+                    stage, journal.fingerprint[:12], len(records))
+        result["skipped"] = len(records)
+        return {**result, "failed": []}
+
+    options = {"deadline": deadline} if deadline is not None else {}
+    if dead_letters is not None:
+        options["dead_letters"] = dead_letters
+    loaded = False
+    complete = True
+    for index, (start, end, _) in enumerate(journal.batches):
+        if index in applied:
+            result["skipped"] += end - start
+            continue
+        if loaded and deadline is not None and not deadline.allows(end - start):
+            result.update({"continue": True, "next_offset": start})
+            break
+
+        batch_result = load(records[start:end], **options)
+        loaded = True
+        merge_result(result, batch_result)
+        if batch_result.get("continue"):
+            result.update({"continue": True, "next_offset": start + batch_result["next_offset"]})
+            break
+        if batch_result.get("failed"):
+            complete = False  # retried when the input is delivered again
+            continue
+        with engine.begin() as connection:
+            journal.mark(connection, schema, index, end - start)
+    else:
+        if complete:
+            with engine.begin() as connection:
+                journal.mark(connection, schema, INPUT_APPLIED, len(records))
+
+    result.setdefault("failed", [])
+    if result["skipped"]:
+        logger.info("⏭️ Skipped %d %s record(s) of already applied batches", result["skipped"], stage)
+    return result
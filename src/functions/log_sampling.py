@@ -0,0 +1,79 @@
+import os
+import logging
+
+logger = logging.getLogger(__name__)
+logging.basicConfig(level=logging.INFO)
+
+DEFAULT_SAMPLE_RATE = 1000
+
+
+def get_log_mode() -> str:
+    """
+    Return the active logging mode from LOG_MODE.
+    - "full" (default) → every per-record line is logged.
+    - "sampled" → per-record lines are sampled, failures are always logged.
+    """
+    return os.getenv("LOG_MODE", "full").strip().lower()
+
+
+def is_sampled_mode() -> bool:
+    return get_log_mode() == "sampled"
+
+
+def get_sample_rate() -> int:
+    """Return N for the 1-in-N sampling rate (LOG_SAMPLE_RATE, default 1000)."""
+    try:
+        rate = int(os.getenv("LOG_SAMPLE_RATE", DEFAULT_SAMPLE_RATE))
+    except ValueError:
+        logger.warning("Invalid LOG_SAMPLE_RATE, using %d", DEFAULT_SAMPLE_RATE)
+        rate = DEFAULT_SAMPLE_RATE
+    return max(rate, 1)
+
+
+class RecordLogger:
+    """
+    Logger wrapper for per-record lines inside hot loops.
+    - info(): logged for every line in full mode, 1 in N lines in sampled mode.
+    - warning()/exception(): always logged and counted as failures.
+    - record(): counts handled records (a record may log several lines, or none).
+    - summary(): one aggregate line per batch, with sampling stats in sampled mode.
+    LOG_MODE and LOG_SAMPLE_RATE are read on creation: create one per invocation
+    or batch and call summary() at its end.
+    """
+
+    def __init__(self, target: logging.Logger, stage: str):
+        self.logger = target
+        self.stage = stage
+        self.sampled = is_sampled_mode()
+        self.rate = get_sample_rate() if self.sampled else 1
+        self.records = 0
+        self.lines = 0
+        self.logged = 0
+        self.failures = 0
+
+    def record(self, count: int = 1) -> None:
+        self.records += count
+
+    def info(self, msg: str, *args) -> None:
+        self.lines += 1
+        if not self.sampled or (self.lines - 1) % self.rate == 0:
+            self.logged += 1
+            self.logger.info(msg, *args)
+
+    def warning(self, msg: str, *args) -> None:
+        self.failures += 1
+        self.logger.warning(msg, *args)
+
+    def exception(self, msg: str, *args) -> None:
+        self.failures += 1
+        self.logger.exception(msg, *args)
+
+    def summary(self, title: str, **counts: int) -> None:
+        details = ", ".join(f"{key}={value}" for key, value in counts.items())
+        if self.sampled:
+            self.logger.info(
+                "%s: %s (stage=%s, records=%d, sampled 1/%d, logged=%d of %d record lines, failures logged=%d)",
+                title, details, self.stage, self.records, self.rate, self.logged, self.lines, self.failures,
+            )
+        else:
+            self.logger.info("%s: %s", title, details)
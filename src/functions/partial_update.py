@@ -0,0 +1,87 @@
+import logging
+from datetime import datetime
+from typing import Any, Dict, List, Mapping, Sequence, Tuple
+from sqlalchemy import text
+
+logger = logging.getLogger(__name__)
+logging.basicConfig(level=logging.INFO)
+
+
+def normalize_value(value: Any) -> Any:
+    """Normalize DB and JSON values for comparison ('' ≙ NULL, timestamps as ISO text)."""
+    if value == "":
+        return None
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return value
+
+
+def changed_columns(
+    incoming: Mapping[str, Any], existing: Mapping[str, Any], columns: Sequence[str]
+) -> Tuple[str, ...]:
+    """Return the columns whose incoming value differs from the stored one, in column order."""
+    return tuple(
+        column for column in columns
+        if normalize_value(incoming.get(column)) != normalize_value(existing.get(column))
+    )
+
+
+class GroupedUpdates:
+    """
+    Collects row updates keyed by their changed-column signature.
+    - Each row only writes the columns that actually changed.
+    - execute() runs one executemany per signature; if a group fails it is
+      retried row by row so a single bad row does not fail the whole group.
+    """
+
+    def __init__(self, table: str, key_column: str):
+        self.table = table
+        self.key_column = key_column
+        self.groups: Dict[Tuple[str, ...], List[Tuple[Dict[str, Any], Any]]] = {}
+        self._statements: Dict[Tuple[str, ...], Any] = {}
+
+    def __len__(self) -> int:
+        return sum(len(rows) for rows in self.groups.values())
+
+    def add(self, key_value: Any, values: Mapping[str, Any], columns: Tuple[str, ...], record: Any = None):
+        """Queue an update of `columns` for the row with key_value; `record` is returned on failure."""
+        params = {column: values.get(column) for column in columns}
+        params[self.key_column] = key_value
+        self.groups.setdefault(columns, []).append((params, record))
+
+    def statement(self, columns: Tuple[str, ...]):
+        if columns not in self._statements:
+            assignments = ",\n                ".join(f"{column} = :{column}" for column in columns)
+            self._statements[columns] = text(f"""
+                UPDATE {self.table}
+                SET {assignments}
+                WHERE {self.key_column} = :{self.key_column}
+            """)
+        return self._statements[columns]
+
+    def execute(self, connection) -> Tuple[int, List[Tuple[Any, Exception]]]:
+        """
+        Run all queued updates and clear the queue.
+        Returns (updated row count, [(record, error), ...] for rows that failed).
+        """
+        updated = 0
+        failures = []
+        for columns, rows in self.groups.items():
+            statement = self.statement(columns)
+            try:
+                connection.execute(statement, [params for params, _ in rows])
+                updated += len(rows)
+                continue
+            except Exception as e:
+                logger.warning(
+                    "Grouped update of %d row(s) on %s (%s) failed: %s — retrying row by row",
+                    len(rows), self.table, ", ".join(columns), e,
+                )
+            for params, record in rows:
+                try:
+                    connection.execute(statement, params)
+                    updated += 1
+                except Exception as e:
+                    failures.append((record, e))
+        self.groups.clear()
+        return updated, failures
@@ -0,0 +1,100 @@
+import os
+import time
+import functools
+import logging
+import tempfile
+
+logger = logging.getLogger(__name__)
+logging.basicConfig(level=logging.INFO)
+
+
+def is_profiling_enabled() -> bool:
+    """Profiling is switched on with PROFILE_HANDLER=1 (or true/yes)."""
+    return os.getenv("PROFILE_HANDLER", "").strip().lower() in ("1", "true", "yes")
+
+
+def profile_invocation(name: str):
+    """
+    Decorator for handler entry points.
+    Runs the wrapped call under cProfile and tracemalloc when PROFILE_HANDLER is set,
+    otherwise calls it directly.
+    """
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if not is_profiling_enabled():
+                return func(*args, **kwargs)
+            return run_profiled(name, func, *args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def run_profiled(name: str, func, *args, **kwargs):
+    """
+    Run func under cProfile and tracemalloc and write into PROFILE_DIR:
+    - <name>-<timestamp>-<pid>.pstats → cProfile stats (load with pstats / snakeviz)
+    - <name>-<timestamp>-<pid>-alloc.txt → top PROFILE_TOP_N allocation sites
+    """
+    import cProfile  # only needed when profiling, kept off the cold-start import path
+    import tracemalloc
+
+    output_dir = os.getenv("PROFILE_DIR", os.path.join(tempfile.gettempdir(), "profiles"))
+    top_n = int(os.getenv("PROFILE_TOP_N", 25))
+    frames = int(os.getenv("PROFILE_TRACEMALLOC_FRAMES", 10))
+
+    os.makedirs(output_dir, exist_ok=True)
+    base_path = os.path.join(
+        output_dir, f"{name}-{time.strftime('%Y%m%d-%H%M%S')}-{os.getpid()}"
+    )
+
+    already_tracing = tracemalloc.is_tracing()
+    if not already_tracing:
+        tracemalloc.start(frames)
+
+    profiler = cProfile.Profile()
+    started = time.perf_counter()
+    profiler.enable()
+    try:
+        return func(*args, **kwargs)
+    finally:
+        profiler.disable()
+        elapsed = time.perf_counter() - started
+        snapshot = tracemalloc.take_snapshot()
+        _, peak = tracemalloc.get_traced_memory()
+        if not already_tracing:
+            tracemalloc.stop()
+
+        stats_path = base_path + ".pstats"
+        alloc_path = base_path + "-alloc.txt"
+        profiler.dump_stats(stats_path)
+        write_allocation_report(alloc_path, snapshot, top_n, peak, elapsed)
+        logger.info(
+            "Profile written: stats=%s, allocations=%s (elapsed=%.3fs, peak=%.1f KiB)",
+            stats_path, alloc_path, elapsed, peak / 1024,
+        )
+
+
+def write_allocation_report(path: str, snapshot, top_n: int, peak: int, elapsed: float):
+    """Write the top_n allocation sites of a tracemalloc snapshot, grouped by line."""
+    import tracemalloc
+
+    snapshot = snapshot.filter_traces((
+        tracemalloc.Filter(False, tracemalloc.__file__),
+        tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+        tracemalloc.Filter(False, "<frozen importlib._bootstrap_external>"),
+        tracemalloc.Filter(False, "<unknown>"),
+    ))
+    stats = snapshot.statistics("lineno")
+    total = sum(stat.size for stat in stats)
+
+    with open(path, "w") as f:
+        f.write(f"elapsed: {elapsed:.3f}s\n")
+        f.write(f"peak traced memory: {peak / 1024:.1f} KiB\n")
+        f.write(f"live traced memory: {total / 1024:.1f} KiB\n\n")
+        f.write(f"Top {top_n} allocation sites:\n")
+        for index, stat in enumerate(stats[:top_n], 1):
+            frame = stat.traceback[0]
+            f.write(
+                f"#{index}: {frame.filename}:{frame.lineno}: "
+                f"{stat.size / 1024:.1f} KiB in {stat.count} blocks\n"
+            )
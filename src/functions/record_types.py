@@ -0,0 +1,130 @@
+from operator import attrgetter
+from typing import Any, Iterable, List, Mapping, NamedTuple, Optional, Sequence, Tuple
+
+# Compact, immutable record types for the loaders (tuples: no per-row __dict__).
+# Each record is parsed once from its JSON dict; `get` keeps the dict-style
+# access used by compute_row_hash, changed_columns and GroupedUpdates working.
+# Field order follows the INSERT column order, so a record with its key and
+# rowHash filled in is already an executemany parameter tuple.
+
+
+class User(NamedTuple):
+    """SPUSER_STAGING_P_USERS row, fields in USER_INSERT_COLUMNS order."""
+    userUuid: Optional[str] = None
+    userId: Optional[str] = None
+    firstName: Optional[str] = None
+    lastName: Optional[str] = None
+    displayName: Optional[str] = None
+    email: Optional[str] = None
+    phoneNumber: Optional[str] = None
+    country: Optional[str] = None
+    zip: Optional[str] = None
+    userName: Optional[str] = None
+    status: Optional[str] = None
+    userType: Optional[str] = None
+    mailVerified: Optional[bool] = None
+    phoneVerified: Optional[bool] = None
+    created: Optional[str] = None
+    lastModified: Optional[str] = None
+    modifiedBy: Optional[str] = None
+    rowHash: Optional[str] = None
+
+    @classmethod
+    def from_dict(cls, data: Mapping[str, Any]) -> "User":
+        return cls._make(map(data.get, cls._fields))
+
+    def get(self, field: str, default: Any = None) -> Any:
+        return getattr(self, field, default)
+
+
+class CompanyAccount(NamedTuple):
+    """SPUSER_STAGING_CRM_COMPANY_ACCOUNTS row, fields in INSERT column order."""
+    uuid: Optional[str] = None
+    accountId: Optional[int] = None
+    accountName: Optional[str] = None
+    crmToErpFlag: Optional[bool] = None
+    status: Optional[str] = None
+    rowHash: Optional[str] = None
+
+    @classmethod
+    def from_dict(cls, data: Mapping[str, Any]) -> "CompanyAccount":
+        return cls._make(map(data.get, cls._fields))
+
+    def get(self, field: str, default: Any = None) -> Any:
+        return getattr(self, field, default)
+
+
+class Contact(NamedTuple):
+    """SPUSER_STAGING_CRM_COMPANY_CONTACTS row, fields in INSERT column order."""
+    uuid: Optional[str] = None
+    contactId: Optional[int] = None
+    accountId: Optional[int] = None
+    accountName: Optional[str] = None
+    crmToErpFlag: Optional[bool] = None
+    firstName: Optional[str] = None
+    lastName: Optional[str] = None
+    email: Optional[str] = None
+    department: Optional[str] = None
+    country: Optional[str] = None
+    cshmeFlag: Optional[bool] = None
+    zipCode: Optional[str] = None
+    phoneNo: Optional[str] = None
+    status: Optional[str] = None
+    rowHash: Optional[str] = None
+
+    @classmethod
+    def from_dict(cls, data: Mapping[str, Any]) -> "Contact":
+        return cls._make(map(data.get, cls._fields))
+
+    def get(self, field: str, default: Any = None) -> Any:
+        return getattr(self, field, default)
+
+
+def parse_records(record_type, rows: Iterable[Any]) -> List[Any]:
+    """Convert JSON dicts to record_type once; records of that type pass through."""
+    return [row if isinstance(row, record_type) else record_type.from_dict(row) for row in rows]
+
+
+def param_tuples(rows: Sequence[Any], columns: Sequence[str]) -> List[Tuple[Any, ...]]:
+    """
+    Positional executemany parameters for columns.
+    Records whose fields are exactly `columns` are used as they are.
+    """
+    columns = tuple(columns)
+    if not rows:
+        return []
+    first = rows[0]
+    if getattr(first, "_fields", None) == columns:
+        return list(rows)
+    if hasattr(first, "_fields"):
+        getter = attrgetter(*columns)
+        if len(columns) == 1:
+            return [(getter(row),) for row in rows]
+        return [getter(row) for row in rows]
+    return [tuple(row.get(column) for column in columns) for row in rows]
+
+
+def positional_insert(connection, table: str, columns: Sequence[str]) -> str:
+    """INSERT statement with positional markers in the driver's paramstyle (for exec_driver_sql)."""
+    style = connection.dialect.paramstyle
+    if style == "qmark":
+        markers = ["?"] * len(columns)
+    elif style == "numeric":
+        markers = [f":{i}" for i in range(1, len(columns) + 1)]
+    elif style in ("format", "pyformat"):
+        markers = ["%s"] * len(columns)
+    else:
+        raise ValueError(f"Unsupported paramstyle for positional parameters: {style}")
+    return f"INSERT INTO {table} ({', '.join(columns)}) VALUES ({', '.join(markers)})"
+
+
+def insert_many(connection, table: str, columns: Sequence[str], rows: Sequence[Any]) -> int:
+    """
+    Insert rows (records or dicts) with one executemany of positional tuples,
+    bypassing the per-row named-parameter dicts of text().
+    Returns the number of rows sent.
+    """
+    if not rows:
+        return 0
+    connection.exec_driver_sql(positional_insert(connection, table, columns), param_tuples(rows, columns))
+    return len(rows)
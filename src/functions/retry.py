@@ -0,0 +1,160 @@
+import os
+import time
+import random
+import logging
+from typing import Callable, Optional, TypeVar
+from sqlalchemy.exc import DBAPIError
+
+logger = logging.getLogger(__name__)
+logging.basicConfig(level=logging.INFO)
+
+T = TypeVar("T")
+
+# HANA SQL error codes that are safe to retry (whole transaction is rolled back)
+TRANSIENT_HANA_ERROR_CODES = {
+    -10709,  # connection failed
+    -10807,  # connection lost / reset
+    -10108,  # session has been reconnected
+    131,     # transaction rolled back by lock wait timeout
+    133,     # transaction rolled back by detected deadlock
+    139,     # current operation cancelled by request and transaction rolled back
+    613,     # execution aborted by timeout
+}
+
+# Fallback markers for drivers without error codes (SQLite, wrapped errors)
+TRANSIENT_MESSAGES = (
+    "connection reset", "connection refused", "connection lost", "connection closed",
+    "broken pipe", "timed out", "timeout", "deadlock", "database is locked",
+    "database table is locked",
+)
+
+
+class CircuitOpenError(RuntimeError):
+    """Raised instead of calling the database while the circuit breaker is open."""
+
+
+def is_transient_error(error: BaseException) -> bool:
+    """
+    Classify an exception as transient (connection loss, deadlock, lock timeout).
+    Constraint violations and other SQL errors are not retried.
+    """
+    if isinstance(error, CircuitOpenError):
+        return False
+    if isinstance(error, DBAPIError) and error.connection_invalidated:
+        return True
+
+    original = getattr(error, "orig", None) or error
+    if isinstance(original, (ConnectionError, TimeoutError)):
+        return True
+
+    code = getattr(original, "errorcode", None)
+    if code in TRANSIENT_HANA_ERROR_CODES:
+        return True
+
+    message = str(original).lower()
+    return any(marker in message for marker in TRANSIENT_MESSAGES)
+
+
+class CircuitBreaker:
+    """
+    Consecutive-failure circuit breaker for the database.
+    After failure_threshold transient failures in a row the circuit opens and
+    calls fail fast with CircuitOpenError for reset_seconds; then one trial call
+    is let through (half-open), which closes the circuit again on success.
+    """
+
+    def __init__(self, failure_threshold: int = 5, reset_seconds: float = 30.0, clock=time.monotonic):
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self.clock = clock
+        self.failures = 0
+        self.opened_at: Optional[float] = None
+
+    @classmethod
+    def from_env(cls) -> "CircuitBreaker":
+        return cls(
+            failure_threshold=int(os.getenv("CIRCUIT_BREAKER_THRESHOLD", 5)),
+            reset_seconds=float(os.getenv("CIRCUIT_BREAKER_RESET_SECONDS", 30)),
+        )
+
+    @property
+    def is_open(self) -> bool:
+        return self.opened_at is not None and self.clock() - self.opened_at < self.reset_seconds
+
+    def before_call(self) -> None:
+        if self.is_open:
+            raise CircuitOpenError(
+                f"Database circuit open after {self.failures} consecutive transient failures"
+            )
+
+    def record_success(self) -> None:
+        self.failures = 0
+        self.opened_at = None
+
+    def record_failure(self) -> None:
+        self.failures += 1
+        if self.failures >= self.failure_threshold:
+            if not self.is_open:
+                logger.error("Opening database circuit after %d transient failures", self.failures)
+            self.opened_at = self.clock()
+
+
+class RetryPolicy:
+    """Exponential backoff with full jitter: sleep U(0, min(max_delay, base_delay * 2^(attempt-1)))."""
+
+    def __init__(self, attempts: int = 3, base_delay: float = 0.2, max_delay: float = 5.0):
+        self.attempts = max(1, attempts)
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+
+    @classmethod
+    def from_env(cls) -> "RetryPolicy":
+        return cls(
+            attempts=int(os.getenv("RETRY_ATTEMPTS", 3)),
+            base_delay=int(os.getenv("RETRY_BASE_DELAY_MS", 200)) / 1000.0,
+            max_delay=int(os.getenv("RETRY_MAX_DELAY_MS", 5000)) / 1000.0,
+        )
+
+    def delay(self, attempt: int) -> float:
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2 ** (attempt - 1)))
+
+
+# One breaker per process, shared by all loaders and the engine creation
+database_breaker = CircuitBreaker.from_env()
+
+
+def call_with_retry(
+    func: Callable[[], T],
+    description: str,
+    policy: Optional[RetryPolicy] = None,
+    breaker: Optional[CircuitBreaker] = None,
+    sleep: Callable[[float], None] = time.sleep,
+) -> T:
+    """
+    Run func (one chunk in its own transaction, or a connection attempt) and
+    retry it on transient errors with exponential backoff and jitter.
+    Non-transient errors and the last failed attempt are raised to the caller;
+    an open circuit raises CircuitOpenError without calling func.
+    """
+    policy = policy or RetryPolicy.from_env()
+    breaker = breaker or database_breaker
+
+    for attempt in range(1, policy.attempts + 1):
+        breaker.before_call()
+        try:
+            result = func()
+        except Exception as e:
+            if not is_transient_error(e):
+                raise
+            breaker.record_failure()
+            if attempt == policy.attempts or breaker.is_open:
+                raise
+            delay = policy.delay(attempt)
+            logger.warning(
+                "Transient error in %s (attempt %d/%d), retrying in %.2fs: %s",
+                description, attempt, policy.attempts, delay, e,
+            )
+            sleep(delay)
+            continue
+        breaker.record_success()
+        return result
@@ -0,0 +1,63 @@
+import hashlib
+import logging
+from typing import Any, Dict, Iterable, Mapping, Sequence
+from sqlalchemy import text
+from partial_update import normalize_value
+
+logger = logging.getLogger(__name__)
+logging.basicConfig(level=logging.INFO)
+
+FIELD_SEPARATOR = "\x1f"
+NULL_MARKER = "\x00"
+
+
+def compute_row_hash(record: Mapping[str, Any], fields: Sequence[str]) -> str:
+    """
+    SHA-256 fingerprint (64 hex chars) of a record's business fields, stored in rowHash.
+    Values are normalized like the column comparison ('' ≙ NULL, timestamps as ISO text,
+    booleans as 1/0), so DB rows and JSON records hash the same.
+    """
+    return hash_values(record.get(field) for field in fields)
+
+
+def hash_values(values: Iterable[Any]) -> str:
+    """compute_row_hash of a record's business field values, given in field order."""
+    parts = []
+    for value in values:
+        value = normalize_value(value)
+        if value is None:
+            parts.append(NULL_MARKER)
+        elif isinstance(value, bool):
+            parts.append("1" if value else "0")
+        else:
+            parts.append(str(value))
+    return hashlib.sha256(FIELD_SEPARATOR.join(parts).encode("utf-8")).hexdigest()
+
+
+def fetch_rows(
+    connection, table: str, key_column: str, keys: Iterable[Any], columns: Sequence[str]
+) -> Dict[Any, Mapping[str, Any]]:
+    """
+    Return {key: row mapping} with key_column + columns for the keys that exist in table,
+    using one IN-list query for the whole chunk.
+    """
+    keys = list(dict.fromkeys(keys))
+    if not keys:
+        return {}
+
+    placeholders = ", ".join(f":k_{i}" for i in range(len(keys)))
+    query = text(
+        f"SELECT {key_column}, {', '.join(columns)} FROM {table} "
+        f"WHERE {key_column} IN ({placeholders})"
+    )
+    params = {f"k_{i}": key for i, key in enumerate(keys)}
+
+    result = connection.execute(query, params)
+    return {row._mapping[key_column]: row._mapping for row in result.fetchall()}
+
+
+def fetch_row_hashes(
+    connection, table: str, key_column: str, keys: Iterable[Any], extra_columns: Sequence[str] = ()
+) -> Dict[Any, Mapping[str, Any]]:
+    """Return {key: row} with only the key, rowHash and extra_columns of existing rows."""
+    return fetch_rows(connection, table, key_column, keys, ("rowHash",) + tuple(extra_columns))
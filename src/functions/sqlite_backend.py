@@ -0,0 +1,181 @@
+import os
+import re
+import logging
+from typing import Dict, List, NamedTuple, Tuple
+from sqlalchemy import create_engine, event, text
+from sqlalchemy.pool import QueuePool
+from query_log import install_slow_query_log
+
+logger = logging.getLogger(__name__)
+logging.basicConfig(level=logging.INFO)
+
+DEFAULT_CDS_PATH = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), "..", "db", "schema.cds"
+)
+
+# CDS built-in type → SQLite column type
+CDS_TYPE_MAP = {
+    "UUID": "VARCHAR(36)",
+    "String": "VARCHAR",
+    "LargeString": "TEXT",
+    "Integer": "INTEGER",
+    "Int64": "BIGINT",
+    "Decimal": "DECIMAL",
+    "Boolean": "BOOLEAN",
+    "Date": "DATE",
+    "Timestamp": "TIMESTAMP",
+    "DateTime": "TIMESTAMP",
+}
+
+# Engines are cached per (path, schema): creating the schema on every call is wasteful
+_engines: Dict[Tuple[str, str], object] = {}
+
+
+class CdsColumn(NamedTuple):
+    name: str
+    sql_type: str
+    key: bool
+    unique: bool
+    not_null: bool
+
+
+def get_sqlite_client():
+    """
+    Return a SQLAlchemy engine for the local SQLite backend (DB_BACKEND=sqlite).
+    - SQLITE_PATH (default spuser_staging.sqlite) is attached as HANA_SCHEMA,
+      so the loaders' "{schema}.SPUSER_STAGING_*" names resolve unchanged.
+    - The tables are created from schema.cds (CDS_SCHEMA_PATH) on first use.
+    - Every checkout gets its own pooled connection (reset on return), so a
+      nested engine.begin() commits or rolls back only its own work, as on HANA.
+      SQLite has a single writer: concurrent writers wait up to busy_timeout
+      (SQLITE_BUSY_TIMEOUT_MS), WAL keeps readers from blocking on them.
+    """
+    schema = os.getenv("HANA_SCHEMA")
+    if not schema:
+        raise ValueError("Environment variable HANA_SCHEMA is not set.")
+    path = os.path.abspath(os.getenv("SQLITE_PATH", "spuser_staging.sqlite"))
+
+    cache_key = (path, schema)
+    if cache_key in _engines:
+        return _engines[cache_key]
+
+    logger.info("Initializing local SQLite backend: path=%s, schema=%s", path, schema)
+    engine = create_engine(
+        "sqlite://",
+        poolclass=QueuePool,
+        connect_args={"check_same_thread": False},
+    )
+
+    @event.listens_for(engine, "connect")
+    def _attach_and_tune(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        cursor.execute("ATTACH DATABASE ? AS " + schema, (path,))
+        for pragma in sqlite_pragmas(schema):
+            cursor.execute(pragma)
+        cursor.close()
+
+    install_slow_query_log(engine)
+    create_schema(engine, schema, os.getenv("CDS_SCHEMA_PATH", DEFAULT_CDS_PATH))
+    _engines[cache_key] = engine
+    return engine
+
+
+def sqlite_pragmas(schema: str) -> List[str]:
+    """WAL journal and tuned pragmas for bulk loading (overridable via env)."""
+    return [
+        f"PRAGMA {schema}.journal_mode = WAL",
+        f"PRAGMA {schema}.synchronous = {os.getenv('SQLITE_SYNCHRONOUS', 'NORMAL')}",
+        f"PRAGMA {schema}.cache_size = {int(os.getenv('SQLITE_CACHE_KB', 65536)) * -1}",
+        f"PRAGMA {schema}.mmap_size = {int(os.getenv('SQLITE_MMAP_BYTES', 268435456))}",
+        f"PRAGMA busy_timeout = {int(os.getenv('SQLITE_BUSY_TIMEOUT_MS', 30000))}",
+        "PRAGMA temp_store = MEMORY",
+    ]
+
+
+def create_schema(engine, schema: str, cds_path: str) -> None:
+    """Create all entities of the CDS model as tables (idempotent)."""
+    with open(cds_path, "r") as f:
+        namespace, entities = parse_cds(f.read())
+
+    with engine.begin() as connection:
+        for entity, columns in entities.items():
+            for statement in create_table_statements(schema, table_name(namespace, entity), columns):
+                connection.execute(text(statement))
+    logger.info("SQLite schema ready (%d tables from %s)", len(entities), cds_path)
+
+
+def table_name(namespace: str, entity: str) -> str:
+    """CDS namespace + entity → deployed table name (e.g. SPUSER_STAGING_P_USERS)."""
+    return f"{namespace.replace('.', '_')}_{entity}" if namespace else entity
+
+
+def create_table_statements(schema: str, table: str, columns: List[CdsColumn]) -> List[str]:
+    column_sql = [
+        f"{c.name} {c.sql_type}{' NOT NULL' if c.not_null else ''}" for c in columns
+    ]
+    keys = [c.name for c in columns if c.key]
+    if keys:
+        column_sql.append(f"PRIMARY KEY ({', '.join(keys)})")
+
+    statements = [
+        f"CREATE TABLE IF NOT EXISTS {schema}.{table} (\n    "
+        + ",\n    ".join(column_sql)
+        + "\n)"
+    ]
+    for c in columns:
+        if c.unique:
+            statements.append(
+                f"CREATE UNIQUE INDEX IF NOT EXISTS {schema}.UX_{table}_{c.name} "
+                f"ON {table} ({c.name})"
+            )
+    return statements
+
+
+def parse_cds(source: str) -> Tuple[str, Dict[str, List[CdsColumn]]]:
+    """
+    Minimal parser for the subset of CDS used in db/schema.cds:
+    namespace, enum/alias types, entities with key, not null and
+    @assert.unique. Associations and compositions are skipped.
+    """
+    # Drop comments and string literals (format regexes may contain ';' or '@')
+    source = re.sub(r"//[^\n]*|/\*.*?\*/", "", source, flags=re.S)
+    source = re.sub(r"'(?:[^']|'')*'", "''", source)
+
+    namespace_match = re.search(r"\bnamespace\s+([\w.]+)\s*;", source)
+    namespace = namespace_match.group(1) if namespace_match else ""
+
+    types = {}
+    for name, base, length in re.findall(
+        r"\btype\s+(\w+)\s*:\s*(\w+)\s*(?:\(\s*(\d+)\s*\))?", source
+    ):
+        types[name] = (base, length)
+
+    entities = {}
+    for entity, body in re.findall(r"\bentity\s+(\w+)\s*\{(.*?)\}", source, flags=re.S):
+        columns = []
+        for element in body.split(";"):
+            unique = "@assert.unique" in element
+            element = re.sub(r"@[\w.]+(?:\s*:\s*(?:''|[\w.]+))?", "", element).strip()
+            if not element or re.search(r"\b(Association|Composition)\b", element):
+                continue
+            match = re.match(
+                r"(key\s+)?(\w+)\s*:\s*(\w+)\s*(?:\(\s*([\d,\s]+)\s*\))?(.*)$", element, flags=re.S
+            )
+            if not match:
+                logger.warning("Unsupported CDS element in %s: %s", entity, element)
+                continue
+            is_key, name, cds_type, length, rest = match.groups()
+            if cds_type in types:
+                cds_type, length = types[cds_type]
+            sql_type = CDS_TYPE_MAP.get(cds_type, "VARCHAR")
+            if length and sql_type in ("VARCHAR", "DECIMAL"):
+                sql_type = f"{sql_type}({length.replace(' ', '')})"
+            columns.append(CdsColumn(
+                name=name,
+                sql_type=sql_type,
+                key=bool(is_key),
+                unique=unique,
+                not_null=bool(is_key) or "not null" in rest,
+            ))
+        entities[entity] = columns
+    return namespace, entities
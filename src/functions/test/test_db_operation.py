@@ -0,0 +1,131 @@
+import os
+import pytest
+from unittest.mock import MagicMock, patch
+from sqlalchemy import text
+import db_operation as db
+from db_connection import get_hana_client
+from deadline import Deadline
+from retry import CircuitBreaker
+
+
+@pytest.fixture
+def sqlite_env(tmp_path):
+    env = {
+        "DB_BACKEND": "sqlite",
+        "SQLITE_PATH": str(tmp_path / "local.sqlite"),
+        "HANA_SCHEMA": "TEST_SCHEMA",
+        "RETRY_BASE_DELAY_MS": "0",
+    }
+    with patch.dict(os.environ, env), patch("retry.database_breaker", CircuitBreaker()):
+        yield
+
+
+def user(user_id, **fields):
+    return {
+        "userId": user_id, "firstName": "Test", "lastName": user_id, "displayName": user_id,
+        "email": f"{user_id.lower()}@example.com", "userName": user_id.lower(),
+        "status": "active", "userType": "internal", "mailVerified": True, "phoneVerified": False,
+        **fields,
+    }
+
+
+def stored_users():
+    with get_hana_client().connect() as connection:
+        return {
+            row.userId: row for row in connection.execute(text(
+                "SELECT userId, email, lastName, rowHash FROM TEST_SCHEMA.SPUSER_STAGING_P_USERS"
+            ))
+        }
+
+
+def test_failed_chunk_is_retried_user_by_user(sqlite_env):
+    """Should retry a chunk failing on a constraint one user at a time, failing only the culprit."""
+    db.insert_or_update_users_bulk([user("P1", email="taken@example.com")])
+
+    result = db.insert_or_update_users_bulk([
+        user("P2"), user("P3", email="taken@example.com"), user("P4"),
+    ])
+
+    assert result["inserted"] == 2
+    assert [failure["user"]["userId"] for failure in result["failed"]] == ["P3"]
+    assert result["failed"][0]["error_class"] == "IntegrityError"
+    assert sorted(stored_users()) == ["P1", "P2", "P4"]
+
+
+def test_transient_chunk_failure_fails_chunk_without_user_retries():
+    """Should not retry user by user after the transient retries of a chunk are exhausted."""
+    with patch("db_operation.get_hana_client", return_value=MagicMock()), \
+         patch("db_operation.run_user_chunk", side_effect=ConnectionResetError("reset")) as mock_chunk, \
+         patch("retry.database_breaker", CircuitBreaker()), \
+         patch.dict(os.environ, {"HANA_SCHEMA": "TEST_SCHEMA", "RETRY_ATTEMPTS": "1"}):
+        result = db.insert_or_update_users_bulk([user("P1"), user("P2")])
+
+    assert mock_chunk.call_count == 1
+    assert result["inserted"] == 0
+    assert [failure["user"]["userId"] for failure in result["failed"]] == ["P1", "P2"]
+    assert {failure["error_class"] for failure in result["failed"]} == {"ConnectionResetError"}
+
+
+def test_deadline_stops_before_next_chunk(sqlite_env):
+    """Should stop after the first chunk and drop validation failures past the resume offset."""
+    users = [user("P1"), user("P2"), user("P3", mailVerified="maybe"), user("P4")]
+
+    with patch.dict(os.environ, {"USER_BATCH_SIZE": "1", "BATCH_ADAPTIVE": "0"}):
+        result = db.insert_or_update_users_bulk(users, deadline=Deadline(budget_seconds=5, reserve_seconds=10))
+
+    assert result == {"inserted": 1, "updated": 0, "unchanged": 0, "failed": [], "continue": True, "next_offset": 1}
+    assert sorted(stored_users()) == ["P1"]
+
+
+def test_deterministic_upsert_keeps_created_and_legacy_uuid(sqlite_env):
+    """Should upsert by userId without a lookup, updating only changed users and keeping created and userUuid."""
+    db.insert_or_update_users_bulk([user("P1", created="2020-01-01"), user("P2", created="2020-01-01")])
+    with get_hana_client().connect() as connection:
+        legacy_uuid = connection.execute(text(
+            "SELECT userUuid FROM TEST_SCHEMA.SPUSER_STAGING_P_USERS WHERE userId = 'P1'"
+        )).scalar()
+
+    with patch.dict(os.environ, {"DETERMINISTIC_KEYS": "1"}), \
+         patch("db_operation.fetch_row_hashes") as mock_lookup:
+        result = db.insert_or_update_users_bulk([
+            user("P1", lastName="Renamed", created="2024-06-01"),
+            user("P2", created="2024-06-01"),
+            user("P3", created="2024-06-01"),
+        ])
+
+    mock_lookup.assert_not_called()
+    assert {key: result[key] for key in ("upserted", "unchanged")} == {"upserted": 2, "unchanged": 1}
+    with get_hana_client().connect() as connection:
+        rows = {
+            row.userId: row for row in connection.execute(text(
+                "SELECT userId, userUuid, lastName, created FROM TEST_SCHEMA.SPUSER_STAGING_P_USERS"
+            ))
+        }
+    assert rows["P1"].userUuid == legacy_uuid and rows["P1"].lastName == "Renamed"
+    assert rows["P1"].created == rows["P2"].created == "2020-01-01"
+    assert rows["P3"].created == "2024-06-01"
+
+
+def test_initial_load_merges_through_staging_table(sqlite_env):
+    """Should insert, update and leave unchanged users via the staging MERGE, rejecting taken emails."""
+    db.insert_or_update_users_bulk([user("P1"), user("P2")])
+
+    result = db.initial_load_users([
+        user("P1", lastName="Renamed"),
+        user("P2"),
+        user("P3", lastName="First"),
+        user("P3", lastName="Last"),
+        user("P4", email="p1@example.com"),
+        user("P5", mailVerified="maybe"),
+    ])
+
+    assert {key: result[key] for key in ("inserted", "updated", "unchanged")} == {
+        "inserted": 1, "updated": 1, "unchanged": 1,
+    }
+    assert sorted((failure["user"]["userId"], failure["error"]) for failure in result["failed"]) == [
+        ("P4", "Duplicate email"), ("P5", "Invalid mailVerified: maybe"),
+    ]
+    stored = stored_users()
+    assert sorted(stored) == ["P1", "P2", "P3"]
+    assert stored["P1"].lastName == "Renamed" and stored["P3"].lastName == "Last"
+    assert stored["P3"].rowHash
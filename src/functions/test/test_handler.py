@@ -0,0 +1,106 @@
+import os
+import json
+import tempfile
+import unittest
+from unittest.mock import patch
+from sqlalchemy import text
+import handler
+from db_connection import get_hana_client
+from dead_letter import DeadLetterFile
+
+
+def user(user_id):
+    return {
+        "userId": user_id, "firstName": "Test", "lastName": user_id, "displayName": user_id,
+        "email": f"{user_id.lower()}@example.com", "userName": user_id.lower(),
+        "status": "active", "userType": "internal", "mailVerified": True, "phoneVerified": False,
+    }
+
+
+class TestHandler(unittest.TestCase):
+
+    def setUp(self):
+        # Local SQLite backend and private checkpoint / dead-letter files
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        env = patch.dict(os.environ, {
+            "DB_BACKEND": "sqlite",
+            "SQLITE_PATH": os.path.join(self.tmp_dir.name, "local.sqlite"),
+            "HANA_SCHEMA": "TEST_SCHEMA",
+            "CHECKPOINT_PATH": os.path.join(self.tmp_dir.name, "checkpoint.json"),
+            "DEAD_LETTER_PATH": os.path.join(self.tmp_dir.name, "dead_letters.ndjson"),
+        })
+        env.start()
+        self.addCleanup(env.stop)
+        self.addCleanup(self.tmp_dir.cleanup)
+
+    def loaded_user_ids(self):
+        with get_hana_client().connect() as connection:
+            return connection.execute(text(
+                "SELECT userId FROM TEST_SCHEMA.SPUSER_STAGING_P_USERS ORDER BY userId"
+            )).scalars().all()
+
+    def test_reprocess_attempts_every_dead_letter_under_a_deadline(self):
+        dead_letters = DeadLetterFile(os.environ["DEAD_LETTER_PATH"])
+        dead_letters.write("user", [
+            {"user": user(user_id), "error": "DB error"} for user_id in ("P100", "P101", "P102")
+        ])
+
+        env = {
+            "HANDLER_MODE": "reprocess",
+            "TIME_BUDGET_SECONDS": "5",
+            "USER_BATCH_SIZE": "1",
+            "BATCH_ADAPTIVE": "0",
+        }
+        with patch.dict(os.environ, env), patch("builtins.print"):
+            result = handler.main(event=None, context=None)
+
+        self.assertEqual(result, {"continue": False})
+        self.assertEqual(self.loaded_user_ids(), ["P100", "P101", "P102"])
+        self.assertFalse(os.path.exists(dead_letters.reprocessing_path))
+        self.assertFalse(os.path.exists(dead_letters.path))
+
+    def test_load_stops_at_deadline_and_resumes_from_checkpoint(self):
+        env = {
+            "TIME_BUDGET_SECONDS": "5",
+            "USER_BATCH_SIZE": "1",
+            "BATCH_ADAPTIVE": "0",
+        }
+        event = {"users": [user(user_id) for user_id in ("P100", "P101", "P102")]}
+        with patch.dict(os.environ, env), patch("builtins.print"):
+            first = handler.main(event=event, context=None)
+            self.assertEqual(first, {"continue": True, "checkpoint": {"stage": "user", "offset": 1}})
+            self.assertEqual(self.loaded_user_ids(), ["P100"])
+
+            second = handler.main(event={**event, "resume": first["checkpoint"]}, context=None)
+
+        self.assertEqual(second["checkpoint"], {"stage": "user", "offset": 2})
+        self.assertEqual(self.loaded_user_ids(), ["P100", "P101"])
+
+    def test_event_users_are_loaded_in_input_batches(self):
+        users = [user(user_id) for user_id in ("P100", "X100", "P101", "P102", "P103")]
+        event = {
+            "users": "".join(json.dumps(record) + "\n" for record in users),
+            "resume": {"stage": "user", "offset": 2},
+        }
+        with patch.dict(os.environ, {"INPUT_BATCH_SIZE": "2"}), patch("builtins.print") as mock_print:
+            result = handler.main(event=event, context=None)
+
+        self.assertEqual(result, {"continue": False})
+        self.assertEqual(self.loaded_user_ids(), ["P102", "P103"])
+        mock_print.assert_any_call("Skipped users (invalid userID): ['X100']")
+
+    def test_event_mode_overrides_handler_mode(self):
+        dead_letters = DeadLetterFile(os.environ["DEAD_LETTER_PATH"])
+        dead_letters.write("user", [{"user": user("P200"), "error": "DB error"}])
+
+        self.assertEqual(handler.get_handler_mode({"mode": "Queue"}), "queue")
+        with patch.dict(os.environ, {"HANDLER_MODE": "load"}), patch("builtins.print"):
+            self.assertEqual(handler.get_handler_mode(None), "load")
+            result = handler.main(event={"mode": "reprocess"}, context=None)
+
+        self.assertEqual(result, {"continue": False})
+        self.assertEqual(self.loaded_user_ids(), ["P200"])
+
+
+if __name__ == "__main__":
+    unittest.main()
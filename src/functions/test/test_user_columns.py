@@ -0,0 +1,75 @@
+import json
+import os
+from db_operation import USER_INSERT_COLUMNS, USER_UPDATE_COLUMNS
+from record_types import User
+from row_hash import compute_row_hash
+from user_columns import InvalidValue, UserColumns, as_user_columns, coerce_bool
+
+DATA_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "data.json")
+
+
+def user(user_id, **fields):
+    return {
+        "userId": user_id, "firstName": "Test", "lastName": user_id, "email": f"{user_id}@example.com",
+        "status": "active", "userType": "internal", "mailVerified": True, "phoneVerified": False,
+        "lastModified": "", **fields,
+    }
+
+
+def test_coerce_bool_accepts_boolean_forms_only():
+    """Should map JSON and text booleans, keep empty values as None and mark anything else invalid."""
+    assert [coerce_bool(value) for value in (True, False, "true", " FALSE ", "1", "0", 1, 0)] == [
+        True, False, True, False, True, False, True, False,
+    ]
+    assert coerce_bool(None) is None and coerce_bool("") is None
+    for value in ("never", "yes", 2):
+        assert isinstance(coerce_bool(value), InvalidValue)
+
+
+def test_validate_rejects_non_boolean_flags_and_missing_ids():
+    """Should fail rows with InvalidValue flags or without userId and keep the others."""
+    users = UserColumns.from_records([
+        user("P1"),
+        user("P2", mailVerified="mail will not be verified"),
+        user("P3", phoneVerified="never", mailVerified="maybe"),
+        user(None),
+        user("P5", mailVerified="true", phoneVerified=None),
+    ])
+
+    valid, failed = users.validate()
+
+    assert valid.column("userId") == ["P1", "P5"]
+    assert valid.column("mailVerified") == [True, True]
+    assert [(failure["user"]["userId"], failure["error"]) for failure in failed] == [
+        ("P2", "Invalid mailVerified: mail will not be verified"),
+        ("P3", "Invalid mailVerified: maybe"),
+        (None, "Missing userId"),
+    ]
+
+
+def test_row_hashes_match_the_dict_path():
+    """Should produce the same rowHash as compute_row_hash over the parsed records."""
+    with open(DATA_PATH, "rb") as f:
+        records = json.load(f)
+    users, _ = UserColumns.from_records(records).validate()
+
+    expected = [compute_row_hash(User.from_dict(record), USER_UPDATE_COLUMNS) for record in users.records()]
+
+    assert users.row_hashes(USER_UPDATE_COLUMNS) == expected
+    assert users.row_hashes(USER_UPDATE_COLUMNS)[0] == compute_row_hash(
+        next(record for record in records if record["userId"] == users.column("userId")[0]),
+        USER_UPDATE_COLUMNS,
+    )
+
+
+def test_param_rows_follow_the_column_order():
+    """Should zip positional executemany rows in the requested column order."""
+    users = as_user_columns([user("P1"), user("P2", status="inactive")])
+
+    assert users.param_rows(("userId", "status", "mailVerified")) == [
+        ("P1", "active", True), ("P2", "inactive", True),
+    ]
+    rows = users.param_rows(USER_INSERT_COLUMNS)
+    assert len(rows[0]) == len(USER_INSERT_COLUMNS)
+    assert users.records()[1] == User._make(rows[1])
+    assert users[1:].param_rows(("userId",)) == [("P2",)]
@@ -0,0 +1,109 @@
+import sys
+from itertools import compress
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+from record_types import User
+from row_hash import hash_values
+
+# Low-cardinality text columns: values are interned so a batch holds one string per value
+ENUM_COLUMNS = ("status", "userType")
+
+# Columns coerced to bool (JSON true/false, "true"/"false", 1/0; '' and null stay None)
+BOOLEAN_COLUMNS = ("mailVerified", "phoneVerified")
+
+BOOLEAN_VALUES = {True: True, False: False, "true": True, "false": False, "1": True, "0": False}
+
+
+class InvalidValue(str):
+    """Marks a value that could not be coerced to its column type (rejected by validate)."""
+
+
+class UserColumns:
+    """
+    Columnar batch of P_USERS records: one list per User field instead of one
+    object per user. The P-prefix filter, validation, rowHash and executemany
+    parameters work column by column; records() converts back to User rows
+    for the per-row update paths.
+    """
+
+    def __init__(self, columns: Dict[str, List[Any]]):
+        self.columns = columns
+
+    @classmethod
+    def from_records(cls, records: Iterable[Any]) -> "UserColumns":
+        """Parse JSON dicts (or User records) into columns, interning enums and coercing booleans."""
+        records = list(records)
+        columns = {field: [record.get(field) for record in records] for field in User._fields}
+        for field in ENUM_COLUMNS:
+            columns[field] = [sys.intern(value) if type(value) is str else value for value in columns[field]]
+        for field in BOOLEAN_COLUMNS:
+            columns[field] = [coerce_bool(value) for value in columns[field]]
+        return cls(columns)
+
+    def __len__(self) -> int:
+        return len(self.columns["userId"])
+
+    def __getitem__(self, key: slice) -> "UserColumns":
+        return UserColumns({field: values[key] for field, values in self.columns.items()})
+
+    def column(self, field: str) -> List[Any]:
+        return self.columns[field]
+
+    def compress(self, mask: Sequence[bool]) -> "UserColumns":
+        """Rows where mask is true."""
+        return UserColumns({field: list(compress(values, mask)) for field, values in self.columns.items()})
+
+    def with_columns(self, **columns: List[Any]) -> "UserColumns":
+        return UserColumns({**self.columns, **columns})
+
+    def p_prefix_mask(self) -> List[bool]:
+        """True for users whose userId starts with 'P' (handler input filter)."""
+        return [str(user_id if user_id is not None else "").startswith("P") for user_id in self.columns["userId"]]
+
+    def validation_errors(self) -> List[Optional[str]]:
+        """Error per row (None for valid rows): missing userId or a non-boolean verified flag."""
+        errors: List[Optional[str]] = [None] * len(self)
+        for field in BOOLEAN_COLUMNS:
+            for i in [i for i, value in enumerate(self.columns[field]) if type(value) is InvalidValue]:
+                errors[i] = errors[i] or f"Invalid {field}: {self.columns[field][i]}"
+        for i in [i for i, user_id in enumerate(self.columns["userId"]) if not user_id]:
+            errors[i] = "Missing userId"
+        return errors
+
+    def validate(
+        self, errors: Optional[List[Optional[str]]] = None
+    ) -> Tuple["UserColumns", List[Dict[str, Any]]]:
+        """Split the batch into valid rows and failures ({"user", "error"}, see validation_errors)."""
+        errors = self.validation_errors() if errors is None else errors
+        if not any(errors):
+            return self, []
+        records = self.records()
+        failed = [
+            {"user": records[i]._asdict(), "error": error}
+            for i, error in enumerate(errors) if error
+        ]
+        return self.compress([error is None for error in errors]), failed
+
+    def row_hashes(self, fields: Sequence[str]) -> List[str]:
+        """rowHash of every row over fields (same value as compute_row_hash)."""
+        return [hash_values(values) for values in zip(*(self.columns[field] for field in fields))]
+
+    def param_rows(self, fields: Sequence[str]) -> List[Tuple[Any, ...]]:
+        """Positional executemany parameters for fields, built from the columns."""
+        return list(zip(*(self.columns[field] for field in fields)))
+
+    def records(self) -> List[User]:
+        return [User._make(row) for row in self.param_rows(User._fields)]
+
+
+def as_user_columns(users: Any) -> UserColumns:
+    """Users as a columnar batch (UserColumns pass through)."""
+    return users if isinstance(users, UserColumns) else UserColumns.from_records(users)
+
+
+def coerce_bool(value: Any) -> Any:
+    if value is None or value == "":
+        return None
+    if type(value) is str:
+        value = value.strip().lower()
+    coerced = BOOLEAN_VALUES.get(value)
+    return coerced if coerced is not None else InvalidValue(value)
@@ -0,0 +1,380 @@
+import os
+import time
+import socket
+import sqlite3
+import logging
+import importlib
+from typing import Any, Callable, Dict, Iterable, List, NamedTuple, Optional, Set, Tuple
+from batching import batched
+from dead_letter import DeadLetterFile, spill_failures
+import json_codec
+
+logger = logging.getLogger(__name__)
+logging.basicConfig(level=logging.INFO)
+
+PENDING, CLAIMED, DONE, DEAD = "pending", "claimed", "done", "dead"
+
+QUEUE_SCHEMA = """
+    CREATE TABLE IF NOT EXISTS batches (
+        id          INTEGER PRIMARY KEY AUTOINCREMENT,
+        stage       INTEGER NOT NULL,           -- batches of a stage run after all earlier stages
+        operation   TEXT NOT NULL,              -- "module:function" applied to the records
+        name        TEXT,                       -- dead-letter stage of the records, e.g. "company"
+        key_field   TEXT,                       -- record field tying later stages to failures, e.g. "accountId"
+        payload     TEXT NOT NULL,              -- JSON array of records
+        status      TEXT NOT NULL DEFAULT 'pending',
+        attempts    INTEGER NOT NULL DEFAULT 0,
+        claimed_by  TEXT,
+        claimed_at  REAL,
+        result      TEXT,                       -- JSON summary returned by the operation
+        error       TEXT,
+        created_at  REAL NOT NULL
+    )
+"""
+
+
+# Columns added to QUEUE_SCHEMA after its first version (added to existing queue files)
+ADDED_COLUMNS = ("name", "key_field")
+
+
+class Batch(NamedTuple):
+    id: int
+    operation: str
+    records: List[Dict[str, Any]]
+    attempts: int
+    stage: int = 0
+    name: Optional[str] = None
+    key_field: Optional[str] = None
+
+
+class StageInput(NamedTuple):
+    """Records of one stage for produce_and_drain (plain (operation, records) tuples work too)."""
+    operation: str                   # "module:function" applied to each batch
+    records: Iterable[Any]           # read as a stream by WorkQueue.enqueue
+    name: Optional[str] = None       # dead-letter stage of the records (default: operation)
+    key_field: Optional[str] = None  # e.g. "accountId": later records of a failed key are deferred
+
+
+class WorkQueue:
+    """
+    Durable local batch queue in a SQLite file (QUEUE_PATH), shared by the
+    producer and the worker processes.
+    - claim() atomically hands the oldest pending batch of the earliest
+      unfinished stage to one worker (BEGIN IMMEDIATE, one writer at a time).
+    - ack() marks it done; fail() puts it back for another attempt or, after
+      max_attempts, dead-letters it with the error.
+    - Claims older than visibility_timeout (a crashed worker) become pending again.
+    - failed_keys() collects the keys of records that failed in earlier stages,
+      so the workers defer the records of later stages tied to them.
+    """
+
+    def __init__(self, path: str, max_attempts: int = 3, visibility_timeout: float = 300.0):
+        self.path = os.path.abspath(path)
+        self.max_attempts = max(1, max_attempts)
+        self.visibility_timeout = visibility_timeout
+        self.connection = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute(QUEUE_SCHEMA)
+        columns = {row[1] for row in self.connection.execute("PRAGMA table_info(batches)")}
+        for column in ADDED_COLUMNS:
+            if column not in columns:
+                self.connection.execute(f"ALTER TABLE batches ADD COLUMN {column} TEXT")
+
+    @classmethod
+    def from_env(cls, default_path: str) -> "WorkQueue":
+        return cls(
+            os.getenv("QUEUE_PATH", default_path),
+            max_attempts=int(os.getenv("QUEUE_MAX_ATTEMPTS", 3)),
+            visibility_timeout=float(os.getenv("QUEUE_VISIBILITY_TIMEOUT", 300)),
+        )
+
+    def close(self) -> None:
+        self.connection.close()
+
+    def enqueue(
+        self,
+        operation: str,
+        records: Iterable[Any],
+        batch_size: int,
+        stage: int = 0,
+        name: Optional[str] = None,
+        key_field: Optional[str] = None,
+    ) -> int:
+        """
+        Split records (any iterable, read as a stream) into batches of batch_size
+        for operation. Returns the number of batches.
+        """
+        now = time.time()
+        counts = [0, 0]  # batches, records
+
+        def rows():
+            for batch in batched(records, batch_size):
+                counts[0] += 1
+                counts[1] += len(batch)
+                yield stage, operation, name, key_field, json_codec.dumps(batch), now
+
+        with self.connection:
+            self.connection.execute("BEGIN IMMEDIATE")
+            self.connection.executemany(
+                "INSERT INTO batches (stage, operation, name, key_field, payload, created_at) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                rows(),
+            )
+        logger.info("Queued %d batch(es) of %d record(s) for %s", counts[0], counts[1], operation)
+        return counts[0]
+
+    def claim(self, worker: str) -> Optional[Batch]:
+        """Claim the next runnable batch for worker, or None if there is none right now."""
+        now = time.time()
+        with self.connection:
+            self.connection.execute("BEGIN IMMEDIATE")
+            self.connection.execute(
+                "UPDATE batches SET status = ?, claimed_by = NULL WHERE status = ? AND claimed_at < ?",
+                (PENDING, CLAIMED, now - self.visibility_timeout),
+            )
+            row = self.connection.execute(
+                """
+                SELECT id, operation, payload, attempts, stage, name, key_field FROM batches
+                WHERE status = ?
+                  AND stage = (SELECT MIN(stage) FROM batches WHERE status IN (?, ?))
+                ORDER BY id LIMIT 1
+                """,
+                (PENDING, PENDING, CLAIMED),
+            ).fetchone()
+            if row is None:
+                return None
+            batch_id, operation, payload, attempts, stage, name, key_field = row
+            self.connection.execute(
+                "UPDATE batches SET status = ?, claimed_by = ?, claimed_at = ?, attempts = ? WHERE id = ?",
+                (CLAIMED, worker, now, attempts + 1, batch_id),
+            )
+        return Batch(batch_id, operation, json_codec.loads(payload), attempts + 1, stage, name, key_field)
+
+    def ack(self, batch: Batch, result: Any) -> None:
+        self.connection.execute(
+            "UPDATE batches SET status = ?, result = ?, error = NULL WHERE id = ?",
+            (DONE, json_codec.dumps(result), batch.id),
+        )
+
+    def fail(self, batch: Batch, error: BaseException) -> str:
+        """Release batch after an error: pending again, or dead after max_attempts. Returns the new status."""
+        status = DEAD if batch.attempts >= self.max_attempts else PENDING
+        self.connection.execute(
+            "UPDATE batches SET status = ?, claimed_by = NULL, error = ? WHERE id = ?",
+            (status, f"{type(error).__name__}: {error}", batch.id),
+        )
+        return status
+
+    def failed_keys(self, before_stage: int) -> Optional[Set[Any]]:
+        """
+        Keys of the records that failed in the stages before before_stage: the
+        "failed_keys" of done batches plus the key_field values of dead batches.
+        None if a failure cannot be tied to a key (no later record is safe then).
+        """
+        keys: Set[Any] = set()
+        rows = self.connection.execute(
+            """
+            SELECT status, key_field, CASE WHEN status = ? THEN payload END, result FROM batches
+            WHERE stage < ? AND status IN (?, ?)
+            """,
+            (DEAD, before_stage, DONE, DEAD),
+        )
+        for status, key_field, payload, result in rows:
+            if status == DEAD:
+                if not key_field:
+                    return None
+                keys.update(record.get(key_field) for record in json_codec.loads(payload))
+                continue
+            result = json_codec.loads(result) if result else None
+            if not isinstance(result, dict) or not result.get("failed"):
+                continue
+            if result.get("failed_keys") is None:
+                return None
+            keys.update(result["failed_keys"])
+        keys.discard(None)
+        return keys
+
+    def clear_finished(self) -> None:
+        """Drop done and dead batches of earlier, completed runs."""
+        self.connection.execute("DELETE FROM batches WHERE status IN (?, ?)", (DONE, DEAD))
+
+    def unfinished(self) -> int:
+        """Number of pending or claimed batches."""
+        return self.connection.execute(
+            "SELECT COUNT(*) FROM batches WHERE status IN (?, ?)", (PENDING, CLAIMED)
+        ).fetchone()[0]
+
+    def summary(self) -> Dict[str, Any]:
+        """Batch counts per status plus the summed operation results of the done batches."""
+        summary: Dict[str, Any] = dict.fromkeys((PENDING, CLAIMED, DONE, DEAD), 0)
+        summary.update(self.connection.execute("SELECT status, COUNT(*) FROM batches GROUP BY status").fetchall())
+
+        totals: Dict[str, int] = {}
+        for (result,) in self.connection.execute("SELECT result FROM batches WHERE status = ?", (DONE,)):
+            for key, value in (json_codec.loads(result) or {}).items():
+                if key.endswith(("_sample", "_keys")):
+                    continue
+                count = len(value) if isinstance(value, list) else value
+                if isinstance(count, int):
+                    totals[key] = totals.get(key, 0) + count
+        summary["records"] = totals
+        summary["dead_letters"] = [
+            {"batch": batch_id, "operation": operation, "error": error}
+            for batch_id, operation, error in self.connection.execute(
+                "SELECT id, operation, error FROM batches WHERE status = ? ORDER BY id", (DEAD,)
+            )
+        ]
+        return summary
+
+
+def resolve_operation(operation: str) -> Callable[[List[Dict[str, Any]]], Any]:
+    """Import the "module:function" named by a batch (e.g. "db_operation_company:insert_or_update_company")."""
+    module_name, _, function_name = operation.partition(":")
+    return getattr(importlib.import_module(module_name), function_name)
+
+
+def defer_records(
+    records: List[Dict[str, Any]], name: str, key_field: str, failed_keys: Optional[Set[Any]]
+) -> Tuple[List[Dict[str, Any]], List[Dict[str, Any]]]:
+    """
+    Split the records of a batch into the ones to load and the ones deferred
+    because their key_field failed in an earlier stage (all of them if
+    failed_keys is None), reported as {name: record, "error", "error_class"}.
+    """
+    if failed_keys is not None and not failed_keys:
+        return records, []
+    ready, deferred = [], []
+    for record in records:
+        if failed_keys is None or record.get(key_field) in failed_keys:
+            deferred.append({
+                name: record,
+                "error": f"Deferred: {key_field} {record.get(key_field)} failed in an earlier stage",
+                "error_class": "Deferred",
+            })
+        else:
+            ready.append(record)
+    return ready, deferred
+
+
+def run_worker(
+    queue: WorkQueue, worker: str, poll_seconds: float = 0.2, dead_letters: Optional[DeadLetterFile] = None
+) -> int:
+    """
+    Claim and process batches until the queue has no unfinished batches left.
+    Waits (polls) while other workers still hold batches of the current stage.
+    - Records of a later stage whose key_field failed in an earlier stage (a
+      failed record or a dead batch) are deferred instead of loaded.
+    - With dead_letters, the operation gets it and writes its failed records
+      there; deferred records and the records of dead batches are written too,
+      and the acked result only keeps counts (see spill_failures).
+    Returns the number of batches processed by this worker.
+    """
+    processed = 0
+    failed_keys: Dict[int, Optional[Set[Any]]] = {}  # per stage; earlier stages are finished
+    options = {"dead_letters": dead_letters} if dead_letters is not None else {}
+    while True:
+        batch = queue.claim(worker)
+        if batch is None:
+            if not queue.unfinished():
+                return processed
+            time.sleep(poll_seconds)
+            continue
+
+        name = batch.name or batch.operation
+        records, deferred = batch.records, []
+        if batch.stage and batch.key_field:
+            if batch.stage not in failed_keys:
+                failed_keys[batch.stage] = queue.failed_keys(batch.stage)
+            records, deferred = defer_records(records, name, batch.key_field, failed_keys[batch.stage])
+
+        try:
+            result = resolve_operation(batch.operation)(records, **options) if records else {}
+        except Exception as e:
+            status = queue.fail(batch, e)
+            logger.exception("Batch %d (%s) failed on attempt %d → %s: %s",
+                             batch.id, batch.operation, batch.attempts, status, e)
+            if status == DEAD and dead_letters is not None:
+                dead_letters.write(name, [
+                    {name: record, "error": str(e), "error_class": type(e).__name__}
+                    for record in batch.records
+                ])
+        else:
+            if deferred:
+                logger.info("Deferred %d record(s) of batch %d", len(deferred), batch.id)
+                result = {**result, "deferred": deferred}
+            if dead_letters is not None:
+                result = spill_failures(result, name, dead_letters, keys=("failed", "deferred"))
+            queue.ack(batch, result)
+        processed += 1
+
+
+def _worker_process(
+    path: str, max_attempts: int, visibility_timeout: float, index: int, dead_letter_path: Optional[str] = None
+) -> None:
+    queue = WorkQueue(path, max_attempts, visibility_timeout)
+    dead_letters = DeadLetterFile(dead_letter_path) if dead_letter_path else None
+    try:
+        processed = run_worker(queue, f"{socket.gethostname()}:{os.getpid()}:{index}", dead_letters=dead_letters)
+        logger.info("Worker %d processed %d batch(es)", index, processed)
+    finally:
+        queue.close()
+
+
+def run_worker_pool(
+    queue: WorkQueue, processes: Optional[int] = None, dead_letters: Optional[DeadLetterFile] = None
+) -> Dict[str, Any]:
+    """
+    Drain queue with a pool of worker processes (WORKER_PROCESSES, default: CPU count).
+    Workers are spawned, not forked, so they open their own DB engines and queue
+    connections. processes=1 runs the worker in this process.
+    Returns queue.summary().
+    """
+    if processes is None:
+        processes = int(os.getenv("WORKER_PROCESSES", os.cpu_count() or 1))
+    processes = max(1, processes)
+
+    if processes == 1:
+        run_worker(queue, f"{socket.gethostname()}:{os.getpid()}:0", dead_letters=dead_letters)
+        return queue.summary()
+
+    import multiprocessing  # only needed by the pool, kept off the cold-start import path
+
+    context = multiprocessing.get_context("spawn")
+    workers = [
+        context.Process(
+            target=_worker_process,
+            args=(
+                queue.path, queue.max_attempts, queue.visibility_timeout, index,
+                dead_letters.path if dead_letters is not None else None,
+            ),
+        )
+        for index in range(processes)
+    ]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    return queue.summary()
+
+
+def produce_and_drain(
+    queue: WorkQueue,
+    inputs: Iterable[tuple],
+    batch_size: int,
+    processes: Optional[int] = None,
+    dead_letters: Optional[DeadLetterFile] = None,
+) -> Dict[str, Any]:
+    """
+    Queue mode of the handlers: enqueue inputs (a StageInput per stage, in order)
+    and run the worker pool, which writes failed and deferred records to
+    dead_letters. If the queue still has unfinished batches from an interrupted
+    run, those are resumed instead of enqueueing the input again.
+    """
+    if queue.unfinished():
+        logger.info("Resuming %d unfinished batch(es) from %s", queue.unfinished(), queue.path)
+    else:
+        queue.clear_finished()
+        for stage, item in enumerate(inputs):
+            item = StageInput(*item)
+            queue.enqueue(item.operation, item.records, batch_size, stage, item.name, item.key_field)
+    return run_worker_pool(queue, processes, dead_letters)